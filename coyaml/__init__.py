@@ -0,0 +1,42 @@
+
+__version__ = '0.3.13'
+
+def _make_asts(input, name, targetname, loader):
+    from . import cgen, hgen, core, load, textast
+    cfg = core.Config(name, targetname)
+    if loader is None:
+        load.load(input, cfg)
+    else:
+        load.load(input, cfg, Loader=loader)
+    with textast.Ast() as hast:
+        hgen.GenHCode(cfg).make(hast)
+    with textast.Ast() as cast:
+        cgen.GenCCode(cfg).make(cast)
+    return hast, cast
+
+def generate(input, name='config', targetname='config', loader=None):
+    """Generates C header and source for schema read from ``input``
+
+    Schema is loaded once and both generators work on the same
+    ``core.Config``. Returns ``(header, source)`` tuple of strings.
+    ``targetname`` is the basename of generated files, it's used for
+    include guards and to include header from the source. ``loader``
+    overrides yaml loader class (libyaml-based one is used when available).
+    """
+    from .util import gc_paused
+    with gc_paused():
+        hast, cast = _make_asts(input, name, targetname, loader)
+        return str(hast), str(cast)
+
+def generate_to(input, header, source,
+        name='config', targetname='config', loader=None):
+    """Same as ``generate`` but writes code to text file objects
+
+    Code is streamed to ``header`` and ``source`` by chunks, so
+    generated text is never kept in memory as a whole.
+    """
+    from .util import gc_paused
+    with gc_paused():
+        hast, cast = _make_asts(input, name, targetname, loader)
+        hast.write_to(header)
+        cast.write_to(source)
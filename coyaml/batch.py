@@ -0,0 +1,75 @@
+import os.path
+import time
+import traceback
+from collections import namedtuple
+
+from .cache import GenCache, default_cache_dir, generate_files
+
+
+Job = namedtuple('Job', 'src header source name targetname')
+Result = namedtuple('Result', 'job generated elapsed error')
+
+
+def parse_job(arg, default_name='config', output_dir=None):
+    """Makes a ``Job`` from command-line argument ``schema.yaml[:name]``
+
+    Generated files are placed next to the schema, or into ``output_dir``
+    if it's specified. Target name is the basename of the schema.
+    """
+    src, sep, name = arg.rpartition(':')
+    if not sep or not name.isidentifier() or not src:
+        src, name = arg, default_name
+    base = os.path.splitext(src)[0]
+    if output_dir is not None:
+        base = os.path.join(output_dir, os.path.basename(base))
+    header, source = base + '.h', base + '.c'
+    if os.path.abspath(src) in (os.path.abspath(header),
+                                os.path.abspath(source)):
+        raise ValueError("Schema {0!r} would be overwritten".format(src))
+    targetname = os.path.splitext(os.path.basename(src))[0]
+    return Job(src, header, source, name, targetname)
+
+
+def run_job(job, cache_dir=None, use_cache=True):
+    """Generates files for a single job, never raises
+
+    Is executed in worker processes, so all arguments are picklable.
+    Cache is used only if ``cache_dir`` is given or ``$COYAML_CACHE_DIR``
+    is set.
+    """
+    start = time.time()
+    try:
+        cache_dir = cache_dir or default_cache_dir()
+        cache = GenCache(cache_dir) if use_cache and cache_dir else None
+        generated = generate_files(job.src, job.header, job.source,
+            job.name, job.targetname, cache=cache)
+    except Exception as e:
+        return Result(job, False, time.time() - start,
+            ''.join(traceback.format_exception_only(type(e), e)).strip())
+    return Result(job, generated, time.time() - start, None)
+
+
+def run(jobs, processes=1, cache_dir=None, use_cache=True):
+    """Runs ``jobs`` and yields ``Result``'s in order of completion
+
+    With ``processes`` greater than one jobs are spread over a process
+    pool. Failure of a job doesn't stop others, it's only reported in
+    the ``error`` field of the result.
+    """
+    outputs = {}
+    for job in jobs:
+        for path in (job.header, job.source):
+            other = outputs.setdefault(os.path.abspath(path), job)
+            if other is not job:
+                raise ValueError("Both {0!r} and {1!r} generate {2!r}"
+                    .format(other.src, job.src, path))
+    if processes <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield run_job(job, cache_dir, use_cache)
+        return
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(min(processes, len(jobs))) as pool:
+        futures = [pool.submit(run_job, job, cache_dir, use_cache)
+                   for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,295 @@
+"""Benchmarks of the code generator
+
+Run as ``python -m coyaml.bench``. By default synthesizes a schema (see
+``synthetic_schema`` for the knobs), runs every phase of generation
+separately and prints timings and peak memory as JSON, suitable for
+tracking regressions between releases.
+"""
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from . import cgen, hgen, core, load, textast
+from . import __version__
+from .util import gc_paused
+
+
+PHASES = ('load', 'hgen', 'cgen', 'render_header', 'render_source')
+
+_kinds = (
+    ('Int', '0'),
+    ('String', '"value"'),
+    ('UInt', '1'),
+    ('Float', '0.5'),
+    ('Bool', 'no'),
+    )
+
+
+def synthetic_schema(options=1000, depth=2, fanout=10, usertypes=0,
+        arrays=0, mappings=0, cmdline=0):
+    """Returns text of a synthetic schema
+
+    :param options: total number of options, including struct, array and
+        mapping fields
+    :param depth: nesting depth of groups, options are placed into leaf
+        groups of ``fanout`` options each
+    :param usertypes: number of usertypes, each is used as a type of
+        single ``!Struct`` option
+    :param arrays: number of ``!Array`` options
+    :param mappings: number of ``!Mapping`` options
+    :param cmdline: number of scalar options with command-line switches
+    """
+    assert depth >= 1 and fanout >= 1
+    assert usertypes + arrays + mappings <= options
+    lines = ["__meta__:",
+             "  program-name: bench",
+             "  default-config: /dev/null",
+             "  description: Synthetic benchmark configuration",
+             ""]
+    if usertypes:
+        lines.append("__types__:")
+        for i in range(usertypes):
+            lines.append("  type{0:05d}:".format(i))
+            lines.append("    host: !String localhost")
+            lines.append("    port: !Int 80")
+            lines.append("    weight: !Float 1.0")
+        lines.append("")
+    path = ()
+    for i in range(options):
+        group = i // fanout
+        newpath = tuple(group // fanout ** (depth - 1 - level)
+                        for level in range(depth))
+        common = 0
+        while common < len(path) and path[common] == newpath[common]:
+            common += 1
+        for level in range(common, depth):
+            lines.append("  " * level + "group{0}_{1:06d}:".format(
+                level, newpath[level]))
+        path = newpath
+        indent = "  " * depth
+        name = "key{0:06d}".format(i)
+        if i < usertypes:
+            lines.append(indent + "{0}: !Struct type{1:05d}".format(name, i))
+            continue
+        i -= usertypes
+        if i < arrays:
+            lines.append(indent + name + ": !Array")
+            if usertypes and i % 2:
+                lines.append(indent + "  element: !Struct type{0:05d}"
+                    .format(i % usertypes))
+            else:
+                lines.append(indent + "  element: !Int 0")
+            continue
+        i -= arrays
+        if i < mappings:
+            lines.append(indent + name + ": !Mapping")
+            lines.append(indent + "  key-element: !String \"\"")
+            lines.append(indent + "  value-element: !Int 0")
+            continue
+        i -= mappings
+        kind, default = _kinds[i % len(_kinds)]
+        if i < cmdline:
+            lines.append(indent + "{0}: !{1}".format(name, kind))
+            lines.append(indent + "  =: " + default)
+            lines.append(indent + "  command-line: --" + name)
+            lines.append(indent + "  description: Option " + name)
+        else:
+            lines.append(indent + "{0}: !{1} {2}".format(name, kind, default))
+    return '\n'.join(lines) + '\n'
+
+
+def _run_phases(schema, name, measure):
+    cfg = core.Config(name, 'bench')
+    with measure('load'):
+        load.load(schema, cfg)
+    with textast.Ast() as hast:
+        with measure('hgen'):
+            hgen.GenHCode(cfg).make(hast)
+    with textast.Ast() as cast:
+        with measure('cgen'):
+            cgen.GenCCode(cfg).make(cast)
+    with measure('render_header'):
+        header = str(hast)
+    with measure('render_source'):
+        source = str(cast)
+    return len(header.encode('utf-8')), len(source.encode('utf-8'))
+
+
+class _Timer(object):
+
+    def __init__(self):
+        self.times = {}
+
+    def __call__(self, phase):
+        self.phase = phase
+        return self
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.times[self.phase] = time.perf_counter() - self.start
+
+
+class _MemoryTracer(object):
+
+    def __init__(self):
+        self.peaks = {}
+
+    def __call__(self, phase):
+        self.phase = phase
+        return self
+
+    def __enter__(self):
+        if hasattr(tracemalloc, 'reset_peak'):  # python 3.9+
+            tracemalloc.reset_peak()
+        self.before = tracemalloc.get_traced_memory()
+
+    def __exit__(self, *exc):
+        current, peak = tracemalloc.get_traced_memory()
+        if peak <= self.before[1] and peak > self.before[0]:
+            # Peak wasn't reset and the phase didn't exceed it, so only
+            # memory at phase boundaries is known
+            peak = max(self.before[0], current)
+        self.peaks[self.phase] = peak
+
+
+def run(schema, name='cfg', repeat=3, memory=True):
+    """Runs generator phases on ``schema`` text and returns results dict
+
+    Time of each phase is the best of ``repeat`` runs. Peak memory is
+    measured with ``tracemalloc`` in a separate run, as tracing slows
+    down everything considerably. It is the peak of memory allocated by
+    python during the phase, including objects left by previous phases.
+    Before python 3.9 peak can't be reset, so a phase not exceeding peaks
+    of previous ones gets memory at its start or end instead.
+    """
+    best = {}
+    for i in range(repeat):
+        timer = _Timer()
+        with gc_paused():
+            sizes = _run_phases(schema, name, timer)
+        for phase, value in timer.times.items():
+            best[phase] = min(value, best.get(phase, value))
+    result = {
+        'coyaml_version': __version__,
+        'python': platform.python_version(),
+        'schema_bytes': len(schema),
+        'header_bytes': sizes[0],
+        'source_bytes': sizes[1],
+        'time': dict((phase, best[phase]) for phase in PHASES),
+        'total_time': sum(best.values()),
+        }
+    if memory:
+        tracer = _MemoryTracer()
+        tracemalloc.start()
+        try:
+            with gc_paused():
+                _run_phases(schema, name, tracer)
+        finally:
+            tracemalloc.stop()
+        result['peak_memory'] = dict(
+            (phase, tracer.peaks[phase]) for phase in PHASES)
+    return result
+
+
+def check_scaling(sizes=(1000, 10000, 100000), tolerance=2.0, log=print):
+    """Checks that generation time grows roughly linearly with schema size
+
+    Generates code for ``synthetic_schema`` of each size. Returns False if
+    time per option for any size is more than ``tolerance`` times larger
+    than for the smallest one.
+    """
+    from . import generate
+    generate(synthetic_schema(sizes[0]), 'cfg', 'bench')  # warm up
+    base = None
+    ok = True
+    for size in sizes:
+        schema = synthetic_schema(size)
+        start = time.perf_counter()
+        generate(schema, 'cfg', 'bench')
+        per_option = (time.perf_counter() - start) / size
+        if base is None:
+            base = per_option
+        ratio = per_option / base
+        log("{0:7d} options: {1:.1f}us per option (x{2:.2f})".format(
+            size, per_option * 1e6, ratio))
+        if ratio > tolerance:
+            ok = False
+    return ok
+
+
+def main():
+    from optparse import OptionParser
+    op = OptionParser(usage="\n    %prog [options]")
+    op.add_option('-s', '--schema', metavar="FILENAME",
+        help="Benchmark real schema instead of synthetic one",
+        dest="schema", default=None, type="string")
+    op.add_option('-n', '--options', metavar="NUM",
+        help="Number of options in synthetic schema (default 10000)",
+        dest="options", default=10000, type="int")
+    op.add_option('-d', '--depth', metavar="NUM",
+        help="Nesting depth of groups (default 2)",
+        dest="depth", default=2, type="int")
+    op.add_option('-f', '--fanout', metavar="NUM",
+        help="Number of options in a group and groups in a parent group"
+            " (default 10)",
+        dest="fanout", default=10, type="int")
+    op.add_option('-u', '--usertypes', metavar="NUM",
+        help="Number of usertypes (default 0)",
+        dest="usertypes", default=0, type="int")
+    op.add_option('-a', '--arrays', metavar="NUM",
+        help="Number of !Array options (default 0)",
+        dest="arrays", default=0, type="int")
+    op.add_option('-m', '--mappings', metavar="NUM",
+        help="Number of !Mapping options (default 0)",
+        dest="mappings", default=0, type="int")
+    op.add_option('-c', '--command-line', metavar="NUM",
+        help="Number of options with command-line switches (default 0)",
+        dest="cmdline", default=0, type="int")
+    op.add_option('-r', '--repeat', metavar="NUM",
+        help="Number of repetitions, best time is reported (default 3)",
+        dest="repeat", default=3, type="int")
+    op.add_option('--no-memory',
+        help="Don't measure peak memory (it's slow)",
+        dest="memory", default=True, action="store_false")
+    op.add_option('-o', '--output', metavar="FILENAME",
+        help="Write JSON results to file instead of stdout",
+        dest="output", default=None, type="string")
+    op.add_option('--scaling',
+        help="Check that generation time is linear in number of options",
+        dest="scaling", default=False, action="store_true")
+    options, args = op.parse_args()
+    if args:
+        op.error("No arguments expected")
+    if options.scaling:
+        if not check_scaling():
+            sys.exit("Generation time grows faster than number of options")
+        return
+    if options.schema:
+        with open(options.schema, 'rb') as f:
+            schema = f.read()
+        params = {'schema': options.schema}
+    else:
+        params = dict(options=options.options, depth=options.depth,
+            fanout=options.fanout, usertypes=options.usertypes,
+            arrays=options.arrays, mappings=options.mappings,
+            cmdline=options.cmdline)
+        try:
+            schema = synthetic_schema(**params)
+        except AssertionError:
+            op.error("Inconsistent schema parameters")
+    result = run(schema, repeat=options.repeat, memory=options.memory)
+    result['params'] = params
+    if options.output:
+        with open(options.output, 'wt') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write('\n')
+    else:
+        json.dump(result, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
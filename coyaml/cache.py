@@ -0,0 +1,145 @@
+import hashlib
+import os.path
+import shutil
+
+from . import generate_to
+
+_generator_hash = None
+
+
+def default_cache_dir():
+    """Returns ``$COYAML_CACHE_DIR`` or None, caching is opt-in"""
+    return os.environ.get('COYAML_CACHE_DIR') or None
+
+def generator_hash():
+    """Returns hash of source of the coyaml package
+
+    ``__version__`` is only bumped on release, while generated code changes
+    with any change of the generator. Hash is computed once, so it reflects
+    the code loaded by this process even if files are changed later.
+    """
+    global _generator_hash
+    if _generator_hash is None:
+        digest = hashlib.sha1()
+        package = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(package)):
+            if name.endswith('.py'):
+                digest.update(name.encode('utf-8') + b'\0')
+                with open(os.path.join(package, name), 'rb') as f:
+                    digest.update(f.read())
+        _generator_hash = digest.hexdigest()
+    return _generator_hash
+
+def _tmpname(filename):
+    return '{0}.{1}.tmp'.format(filename, os.getpid())
+
+def _same_content(filename1, filename2, chunk_size=1 << 16):
+    try:
+        with open(filename1, 'rb') as f1, open(filename2, 'rb') as f2:
+            if os.fstat(f1.fileno()).st_size != os.fstat(f2.fileno()).st_size:
+                return False
+            while True:
+                chunk = f1.read(chunk_size)
+                if chunk != f2.read(chunk_size):
+                    return False
+                if not chunk:
+                    return True
+    except OSError:
+        return False
+
+def replace_if_changed(tmpname, filename):
+    """Renames ``tmpname`` to ``filename`` unless they have same content
+
+    Keeps mtime of unchanged files intact, so that build tools don't
+    rebuild everything that includes generated header. ``tmpname`` is
+    removed in any case. Returns True if file was replaced.
+    """
+    if _same_content(tmpname, filename):
+        os.unlink(tmpname)
+        return False
+    os.replace(tmpname, filename)
+    return True
+
+def copy_if_changed(source, filename):
+    if _same_content(source, filename):
+        return False
+    tmp = _tmpname(filename)
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, filename)
+    return True
+
+
+class GenCache(object):
+    """Cache of generated code keyed by the schema content
+
+    Key consists of schema bytes, config name, target name (it's used in
+    include guards) and hash of the generator itself.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, schema, name, targetname):
+        digest = hashlib.sha1()
+        for part in (generator_hash(), name, targetname):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(schema)
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        return (os.path.join(self.directory, key + '.h'),
+                os.path.join(self.directory, key + '.c'))
+
+    def get(self, key):
+        """Returns paths of cached header and source or None"""
+        paths = self._paths(key)
+        if all(os.path.exists(path) for path in paths):
+            return paths
+        return None
+
+    def put(self, key, header, source):
+        """Copies generated ``header`` and ``source`` files into cache"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for path, filename in zip(self._paths(key), (header, source)):
+                tmp = _tmpname(path)
+                shutil.copyfile(filename, tmp)
+                os.replace(tmp, path)
+        except OSError:
+            pass  # cache is optional
+
+
+def generate_files(src, header, source,
+        name='config', targetname='config', cache=None):
+    """Generates ``header`` and ``source`` files for schema file ``src``
+
+    Generation is skipped when ``cache`` has an entry for this schema,
+    and output files are only touched if their content changes. Code is
+    streamed to temporary files, so it's never kept in memory as a whole.
+    ``targetname`` has same meaning as for ``generate``. Returns True if
+    code was actually generated.
+    """
+    with open(src, 'rb') as f:
+        schema = f.read()
+    if cache is not None:
+        key = cache.key(schema, name, targetname)
+        cached = cache.get(key)
+        if cached is not None:
+            copy_if_changed(cached[0], header)
+            copy_if_changed(cached[1], source)
+            return False
+    htmp, ctmp = _tmpname(header), _tmpname(source)
+    try:
+        with open(htmp, 'wt', encoding='utf-8') as hfile, \
+             open(ctmp, 'wt', encoding='utf-8') as cfile:
+            generate_to(schema, hfile, cfile, name, targetname)
+        if cache is not None:
+            cache.put(key, htmp, ctmp)
+        replace_if_changed(htmp, header)
+        replace_if_changed(ctmp, source)
+    finally:
+        for tmp in (htmp, ctmp):
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+    return True
@@ -1,9 +1,10 @@
 import textwrap
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 from . import load, core
 from .util import builtin_conversions, parse_int, parse_float, nested
-from .cutil import varname, string, typename, cbool
+from .cutil import varname, string, typename, cbool, contiguous
+from .cutil import schema_hash, snapshots_supported
 from .cast import *
 
 cmdline_template = """\
@@ -49,6 +50,13 @@ def mem2dotname(mem):
     else:
         raise NotImplementedError(mem)
 
+def offset_of(struct, member):
+    # Member is None for elements of contiguous arrays, which are stored
+    # directly rather than in the field of a list node
+    if member is None:
+        return Int(0)
+    return Call('offsetof', [ struct.a_name, mem2dotname(member) ])
+
 def bitmask(*args):
     res = 0
     for i, v in enumerate(args):
@@ -97,6 +105,20 @@ class GenCCode(object):
     def __init__(self, cfg):
         self.cfg = cfg
         self.prefix = cfg.name
+        # Generator state is kept here rather than on the option objects,
+        # so that same config may be used for several generators
+        self.props = {}
+
+    def _set_prop(self, item, kind):
+        self.props[id(item)] = ('coyaml_'+kind,
+            Ref(Subscript(Ident(self.prefix+'_'+kind+'_vars'),
+                Int(len(self.states[kind].content)-1))))
+
+    def _prop_func(self, item):
+        return self.props[id(item)][0]
+
+    def _prop_ref(self, item):
+        return self.props[id(item)][1]
 
     def _vars(self, ast, decl=False):
         items = ('group', 'string', 'file', 'dir', 'int', 'uint', 'float',
@@ -116,22 +138,25 @@ class GenCCode(object):
             return self.states.values()
 
     def _clear_unused_vars(self, transitions, vars):
-        to_remove = set()
-        for name, zone in self.states.items():
-            if not zone.content:
-                to_remove.add('_{}_'.format(name))
-        for item in transitions.content[:]:
-            if isinstance(item, Var):
-                for name in to_remove:
-                    if name in item.name.value:
-                        transitions.content.remove(item)
-                        break
-        for item in vars.content[:]:
-            if isinstance(item, Var):
-                for name in to_remove:
-                    if name in item.name.value:
-                        vars.content.remove(item)
-                        break
+        to_remove = set(self.prefix+'_'+name+'_vars'
+            for name, zone in self.states.items() if not zone.content)
+        if not to_remove:
+            return
+        for zone in (transitions, vars):
+            zone.content[:] = [item for item in zone.content
+                if not isinstance(item, Var)
+                or item.name.value not in to_remove]
+
+    def _make_index(self, ast, name, symbols):
+        # Positions of symbols sorted the same way as strcmp() does it,
+        # so runtime can find keys with binary search
+        if not symbols:
+            return NULL
+        order = sorted(range(len(symbols)),
+            key=lambda i: symbols[i].encode('utf-8'))
+        ast(VarAssign('int', name, Arr(list(map(Int, order))),
+            static=True, array=(None,)))
+        return Ident(name)
 
     def _next_default_fun(self):
         self.default_fun_no += 1
@@ -139,6 +164,8 @@ class GenCCode(object):
 
     def make(self, ast):
         self.default_fun_no = 0
+        self.schema_hash = schema_hash(self.cfg)
+        self.finders = OrderedDict()
         ast(CommentBlock(
             'THIS IS AUTOGENERATED FILE',
             'DO NOT EDIT!!!',
@@ -165,6 +192,7 @@ class GenCCode(object):
 
         self.make_options(cli)
         self.make_environ(vars)
+        self.make_finders(ast)
 
         mainstr = Typename(self.prefix+'_main_t')
         mainptr = Typename(self.prefix+'_main_t *')
@@ -204,6 +232,11 @@ class GenCCode(object):
                 if_(Return(NULL))
             ctx(Statement(Assign(Member(_ctx, 'program_name'),
                 String(self.cfg.meta.program_name))))
+            ctx(Statement(Assign(Member(_ctx, 'schema_hash'),
+                Int(self.schema_hash))))
+            if snapshots_supported(self.cfg):
+                ctx(Statement(Assign(Member(_ctx, 'target_size'),
+                    Call('sizeof', [ mainstr ]))))
 
             fn = Member(_ctx, 'root_filename')
             if hasattr(self.cfg.meta, 'environ_filename'):
@@ -227,18 +260,68 @@ class GenCCode(object):
 
         with ast(Function(Void(), self.prefix+'_free', [
             Param(mainptr, Ident('ptr')) ], ast.block())) as free:
-            free(Statement(Call('obstack_free', [
-                Ref(Dot(Member(Ident('ptr'), 'head'), 'pieces')),
-                Ident('NULL') ])))
-            with free(If(Dot(Member(Ident('ptr'), 'head'), 'free_object'),
-                ast.block())) as if_:
-                if_(Statement(Call('free', [ Ident('ptr') ])))
+            free(Statement(Call('coyaml_config_free', [ Ident('ptr') ])))
 
         with ast(Function(Typename('bool'), self.prefix+'_readfile', [
             Param('coyaml_context_t *', 'ctx'),
             ], ast.block())) as fun:
             fun(Return(Call('coyaml_readfile', [Ident('ctx')] )))
 
+        with ast(Function(mainptr, self.prefix+'_load_r', [
+            Param(mainptr, 'ptr'),
+            Param('int', 'argc'), Param('char**', 'argv'),
+            Param('coyaml_error_t *', 'err'),
+            ], ast.block())) as fun:
+            fun(Var('coyaml_context_t', 'ctx'))
+            _context = Call(self.prefix+'_context', [
+                Ref(Ident('ctx')), Ident('ptr') ])
+            with fun(If(Lt(Call('coyaml_load', [ _context,
+                Ident('argc'), Ident('argv'), Ident('err') ]), Int(0)),
+                fun.block())) as if_:
+                if_(Return(NULL))
+            fun(Return(Coerce(mainptr, Dot(Ident('ctx'), Ident('target')))))
+
+        with ast(Function(Typename('int'), self.prefix+'_load_async', [
+            Param(mainptr, 'ptr'),
+            Param('int', 'argc'), Param('char**', 'argv'),
+            Param('coyaml_load_fun', 'callback'),
+            Param('void *', 'userdata'),
+            ], ast.block())) as fun:
+            fun(Return(Call('coyaml_load_async', [
+                Call(self.prefix+'_context', [ NULL, Ident('ptr') ]),
+                Ident('argc'), Ident('argv'),
+                Ident('callback'), Ident('userdata') ])))
+
+        with ast(Function(Typename('int'), self.prefix+'_reload', [
+            Param('coyaml_holder_t *', 'holder'),
+            Param('int', 'argc'), Param('char**', 'argv'),
+            ], ast.block())) as fun:
+            fun(VarAssign('coyaml_context_t *', 'ctx',
+                Call(self.prefix+'_context', [ NULL, NULL ])))
+            with fun(If(Not(Ident('ctx')), ast.block())) as if_:
+                if_(Return(Int(-1)))
+            fun(Return(Call('coyaml_reload', [ Ident('holder'), Ident('ctx'),
+                Ident('argc'), Ident('argv') ])))
+
+        with ast(Function(mainptr, self.prefix+'_acquire', [
+            Param('coyaml_holder_t *', 'holder'),
+            ], ast.block())) as fun:
+            fun(Return(Coerce(mainptr,
+                Call('coyaml_acquire', [ Ident('holder') ]))))
+
+        with ast(Function(Void(), self.prefix+'_release', [
+            Param(mainptr, 'ptr'),
+            ], ast.block())) as fun:
+            fun(Statement(Call('coyaml_release', [ Ident('ptr') ])))
+
+        for name in ('snapshot_save', 'snapshot_load'):
+            with ast(Function(Typename('int'), self.prefix+'_'+name, [
+                Param('coyaml_context_t *', 'ctx'),
+                Param('const char *', 'filename'),
+                ], ast.block())) as fun:
+                fun(Return(Call('coyaml_'+name,
+                    [Ident('ctx'), Ident('filename')])))
+
         errcheck = If(Or(
             Gt(Ident('errno'), Ident('ECOYAML_MAX')),
             Lt(Ident('errno'), Ident('ECOYAML_MIN'))), ast.block())
@@ -270,15 +353,17 @@ class GenCCode(object):
         optval = 1000
         visited = set()
         targets = []
+        options = {}
+        optindex = {}
         for opt in self.cfg.commandline:
-            if not hasattr(opt.target, 'options'):
-                opt.target.options = defaultdict(list)
+            if id(opt.target) not in options:
+                options[id(opt.target)] = defaultdict(list)
                 targets.append(opt.target)
-            opt.target.options[opt.__class__].append(opt)
+            options[id(opt.target)][opt.__class__].append(opt)
             key = id(opt.target), opt.__class__
             if key in visited:
                 continue
-            opt.index = optval
+            optindex[id(opt)] = optval
             optval += 1
         ast(Func('int', self.prefix+'_print', [
                 Param('FILE *', 'out'),
@@ -321,24 +406,25 @@ class GenCCode(object):
                         optstr += ':'
                         optidx.append(-1)
                 if opt.name:
-                    cmd(StrValue(name=String(opt.name), val=Int(opt.index),
+                    cmd(StrValue(name=String(opt.name), val=Int(optindex[id(opt)]),
                         flag='NULL',
                         has_arg='TRUE' if has_arg else 'FALSE'))
                 if isinstance(opt, core.IncrOption):
-                    opt_fun = opt.target.prop_func + '_incr_o'
+                    opt_fun = self._prop_func(opt.target) + '_incr_o'
                 elif isinstance(opt, core.DecrOption):
-                    opt_fun = opt.target.prop_func + '_decr_o'
+                    opt_fun = self._prop_func(opt.target) + '_decr_o'
                 elif isinstance(opt, core.EnableOption):
-                    opt_fun = opt.target.prop_func + '_enable_o'
+                    opt_fun = self._prop_func(opt.target) + '_enable_o'
                 elif isinstance(opt, core.DisableOption):
-                    opt_fun = opt.target.prop_func + '_disable_o'
+                    opt_fun = self._prop_func(opt.target) + '_disable_o'
                 elif isinstance(opt, core.Option):
-                    opt_fun = opt.target.prop_func+'_o'
+                    opt_fun = self._prop_func(opt.target)+'_o'
                 else:
                     raise NotImplementedError(opt)
                 copt(StrValue(
                     callback=Coerce('coyaml_option_fun', opt_fun),
-                    prop=Coerce('coyaml_placeholder_t *', opt.target.prop_ref),
+                    prop=Coerce('coyaml_placeholder_t *',
+                        self._prop_ref(opt.target)),
                     ))
             cmd(StrValue(name=NULL, val=Int(0), flag='NULL', has_arg='FALSE')),
         ast(VarAssign('int', self.prefix+'_optidx',
@@ -349,10 +435,11 @@ class GenCCode(object):
                 core.IncrOption, core.DecrOption,
                 core.EnableOption, core.DisableOption,
                 ):
-                opt = ', '.join(o.param for o in target.options[typ])
+                topts = options[id(target)]
+                opt = ', '.join(o.param for o in topts[typ])
                 if not opt:
                     continue
-                if typ != core.Option and target.options[core.Option]:
+                if typ != core.Option and topts[core.Option]:
                     if typ == core.IncrOption:
                         description = 'Increment aformentioned value'
                     elif typ == core.DecrOption:
@@ -393,12 +480,26 @@ class GenCCode(object):
                     Ref(self.prefix+'_print')),
             )))
 
+    def make_finders(self, ast):
+        for tname in self.finders:
+            eltyp = Typename(tname+'_t *')
+            with ast(Function(eltyp, tname+'_find', [
+                Param(Typename('coyaml_mapindex_t *'), 'index'),
+                Param(Typename('const char *'), 'key'),
+                Param(Typename('size_t'), 'keylen'),
+                ], ast.block())) as fun:
+                fun(Return(Coerce(eltyp, Call('coyaml_mapping_find', [
+                    Ident('index'), Ident('key'), Ident('keylen') ]))))
+            ast(VSpace())
+
     def make_environ(self, ast):
         ast(VarAssign('coyaml_env_var_t', self.prefix+'_env_vars', Arr([
             StrValue(
                 name=String(ev.name),
-                prop=Coerce('coyaml_placeholder_t *', ev.target.prop_ref),
-                callback=Coerce('coyaml_option_fun', ev.target.prop_func+'_o'),
+                prop=Coerce('coyaml_placeholder_t *',
+                    self._prop_ref(ev.target)),
+                callback=Coerce('coyaml_option_fun',
+                    self._prop_func(ev.target)+'_o'),
             ) for ev in self.cfg.environ]
             + [StrValue(name=NULL)]),
             array=(None,)))
@@ -413,6 +514,7 @@ class GenCCode(object):
         ast(VSpace())
         tranname = Ident('transitions_{0}'.format(self.lasttran))
         self.lasttran += 1
+        symbols = []
         with ast.zone('transitions')(VarAssign('coyaml_transition_t', tranname,
                 Arr(ast.block()),
                 static=True, array=(None,))) as tran:
@@ -421,14 +523,18 @@ class GenCCode(object):
                     Member('cfg', varname(k)), root=ast)
                 tran(StrValue(
                     symbol=String(k),
-                    prop=Coerce('coyaml_placeholder_t *', v.prop_ref),
+                    prop=Coerce('coyaml_placeholder_t *', self._prop_ref(v)),
                     ))
+                symbols.append(k)
             tran(StrValue(symbol=Ident('NULL'),
                 prop=Ident('NULL')))
             self.states['group'](StrValue(
                 type=Ref(Ident('coyaml_group_type')),
                 baseoffset=Int(0),
                 transitions=tranname,
+                transition_index=self._make_index(ast.zone('transitions'),
+                    tranname.value + '_index', symbols),
+                transition_count=Int(len(symbols)),
                 ))
         with ast(Function('int', self.prefix+'_print', [
                 Param('FILE *', 'out'),
@@ -492,11 +598,11 @@ class GenCCode(object):
                     Ref(mem) ])))
             else:
                 utype = self.cfg.types[item.type]
-                item.default_fun = '{0}_defaults_{1}_{2}'.format(
+                default_fun = '{0}_defaults_{1}_{2}'.format(
                     self.prefix, item.type, self._next_default_fun())
-                self._mk_defaultsfun(item.default_fun, utype, ast=root,
+                self._mk_defaultsfun(default_fun, utype, ast=root,
                     defaults=item.default_)
-                ast(Statement(Call(item.default_fun, [ Ref(mem) ])))
+                ast(Statement(Call(default_fun, [ Ref(mem) ])))
 
     def _visit_usertype(self, name, root, index):
         utype = self.cfg.types[name]
@@ -504,6 +610,7 @@ class GenCCode(object):
             inheritance=bool(utype.inheritance))
         tranname = Ident('transitions_{0}'.format(self.lasttran))
         self.lasttran += 1
+        symbols = []
         with root.zone('transitions')(VarAssign('coyaml_transition_t',
                 tranname, Arr(root.block()),
                 static=True, array=(None,))) as tran:
@@ -515,14 +622,18 @@ class GenCCode(object):
                 tran(StrValue(
                     symbol=String(k),
                     prop=Coerce('coyaml_placeholder_t *',
-                        v.prop_ref),
+                        self._prop_ref(v)),
                     ))
+                symbols.append(k)
             tran(StrValue(symbol=Ident('NULL'),
                 prop=Ident('NULL')))
         self.states['group'](StrValue(
             type=Ref(Ident('coyaml_group_type')),
             baseoffset=Int(0),
             transitions=tranname,
+            transition_index=self._make_index(root.zone('transitions'),
+                tranname.value + '_index', symbols),
+            transition_count=Int(len(symbols)),
             ))
         uzone = root.zone('usertypes')
         if hasattr(utype, 'tags'):
@@ -532,9 +643,12 @@ class GenCCode(object):
                 for k, v in utype.tags.items() ]
                 + [ StrValue(tagname=NULL, tagvalue=Int(0)) ]),
                 static=True, array=(None,)))
+            tagindex = self._make_index(uzone, tagvar + '_index',
+                ['!'+k for k in utype.tags])
             default_tag = getattr(utype, 'defaulttag', -1)
         else:
             tagvar = 'NULL'
+            tagindex = NULL
             default_tag = -1
 
         defname = self.prefix+'_defaults_'+name
@@ -560,6 +674,9 @@ class GenCCode(object):
                 group=Ref(Subscript(Ident(self.prefix+'_group_vars'),
                     Int(len(self.states['group'].content)-1))),
                 tags=Ident(tagvar),
+                tag_index=tagindex,
+                tag_count=Int(len(utype.tags))
+                    if hasattr(utype, 'tags') else Int(0),
                 default_tag=Int(default_tag),
                 scalar_fun=Coerce('coyaml_convert_fun', conv_fun)
                     if conv_fun else NULL,
@@ -569,6 +686,7 @@ class GenCCode(object):
         if isinstance(item, dict):
             tranname = Ident('transitions_{0}'.format(self.lasttran))
             self.lasttran += 1
+            symbols = []
             with root.zone('transitions')(VarAssign('coyaml_transition_t',
                 tranname, Arr(root.block()),
                 static=True, array=(None,))) as tran:
@@ -578,47 +696,41 @@ class GenCCode(object):
                     if k.startswith('_'): continue
                     tran(StrValue(
                         symbol=String(k),
-                        prop=Coerce('coyaml_placeholder_t *', v.prop_ref),
+                        prop=Coerce('coyaml_placeholder_t *',
+                            self._prop_ref(v)),
                         ))
+                    symbols.append(k)
                 tran(StrValue(symbol=Ident('NULL'),
                     prop=Ident('NULL')))
             self.states['group'](StrValue(
                 type=Ref(Ident('coyaml_group_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(mem) ]),
+                baseoffset=offset_of(struct, mem),
                 transitions=tranname,
+                transition_index=self._make_index(root.zone('transitions'),
+                    tranname.value + '_index', symbols),
+                transition_count=Int(len(symbols)),
                 ))
-            item.prop_func = 'coyaml_group'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_group_vars'),
-                Int(len(self.states['group'].content)-1)))
+            self._set_prop(item, 'group')
         elif item.__class__ in scalar_types or item.__class__ in string_types:
-            item.struct_name = struct.name
-            item.member_path = mem
             if not name.startswith('_'):
                 self.mkstate(item, struct, mem)
         elif isinstance(item, load.Bool):
-            item.struct_name = struct.name
-            item.member_path = mem
             if not name.startswith('_'):
                 self.mkstate(item, struct, mem)
         elif isinstance(item, load.Struct):
-            item.struct_name = struct.name
-            item.member_path = mem
             self.states['custom'](StrValue(
                 type=Ref(Ident('coyaml_custom_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(mem) ]),
+                baseoffset=offset_of(struct, mem),
                 flagoffset=Int(struct.nextflag()),
                 usertype=Ref(Ident(self.prefix+'_'+item.type+'_def')),
                 ))
-            item.prop_func = 'coyaml_custom'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_custom_vars'),
-                Int(len(self.states['custom'].content)-1)))
+            self._set_prop(item, 'custom')
         elif isinstance(item, load.Mapping):
-            item.struct_name = struct.name
-            item.member_path = mem
-            mstr = MappingEl(self.prefix+'_m_'+typename(item.key_element)
-                    +'_'+typename(item.value_element)+'_t')
+            tname = (self.prefix+'_m_'+typename(item.key_element)
+                +'_'+typename(item.value_element))
+            mstr = MappingEl(tname+'_t')
+            if item.key_element.__class__ in string_types:
+                self.finders[tname] = True
             self.mkstate(item.key_element, mstr,
                 Member(Ident('item'), Ident('key')))
             if not isinstance(item.key_element, load.Struct) \
@@ -632,8 +744,7 @@ class GenCCode(object):
                 raise NotImplementedError(item.key_element)
             self.states['mapping'](StrValue(
                 type=Ref(Ident('coyaml_mapping_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(mem) ]),
+                baseoffset=offset_of(struct, mem),
                 flagoffset=Int(struct.nextflag())
                     if hasattr(struct, 'nextflag') else Int(0),
                 inheritance=Ident("COYAML_INH_NO")
@@ -641,48 +752,52 @@ class GenCCode(object):
                     "COYAML_INH_" + item.inheritance.upper().replace('-', '_'),
                 element_size=Call('sizeof', [ Typename(mstr.name) ]),
                 key_prop=Coerce('coyaml_placeholder_t *',
-                    item.key_element.prop_ref),
+                    self._prop_ref(item.key_element)),
                 key_defaults=Coerce('coyaml_defaults_fun',
                     self.prefix+'_defaults_'+item.key_element.type)
                     if isinstance(item.key_element, load.Struct) else NULL,
                 value_prop=Coerce('coyaml_placeholder_t *',
-                    item.value_element.prop_ref),
+                    self._prop_ref(item.value_element)),
                 value_defaults=Coerce('coyaml_defaults_fun',
                     self.prefix+'_defaults_'+item.value_element.type)
                     if isinstance(item.value_element, load.Struct) else NULL,
                 ))
-            item.prop_func = 'coyaml_mapping'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_mapping_vars'),
-                Int(len(self.states['mapping'].content)-1)))
+            self._set_prop(item, 'mapping')
         elif isinstance(item, load.Array):
-            item.struct_name = struct.name
-            item.member_path = mem
-            astr = ArrayEl(self.prefix+'_a_'+typename(item.element)+'_t')
+            if not contiguous(item):
+                astr = ArrayEl(self.prefix+'_a_'+typename(item.element)+'_t')
+                elmem = Member(Ident('item'), 'value')
+            elif isinstance(item.element, load.Struct):
+                astr = ArrayEl(self.prefix+'_'+item.element.type+'_t')
+                elmem = None
+            elif item.element.__class__ in string_types:
+                astr = ArrayEl(self.prefix+'_ca_'+typename(item.element)+'_t')
+                elmem = Member(Ident('item'), 'value')
+            else:
+                astr = ArrayEl(typename(item.element))
+                elmem = None
             if not isinstance(item.element, load.Struct):
-                self.mkstate(item.element, astr,
-                    Member(Ident('item'), Ident('value')))
+                self.mkstate(item.element, astr, elmem)
             else:
-                self._visit_hier(item.element, None, astr,
-                    Member(Ident('item'), 'value'), root=root)
+                self._visit_hier(item.element, None, astr, elmem, root=root)
             self.states['array'](StrValue(
                 type=Ref(Ident('coyaml_array_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(mem) ]),
+                baseoffset=offset_of(struct, mem),
                 flagoffset=Int(struct.nextflag())
                     if hasattr(struct, 'nextflag') else Int(0),
                 inheritance=Ident("COYAML_INH_NO")
                     if not item.inheritance else
                     "COYAML_INH_" + item.inheritance.upper().replace('-', '_'),
+                layout=Ident('COYAML_LAYOUT_CONTIGUOUS')
+                    if contiguous(item) else Ident('COYAML_LAYOUT_LIST'),
                 element_size=Call('sizeof', [ Typename(astr.name) ]),
                 element_prop=Coerce('coyaml_placeholder_t *',
-                    item.element.prop_ref),
+                    self._prop_ref(item.element)),
                 element_defaults=Coerce('coyaml_defaults_fun',
                     self.prefix+'_defaults_'+item.element.type)
                     if isinstance(item.element, load.Struct) else NULL,
                 ))
-            item.prop_func = 'coyaml_array'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_array_vars'),
-                Int(len(self.states['array'].content)-1)))
+            self._set_prop(item, 'array')
         elif isinstance(item, (load.CType, load.CStruct)):
             pass
         else:
@@ -692,8 +807,7 @@ class GenCCode(object):
         if isinstance(item, load.Int):
             self.states['int'](StrValue(
                 type=Ref(Ident('coyaml_int_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(member) ]),
+                baseoffset=offset_of(struct, member),
                 description=String(item.description.strip())
                     if hasattr(item, 'description') else NULL,
                 flagoffset=Int(struct.nextflag())
@@ -704,14 +818,11 @@ class GenCCode(object):
                     hasattr(item, 'min'),
                     hasattr(item, 'max'),
                 ))))
-            item.prop_func = 'coyaml_int'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_int_vars'),
-                Int(len(self.states['int'].content)-1)))
+            self._set_prop(item, 'int')
         elif isinstance(item, load.UInt):
             self.states['uint'](StrValue(
                 type=Ref(Ident('coyaml_uint_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(member) ]),
+                baseoffset=offset_of(struct, member),
                 description=String(item.description.strip())
                     if hasattr(item, 'description') else NULL,
                 flagoffset=Int(struct.nextflag())
@@ -722,14 +833,11 @@ class GenCCode(object):
                     hasattr(item, 'min'),
                     hasattr(item, 'max'),
                 ))))
-            item.prop_func = 'coyaml_uint'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_uint_vars'),
-                Int(len(self.states['uint'].content)-1)))
+            self._set_prop(item, 'uint')
         elif isinstance(item, load.Float):
             self.states['float'](StrValue(
                 type=Ref(Ident('coyaml_float_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(member) ]),
+                baseoffset=offset_of(struct, member),
                 description=String(item.description.strip())
                     if hasattr(item, 'description') else NULL,
                 flagoffset=Int(struct.nextflag())
@@ -740,40 +848,31 @@ class GenCCode(object):
                     hasattr(item, 'min'),
                     hasattr(item, 'max'),
                 ))))
-            item.prop_func = 'coyaml_float'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_float_vars'),
-                Int(len(self.states['float'].content)-1)))
+            self._set_prop(item, 'float')
         elif isinstance(item, load.Bool):
             self.states['bool'](StrValue(
                 type=Ref(Ident('coyaml_bool_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(member) ]),
+                baseoffset=offset_of(struct, member),
                 description=String(item.description.strip())
                     if hasattr(item, 'description') else NULL,
                 flagoffset=Int(struct.nextflag())
                     if item.inheritance else Int(0),
                 ))
-            item.prop_func = 'coyaml_bool'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_bool_vars'),
-                Int(len(self.states['bool'].content)-1)))
+            self._set_prop(item, 'bool')
         elif isinstance(item, load.String):
             self.states['string'](StrValue(
                 type=Ref(Ident('coyaml_string_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(member) ]),
+                baseoffset=offset_of(struct, member),
                 description=String(item.description.strip())
                     if hasattr(item, 'description') else NULL,
                 flagoffset=Int(struct.nextflag())
                     if item.inheritance else Int(0),
                 ))
-            item.prop_func = 'coyaml_string'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_string_vars'),
-                Int(len(self.states['string'].content)-1)))
+            self._set_prop(item, 'string')
         elif isinstance(item, load.File):
             self.states['file'](StrValue(
                 type=Ref(Ident('coyaml_file_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(member) ]),
+                baseoffset=offset_of(struct, member),
                 description=String(item.description.strip())
                     if hasattr(item, 'description') else NULL,
                 flagoffset=Int(struct.nextflag())
@@ -784,14 +883,11 @@ class GenCCode(object):
                 check_writable=cbool(getattr(item, 'check_writable', False)),
                 warn_outside=String(getattr(item, 'warn_outside', "")),
                 ))
-            item.prop_func = 'coyaml_file'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_file_vars'),
-                Int(len(self.states['file'].content)-1)))
+            self._set_prop(item, 'file')
         elif isinstance(item, load.Dir):
             self.states['dir'](StrValue(
                 type=Ref(Ident('coyaml_dir_type')),
-                baseoffset=Call('offsetof', [ struct.a_name,
-                    mem2dotname(member) ]),
+                baseoffset=offset_of(struct, member),
                 description=String(item.description.strip())
                     if hasattr(item, 'description') else NULL,
                 flagoffset=Int(struct.nextflag())
@@ -799,13 +895,12 @@ class GenCCode(object):
                 check_existence=cbool(getattr(item, 'check_existence', False)),
                 check_dir=cbool(getattr(item, 'check_dir', False)),
                 ))
-            item.prop_func = 'coyaml_dir'
-            item.prop_ref = Ref(Subscript(Ident(self.prefix+'_dir_vars'),
-                Int(len(self.states['dir'].content)-1)))
+            self._set_prop(item, 'dir')
         else:
             raise NotImplementedError(item)
 
 def main():
+    import sys
     from .cli import simple
     from .load import load
     from .textast import Ast
@@ -815,7 +910,8 @@ def main():
     generator = GenCCode(cfg)
     with Ast() as ast:
         generator.make(ast)
-    print(str(ast))
+    ast.write_to(sys.stdout)
+    print()
 
 if __name__ == '__main__':
     from .cgen import main
@@ -1,3 +1,4 @@
+import hashlib
 from string import digits
 
 from . import load
@@ -47,5 +48,63 @@ def typename(typ):
 def cbool(val):
     return 'TRUE' if val else 'FALSE'
 
+def contiguous(array):
+    layout = getattr(array, 'layout', 'list')
+    if layout not in ('list', 'contiguous'):
+        raise ValueError("Unknown array layout {0!r}".format(layout))
+    return layout == 'contiguous'
+
+def _feed_schema(digest, ob):
+    if isinstance(ob, dict):
+        digest.update(b'{')
+        for k, v in ob.items():
+            _feed_schema(digest, k)
+            _feed_schema(digest, v)
+        digest.update(b'}')
+    elif isinstance(ob, (list, tuple)):
+        digest.update(b'[')
+        for v in ob:
+            _feed_schema(digest, v)
+        digest.update(b']')
+    elif hasattr(ob, '__dict__'):
+        digest.update(ob.__class__.__name__.encode('utf-8') + b'(')
+        for k in sorted(vars(ob)):
+            if k != 'start_mark':
+                _feed_schema(digest, k)
+                _feed_schema(digest, getattr(ob, k))
+        digest.update(b')')
+    else:
+        digest.update(repr(ob).encode('utf-8') + b';')
+
+def schema_hash(cfg):
+    """Returns 32-bit hash of the schema, used to check snapshots
+
+    Defaults are hashed too, as they are stored in the snapshot along
+    with the values read from config.
+    """
+    digest = hashlib.sha1()
+    _feed_schema(digest, (cfg.name, vars(cfg.meta), cfg.types, cfg.data))
+    return int(digest.hexdigest()[:8], 16)
+
+def _has_ctypes(ob):
+    if isinstance(ob, (load.CType, load.CStruct)):
+        return ob.pointers
+    if isinstance(ob, dict):
+        return any(_has_ctypes(v) for v in ob.values())
+    elif isinstance(ob, (list, tuple)):
+        return any(_has_ctypes(v) for v in ob)
+    elif hasattr(ob, '__dict__'):
+        return any(_has_ctypes(v) for v in vars(ob).values())
+    return False
+
+def snapshots_supported(cfg):
+    """Returns False if schema has ``!CType`` or ``!CStruct`` members
+
+    They are copied into snapshot byte by byte, and pointers they may
+    contain can't be relocated. Members declared with ``pointers: no``
+    are safe to copy.
+    """
+    return not _has_ctypes((cfg.types, cfg.data))
+
 def makevar(val):
     return varname(val).replace('.', '_').replace(' ', '_')
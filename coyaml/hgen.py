@@ -1,6 +1,6 @@
 
 from . import load
-from .cutil import varname, typename, string_types, makevar
+from .cutil import varname, typename, string_types, makevar, contiguous
 from .cast import *
 from .textast import VSpace
 
@@ -70,6 +70,35 @@ class GenHCode(object):
             Param(Typename('int'), 'argc'),
             Param(Typename('char **'), 'argv'),
             ]))
+        ast(Func(Typename(self.prefix+'_main_t *'), self.prefix+'_load_r', [
+            Param(Typename(self.prefix+'_main_t *'), 'target'),
+            Param(Typename('int'), 'argc'),
+            Param(Typename('char **'), 'argv'),
+            Param(Typename('coyaml_error_t *'), 'err'),
+            ]))
+        ast(Func(Typename('int'), self.prefix+'_load_async', [
+            Param(Typename(self.prefix+'_main_t *'), 'target'),
+            Param(Typename('int'), 'argc'),
+            Param(Typename('char **'), 'argv'),
+            Param(Typename('coyaml_load_fun'), 'callback'),
+            Param(Typename('void *'), 'userdata'),
+            ]))
+        ast(Func(Typename('int'), self.prefix+'_reload', [
+            Param(Typename('coyaml_holder_t *'), 'holder'),
+            Param(Typename('int'), 'argc'),
+            Param(Typename('char **'), 'argv'),
+            ]))
+        ast(Func(Typename(self.prefix+'_main_t *'), self.prefix+'_acquire', [
+            Param(Typename('coyaml_holder_t *'), 'holder'),
+            ]))
+        ast(Func(Void(), self.prefix+'_release', [
+            Param(Typename(self.prefix+'_main_t *'), 'target'),
+            ]))
+        for name in ('snapshot_save', 'snapshot_load'):
+            ast(Func(Typename('int'), self.prefix+'_'+name, [
+                Param(Typename('coyaml_context_t *'), 'ctx'),
+                Param(Typename('const char *'), 'filename'),
+                ]))
         ast(Endif('_H_'+self.cfg.targetname.upper()))
 
     def _simple_type(self, ast, typ, name):
@@ -81,6 +110,25 @@ class GenHCode(object):
         else:
             ast(Var(Typename(typename(typ)), varname(name)))
 
+    def _contiguous_array(self, ast, element, name, root):
+        # Elements are stored in a single block, so numbers are plain C
+        # arrays and only strings need a struct to keep their length
+        if isinstance(element, load.Struct):
+            ctype = 'struct {0}_{1}_s *'.format(self.prefix, element.type)
+        elif isinstance(element, string_types):
+            tname = '{0}_ca_{1}'.format(self.prefix, typename(element))
+            ctype = 'struct {0}_s *'.format(tname)
+            if tname not in self._visited:
+                self._visited.add(tname)
+                root(VSpace())
+                with root(TypeDef(Struct(tname+'_s', ast.block()),
+                    tname+'_t')) as sub:
+                    self._simple_type(sub, element, 'value')
+        else:
+            ctype = typename(element) + ' *'
+        ast(Var(Typename(ctype), varname(name)))
+        ast(Var('size_t', varname(name)+'_len'))
+
     def _struct_body(self, ast, dic, root):
         for k, v in dic.items():
             if isinstance(v, dict):
@@ -91,6 +139,9 @@ class GenHCode(object):
                     typename(v.key_element), typename(v.value_element))
                 ast(Var(Typename('struct '+tname+'_s *'), varname(k)))
                 ast(Var('size_t', varname(k)+'_len'))
+                if isinstance(v.key_element, string_types):
+                    ast(Var(Typename('coyaml_mapindex_t *'),
+                        varname(k)+'_index'))
                 if tname in self._visited:
                     continue
                 self._visited.add(tname)
@@ -104,6 +155,14 @@ class GenHCode(object):
                     [Ident('name'), Ident('source')],
                     'for({0}_t *name = source; name; name = name->head.next)'
                     .format(tname)))
+                if isinstance(v.key_element, string_types):
+                    root(Func(Typename(tname+'_t *'), tname+'_find', [
+                        Param(Typename('coyaml_mapindex_t *'), 'index'),
+                        Param(Typename('const char *'), 'key'),
+                        Param(Typename('size_t'), 'keylen'),
+                        ]))
+            elif isinstance(v, load.Array) and contiguous(v):
+                self._contiguous_array(ast, v.element, k, root)
             elif isinstance(v, load.Array):
                 tname = '{0}_a_{1}'.format(self.prefix,
                     typename(v.element))
@@ -125,6 +184,7 @@ class GenHCode(object):
                 self._simple_type(ast, v, k)
 
 def main():
+    import sys
     from .cli import simple
     from .load import load
     from .textast import Ast
@@ -133,7 +193,8 @@ def main():
         load(inp, cfg)
     with Ast() as ast:
         GenHCode(cfg).make(ast)
-    print(str(ast))
+    ast.write_to(sys.stdout)
+    print()
 
 if __name__ == '__main__':
     from .hgen import main
@@ -6,23 +6,38 @@ import yaml
 class Group(collections.OrderedDict):
     __slots__ = ('start_mark',)
 
-class ConfigLoader(yaml.Loader):
-    """Config loader with yaml tags"""
+class ConfigConstructor(object):
+    """Mixin for yaml constructors which keeps mappings ordered"""
 
     def construct_yaml_map(self, node):
         data = Group()
         data.start_mark = node.start_mark
         yield data
-        value = self.construct_mapping(node)
-        data.update(value)
+        if isinstance(node, yaml.MappingNode):
+            self.flatten_mapping(node)
+        data.update(self.construct_pairs(node))
 
     def construct_mapping(self, node, deep=False):
         if isinstance(node, yaml.MappingNode):
             self.flatten_mapping(node)
         return collections.OrderedDict(self.construct_pairs(node, deep=deep))
 
-yaml.add_constructor('tag:yaml.org,2002:map',
-    ConfigLoader.construct_yaml_map, Loader=ConfigLoader)
+class ConfigLoader(ConfigConstructor, yaml.Loader):
+    """Config loader with yaml tags"""
+
+if getattr(yaml, '__with_libyaml__', False):
+    class CConfigLoader(ConfigConstructor, yaml.CLoader):
+        """Config loader with yaml tags which uses libyaml for parsing"""
+    loaders = [ConfigLoader, CConfigLoader]
+    DefaultLoader = CConfigLoader
+else:
+    CConfigLoader = None
+    loaders = [ConfigLoader]
+    DefaultLoader = ConfigLoader
+
+for _loader in loaders:
+    yaml.add_constructor('tag:yaml.org,2002:map',
+        ConfigConstructor.construct_yaml_map, Loader=_loader)
 
 class YamlyType(yaml.YAMLObject):
 
@@ -50,35 +65,35 @@ class YamlyType(yaml.YAMLObject):
 
 class Int(YamlyType):
     yaml_tag = '!Int'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class UInt(YamlyType):
     yaml_tag = '!UInt'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class Bool(YamlyType):
     yaml_tag = '!Bool'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class Float(YamlyType):
     yaml_tag = '!Float'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class String(YamlyType):
     yaml_tag = '!String'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class File(YamlyType):
     yaml_tag = '!File'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class Dir(YamlyType):
     yaml_tag = '!Dir'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class Struct(yaml.YAMLObject):
     yaml_tag = '!Struct'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
     def __init__(self, type):
         self.type = type
@@ -102,15 +117,15 @@ class Struct(yaml.YAMLObject):
 
 class Mapping(YamlyType):
     yaml_tag = '!Mapping'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class Array(YamlyType):
     yaml_tag = '!Array'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
 class Convert(yaml.YAMLObject):
     yaml_tag = '!Convert'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
 
     def __init__(self, fun):
         self.fun = fun
@@ -121,14 +136,15 @@ class Convert(yaml.YAMLObject):
 
 class VoidPtr(YamlyType):
     yaml_tag = '!_VoidPtr'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
     
 class CStruct(YamlyType):
     yaml_tag = '!CStruct'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
     
-    def __init__(self, type):
+    def __init__(self, type, pointers=True):
         self.structname = type
+        self.pointers = pointers
     
     @classmethod
     def from_yaml(cls, Loader, node):
@@ -140,10 +156,11 @@ class CStruct(YamlyType):
     
 class CType(YamlyType):
     yaml_tag = '!CType'
-    yaml_loader = ConfigLoader
+    yaml_loader = loaders
     
-    def __init__(self, type):
+    def __init__(self, type, pointers=True):
         self.type = type
+        self.pointers = pointers
     
     @classmethod
     def from_yaml(cls, Loader, node):
@@ -156,8 +173,8 @@ class CType(YamlyType):
 from .core import Config, Usertype # sorry, circular dependency
 from .util import varname
 
-def load(input, config):
-    data = yaml.load(input, Loader=ConfigLoader)
+def load(input, config, Loader=DefaultLoader):
+    data = yaml.load(input, Loader=Loader)
     config.fill_meta(data.pop('__meta__', {}))
     for k, v in data.pop('__types__', {}).items():
         typ = Usertype(k, v, start_mark=v.start_mark)
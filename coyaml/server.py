@@ -0,0 +1,215 @@
+"""Persistent code generation server
+
+Server keeps generator modules imported and warmed up, and accepts
+requests over a local unix socket, so that generating code for a small
+schema doesn't pay for interpreter startup and imports every time.
+
+Protocol is line-based JSON. Client sends single request::
+
+    {"generator": ..., "jobs": [[src, header, source, name, targetname],
+     ...], "processes": 1, "cache_dir": ..., "use_cache": true}
+
+and server answers with one line per finished job::
+
+    {"job": [...], "generated": true, "elapsed": 0.1, "error": null}
+
+or with a single ``{"error": ...}`` line if it can't process the request.
+All paths are absolute, as server has its own working directory.
+"""
+import json
+import os
+import os.path
+import socket
+import socketserver
+
+from . import __version__
+from .batch import Job, Result
+from .cache import default_cache_dir, generator_hash
+
+
+def default_socket_path():
+    if os.environ.get('COYAML_SOCKET'):
+        return os.environ['COYAML_SOCKET']
+    base = os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'coyaml', 'server.sock')
+
+
+def _send(stream, obj):
+    stream.write(json.dumps(obj).encode('utf-8') + b'\n')
+    stream.flush()
+
+def _receive(stream):
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        from .batch import run
+        request = _receive(self.rfile)
+        if request is None:
+            return
+        if request.get('generator') != generator_hash():
+            _send(self.wfile, {'error': "Server runs other generator, "
+                "coyaml {0} ({1})".format(__version__, generator_hash())})
+            return
+        jobs = [Job(*job) for job in request['jobs']]
+        try:
+            for res in run(jobs, request.get('processes', 1),
+                    request.get('cache_dir'), request.get('use_cache', True)):
+                _send(self.wfile, {'job': list(res.job),
+                    'generated': res.generated, 'elapsed': res.elapsed,
+                    'error': res.error})
+        except ValueError as e:
+            _send(self.wfile, {'error': str(e)})
+
+
+class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Generation server, every connection is handled in forked process
+
+    Forked processes inherit modules imported (and node writers compiled)
+    by the parent, and connections are processed in parallel.
+    """
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            if _connect(path) is not None:
+                raise RuntimeError("Server is already running at "
+                    "{0!r}".format(path))
+            os.unlink(path)  # stale socket of dead server
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        super(Server, self).__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+    def server_close(self):
+        super(Server, self).server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# Small schema using every common kind of option
+_WARMUP_SCHEMA = """\
+__meta__:
+  program-name: warmup
+  default-config: /dev/null
+  description: Server warm-up configuration
+
+__types__:
+  addr:
+    host: !String localhost
+    port: !Int 80
+
+group:
+  number: !Int
+    =: 0
+    command-line: --number
+    description: Number option
+  unsigned: !UInt 1
+  float: !Float 0.5
+  flag: !Bool no
+  string: !String "value"
+  address: !Struct addr
+  numbers: !Array
+    element: !Int 0
+  addresses: !Array
+    element: !Struct addr
+  named: !Mapping
+    key-element: !String ""
+    value-element: !Int 0
+"""
+
+def warm_up():
+    """Imports generator modules and compiles writers of common nodes"""
+    from . import generate
+    generate(_WARMUP_SCHEMA, 'warmup', 'warmup')
+
+def serve(path=None, log=None):
+    """Runs server at unix socket ``path`` until interrupted"""
+    import signal
+    path = path or default_socket_path()
+    generator_hash()  # of the modules loaded now, not changed ones
+    warm_up()
+    def terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
+    server = Server(path)
+    if log is not None:
+        log("coyaml {0} server is listening at {1}".format(__version__, path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def _results(sock, stream, jobs, message):
+    done = set()
+    try:
+        while message is not None and 'job' in message:
+            job = jobs[Job(*message['job'])]
+            done.add(job)
+            yield Result(job, message['generated'], message['elapsed'],
+                message['error'])
+            message = _receive(stream)
+    finally:
+        stream.close()
+        sock.close()
+    error = "Connection to coyaml server lost"
+    if message is not None:
+        error = message.get('error', error)
+    for job in jobs.values():
+        if job not in done:
+            yield Result(job, False, 0.0, error)
+
+def run_remote(jobs, processes=1, cache_dir=None, use_cache=True,
+        path=None):
+    """Runs ``jobs`` on the server, same as ``batch.run`` does locally
+
+    Returns None if server isn't running, runs other generator or refuses
+    the request, so that caller can fall back to local generation.
+    """
+    sock = _connect(path or default_socket_path())
+    if sock is None:
+        return None
+    # Resolved here, as environment of the server may differ
+    cache_dir = cache_dir or default_cache_dir()
+    byabs = {}
+    for job in jobs:
+        byabs[Job(os.path.abspath(job.src), os.path.abspath(job.header),
+            os.path.abspath(job.source), job.name, job.targetname)] = job
+    stream = sock.makefile('rwb')
+    try:
+        _send(stream, {
+            'generator': generator_hash(),
+            'jobs': [list(job) for job in byabs],
+            'processes': processes,
+            'cache_dir': cache_dir and os.path.abspath(cache_dir),
+            'use_cache': use_cache and cache_dir is not None,
+            })
+        first = _receive(stream)
+    except (OSError, ValueError):
+        first = None
+    if first is None or 'job' not in first:
+        stream.close()
+        sock.close()
+        return None
+    return _results(sock, stream, byabs, first)
@@ -6,6 +6,8 @@ from contextlib import contextmanager
 
 from .util import nested
 
+DEFAULT_BUFFER_SIZE = 1 << 16
+
 class Node(object):
     __slots__ = ('_futures',)
     pattern = re.compile(r'(?P<bracket>\{\{|\}\})|'
@@ -37,57 +39,100 @@ class Node(object):
         return val
 
     def format(self, stream):
-        if hasattr(self, 'each_line'):
-            for line in self.lines:
-                stream.line(self.each_line.format(line))
-        if hasattr(self, 'value'):
-            stream.write(str(self.value))
-        if hasattr(self, 'line_format'):
-            with stream.complexline():
-                self._format_line(self.line_format, stream)
-        if hasattr(self, 'block_start'):
-            with stream.block() as block:
-                with block.start():
-                    self._format_line(self.block_start, stream)
-                for i in self.body:
-                    i.format(stream)
-                with block.finish():
-                    self._format_line(self.block_end, stream)
-
-    def _format_line(self, format, stream):
-        start = 0
-        for m in self.pattern.finditer(format):
-            if m.start() > start:
-                stream.write(format[start:m.start()])
-            if m.group('bracket'):
-                stream.write(m.group('bracket')[0])
-            elif m.group('key'):
-                fun = getattr(self, 'fmt_'+m.group('key'), None)
-                if fun is not None:
-                    val = fun()
-                    if val:
-                        stream.write(m.group('prefix'))
-                        stream.write(val)
-                        stream.write(m.group('suffix'))
-                else:
-                    val = getattr(self, m.group('key'))
-                    if val:
-                        stream.write(m.group('prefix'))
-                        if isinstance(val, str):
-                            stream.write(val)
-                        else:
-                            val.format(stream)
-                        stream.write(m.group('suffix'))
-            start = m.end()
-        if start != len(format):
-            stream.write(format[start:])
+        try:
+            writer = _writers[self.__class__]
+        except KeyError:
+            writer = _writers[self.__class__] = _compile_writer(self.__class__)
+        writer(self, stream)
+
+
+_writers = {}
+
+def _compile_template(cls, format, lines):
+    """Appends to ``lines`` python code which writes ``format`` to stream
+
+    Placeholders are resolved against ``cls`` once: ``{key}`` becomes
+    either a call of ``fmt_key`` method or an attribute access.
+    """
+    literal = []
+    def flush():
+        if literal:
+            lines.append('write({0!r})'.format(''.join(literal)))
+            del literal[:]
+    start = 0
+    for m in Node.pattern.finditer(format):
+        if m.start() > start:
+            literal.append(format[start:m.start()])
+        start = m.end()
+        if m.group('bracket'):
+            literal.append(m.group('bracket')[0])
+            continue
+        flush()
+        key, prefix, suffix = m.group('key', 'prefix', 'suffix')
+        if hasattr(cls, 'fmt_' + key):
+            lines.append('val = self.fmt_{0}()'.format(key))
+            lines.append('if val:')
+            value = ['write(val)']
+        else:
+            if key.isidentifier():
+                lines.append('val = self.{0}'.format(key))
+            else:
+                lines.append('val = getattr(self, {0!r})'.format(key))
+            lines.append('if val:')
+            value = ['if isinstance(val, str):', '    write(val)',
+                     'else:', '    val.format(stream)']
+        # prefix and suffix are written even if empty, as writing resets
+        # ``line_start`` of the stream
+        lines.append('    write({0!r})'.format(prefix))
+        lines.extend('    ' + line for line in value)
+        lines.append('    write({0!r})'.format(suffix))
+    if start != len(format):
+        literal.append(format[start:])
+    flush()
+
+def _compile_writer(cls):
+    """Compiles ``Node.format`` specialized for class ``cls``
+
+    The result is equivalent to interpreting ``each_line``, ``value``,
+    ``line_format`` and ``block_start``/``block_end`` of the class on each
+    call, but templates are parsed only once per class.
+    """
+    lines = ['write = stream.write']
+    if hasattr(cls, 'each_line'):
+        lines.append('each_line = self.each_line')
+        lines.append('for line in self.lines:')
+        lines.append('    stream.line(each_line.format(line))')
+    if hasattr(cls, 'value'):
+        # slot may be unset, errors of ``__str__`` must propagate
+        lines.append("if hasattr(self, 'value'):")
+        lines.append('    write(str(self.value))')
+    if hasattr(cls, 'line_format'):
+        lines.append('full_line = stream.start_line()')
+        _compile_template(cls, cls.line_format, lines)
+        lines.append('stream.end_line(full_line)')
+    if hasattr(cls, 'block_start'):
+        start, finish = [], []
+        _compile_template(cls, cls.block_start, start)
+        _compile_template(cls, cls.block_end, finish)
+        lines.append('with stream.block() as block:')
+        lines.append('    with block.start():')
+        lines.extend('        ' + line for line in start or ['pass'])
+        lines.append('    for i in self.body:')
+        lines.append('        i.format(stream)')
+        lines.append('    with block.finish():')
+        lines.extend('        ' + line for line in finish or ['pass'])
+    code = 'def format(self, stream):\n' + ''.join(
+        '    ' + line + '\n' for line in lines)
+    namespace = {}
+    exec(compile(code, '<{0}.format>'.format(cls.__name__), 'exec'),
+        namespace)
+    return namespace['format']
 
 
 class VSpace(Node):
     __slots__ = {}
     def format(self, stream):
-        stream.write('\n')
-        stream.line_start = True
+        stream.newline()
 
 class ListConstraint(object):
     __slots__ = ('subtypes', 'separator')
@@ -102,11 +147,14 @@ class List(list):
         super(List, self).__init__(*args)
 
     def format(self, stream):
-        if self:
-            self[0].format(stream)
-            for i in self[1:]:
-                stream.write(', ')
-                i.format(stream)
+        items = iter(self)
+        for i in items:
+            i.format(stream)
+            break
+        for i in items:
+            stream.write(', ')
+            i.format(stream)
+            stream.check_flush() # lists may make very long lines
 
 
 class _LazyRef(object):
@@ -141,6 +189,23 @@ class _Lazy(object):
 
 lazy = _Lazy() # Hi, I'm a singleton.
 
+def _splice_zones(content):
+    """Replaces (possibly nested) zones in ``content`` list by their items
+
+    List is modified in place, as it may be referenced by nodes already.
+    """
+    if not any(isinstance(v, _Zone) for v in content):
+        return
+    result = []
+    def add(items):
+        for v in items:
+            if isinstance(v, _Zone):
+                add(v.content)
+            else:
+                result.append(v)
+    add(content)
+    content[:] = result
+
 class _FutureChildren(object):
     def __init__(self):
         self.content = List(None)
@@ -150,9 +215,7 @@ class _FutureChildren(object):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        for (i, v) in enumerate(self.content):
-            if isinstance(v, _Zone):
-                self.content[i:i+1] = v.content
+        _splice_zones(self.content)
 
     def __call__(self, node):
         self.content.append(node)
@@ -196,26 +259,33 @@ class _Block(object):
         if self.full_line:
             self.stream.buffer.write(self.indent)
         yield
-        self.stream.buffer.write('\n')
-        self.stream.line_start = True
+        self.stream.newline()
 
     @contextmanager
     def finish(self):
         self.stream.buffer.write(self.indent)
         yield
         if self.full_line:
-            self.stream.buffer.write('\n')
-            self.stream.line_start = True
+            self.stream.newline()
 
 class _Stream(object):
-    __slots__ = ('ast','indent_kind', 'indent', 'buffer', 'line_start')
+    """Text buffer with indentation tracking
+
+    If ``output`` is specified, buffer is flushed to it at the end of
+    line whenever it grows larger than ``buffer_size``.
+    """
+    __slots__ = ('ast','indent_kind', 'indent', 'buffer', 'line_start',
+        'output', 'buffer_size')
 
-    def __init__(self, ast, indent_kind='    '):
+    def __init__(self, ast, indent_kind='    ', output=None,
+            buffer_size=DEFAULT_BUFFER_SIZE):
         self.ast = ast
         self.buffer = StringIO()
         self.indent_kind = indent_kind
         self.indent = 0
         self.line_start = True
+        self.output = output
+        self.buffer_size = buffer_size
 
     def write(self, data):
         self.line_start = False
@@ -229,20 +299,40 @@ class _Stream(object):
             line = self.indent_kind * self.indent + line
         self.buffer.write(line)
         self.line_start = True
+        self.check_flush()
+
+    def newline(self):
+        self.buffer.write('\n')
+        self.line_start = True
+        self.check_flush()
+
+    def check_flush(self):
+        if self.output is not None and self.buffer.tell() >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.output.write(self.buffer.getvalue())
+        self.buffer = StringIO()
 
     def getvalue(self):
         return self.buffer.getvalue()
 
-    @contextmanager
-    def complexline(self):
-        full_line = self.line_start
-        if full_line:
+    def start_line(self):
+        if self.line_start:
             self.buffer.write(self.indent_kind * self.indent)
             self.line_start = False
-        yield
+            return True
+        return False
+
+    def end_line(self, full_line):
         if full_line:
-            self.buffer.write('\n')
-            self.line_start = True
+            self.newline()
+
+    @contextmanager
+    def complexline(self):
+        full_line = self.start_line()
+        yield
+        self.end_line(full_line)
 
     @contextmanager
     def block(self):
@@ -256,23 +346,34 @@ class Ast(object):
         self.body = []
         self.zones = {}
 
-    def __str__(self):
-        stream = _Stream(self)
+    def _format(self, stream):
         for i in self.body:
             if isinstance(i, _Zone): # bad shit, don't know why need this
                 for j in i.content:
                     j.format(stream)
             else:
                 i.format(stream)
+
+    def __str__(self):
+        stream = _Stream(self)
+        self._format(stream)
         return stream.getvalue()
 
+    def write_to(self, fileobj, buffer_size=DEFAULT_BUFFER_SIZE):
+        """Writes formatted code to text file object ``fileobj``
+
+        Unlike ``str(ast)`` doesn't keep whole text in memory, it's written
+        by chunks of about ``buffer_size`` characters.
+        """
+        stream = _Stream(self, output=fileobj, buffer_size=buffer_size)
+        self._format(stream)
+        stream.flush()
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        for (i, v) in enumerate(self.body):
-            if isinstance(v, _Zone):
-                self.body[i:i+1] = v.content
+        _splice_zones(self.body)
 
     def block(self):
         return _FutureChildren()
@@ -97,3 +97,20 @@ def nested(*managers):
             # the right information. Another exception may
             # have been raised and caught by an exit method
             raise exc[0]
+
+@contextmanager
+def gc_paused():
+    """Disables cyclic garbage collector for the duration of the block
+
+    Code generator builds millions of small objects which live until the
+    end of generation, and repeated full collections over them make the
+    generation time grow quadratically with schema size.
+    """
+    import gc
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
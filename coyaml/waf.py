@@ -1,6 +1,6 @@
 
 try:
-    from waflib import Task, TaskGen
+    from waflib import Errors, Task, TaskGen
 except ImportError:
     raise ImportError("Can use coyaml.waf only from wscript")
 
@@ -12,25 +12,26 @@ def coyaml_decider(context, target):
 def coyaml_gen(task):
     if not task.outputs:
         return
-    from . import cgen, hgen, core, load, textast
+    import os
+    from .batch import Job
+    from .cache import GenCache, generate_files
+    from .server import run_remote
     name = getattr(task.generator, 'config_name', 'config')
-    src = task.inputs[0]
-    tgt = task.outputs[0]
-    cfg = core.Config(name, tgt.name[:-len(tgt.suffix())])
-    with open(src.abspath(), 'rb') as f:
-        load.load(f, cfg)
-    with open(tgt.abspath(), 'wt', encoding='utf-8') as f:
-        with textast.Ast() as ast:
-            hgen.GenHCode(cfg).make(ast)
-        f.write(str(ast))
-    tgt = task.outputs[1]
-    cfg = core.Config(name, tgt.name[:-len(tgt.suffix())])
-    with open(src.abspath(), 'rb') as f:
-        load.load(f, cfg)
-    with open(tgt.abspath(), 'wt', encoding='utf-8') as f:
-        with textast.Ast() as ast:
-            cgen.GenCCode(cfg).make(ast)
-        f.write(str(ast))
+    cache_dir = os.environ.get('COYAML_CACHE_DIR') \
+        or os.path.join(task.generator.bld.bldnode.abspath(), '.coyaml')
+    header = task.outputs[0]
+    job = Job(task.inputs[0].abspath(), header.abspath(),
+        task.outputs[1].abspath(), name,
+        header.name[:-len(header.suffix())])
+    # generation server runs outside of the GIL of waf, if it's available
+    results = run_remote([job], cache_dir=cache_dir)
+    if results is None:
+        generate_files(job.src, job.header, job.source, name,
+            job.targetname, cache=GenCache(cache_dir))
+        return
+    for res in results:
+        if res.error is not None:
+            raise Errors.WafError("{0}: {1}".format(job.src, res.error))
 
 Task.task_type_from_func(
         name      = 'coyaml', 
@@ -22,11 +22,28 @@ struct coyaml_group_s;
 
 typedef int (*coyaml_print_fun)(FILE *out, void *cfg, int mode);
 
+// File mapped into memory by ``!FromFile'' tag
+typedef struct coyaml_blob_s {
+    struct coyaml_blob_s *next;
+    void *data;
+    size_t size;
+} coyaml_blob_t;
+
 typedef struct coyaml_head_s {
     struct obstack pieces;
     bool free_object;
+    coyaml_blob_t *blobs;
+    int refcount; // for configs published by coyaml_publish()
 } coyaml_head_t;
 
+// Currently published config, zero-initialized holder is empty
+typedef struct coyaml_holder_s {
+    coyaml_head_t *current;
+    unsigned long epoch;
+    int readers[2];
+    int writer;
+} coyaml_holder_t;
+
 typedef struct coyaml_arrayel_head_s {
     void *next;
 } coyaml_arrayel_head_t;
@@ -35,6 +52,29 @@ typedef struct coyaml_mappingel_head_s {
     void *next;
 } coyaml_mappingel_head_t;
 
+// Open addressing hash index of mapping elements with string keys, it's
+// kept separately from the elements, because inherited mappings share them
+typedef struct coyaml_mapslot_s {
+    unsigned int hash;
+    void *element;
+} coyaml_mapslot_t;
+
+typedef struct coyaml_mapindex_s {
+    size_t size; // always power of two
+    int key_offset;
+    coyaml_mapslot_t slots[];
+} coyaml_mapindex_t;
+
+// Error of the last failed call, kept in the context as well as in errno,
+// so that each thread has its own when many configs are parsed at once
+typedef struct coyaml_error_s {
+    int code; // ECOYAML_* constant or errno value, zero if there is no error
+    long line; // starting from one, zero if not related to a config file
+    long column; // starting from zero, as in error messages
+    char filename[256];
+    char message[256];
+} coyaml_error_t;
+
 typedef struct coyaml_cmdline_s {
     char *usage;
     char *full_description;
@@ -49,20 +89,37 @@ typedef struct coyaml_cmdline_s {
 typedef struct coyaml_context_s {
     bool debug;
     bool parse_vars;
+    bool map_blobs; // map ``!FromFile'' files instead of reading them
+    bool quiet; // don't print errors to stderr, only put them into ``error''
     struct coyaml_head_s *target;
     char *program_name;
     coyaml_cmdline_t *cmdline;
     struct coyaml_group_s *root_group;
     struct coyaml_env_var_s *env_vars;
     char *root_filename;
+    // When set, coyaml_readfile() loads snapshot instead of parsing the
+    // config if it's up to date, or saves it after parsing otherwise
+    char *snapshot_filename;
+    unsigned int schema_hash; // snapshot compatibility, set by generator
+    size_t target_size; // zero if schema doesn't support snapshots
     bool free_object;
+    coyaml_error_t error;
 
     struct obstack pieces;
     struct coyaml_variable_s *variables;
+    struct coyaml_variable_s **variable_table;
+    int variable_table_size;
+    int variable_count;
+    int variable_epoch; // incremented on every change of variables
+    struct coyaml_source_s *sources; // files read by the last parse
     struct coyaml_parseinfo_s *parseinfo;
 } coyaml_context_t;
 
 int coyaml_readfile(coyaml_context_t *ctx);
+// Reads config which is already in memory, ``name'' is used in error
+// messages and as a base for relative paths of included files
+int coyaml_readbuffer(coyaml_context_t *ctx, const char *data, size_t len,
+    const char *name);
 int coyaml_cli_prepare(coyaml_context_t *, int argc, char **argv);
 int coyaml_cli_parse(coyaml_context_t *, int argc, char **argv);
 int coyaml_env_parse(coyaml_context_t *ctx);
@@ -70,6 +127,50 @@ void coyaml_context_free(coyaml_context_t *ctx);
 
 int coyaml_set_string(coyaml_context_t *, char *name, char *data, int dlen);
 int coyaml_set_integer(coyaml_context_t *ctx, char *name, long value);
+// Sets string variables from NULL-terminated array of name, value pairs
+int coyaml_set_vars(coyaml_context_t *ctx, char **name_value_pairs);
+
+// Binary snapshot of the parsed config, load returns -1 with errno set
+// to ESTALE if snapshot is for another schema, variables or files. Both
+// fail with ENOTSUP for schemas having ``!CType'' or ``!CStruct'' members,
+// as pointers they may contain can't be stored in the snapshot, unless
+// members are declared with ``pointers: no''
+int coyaml_snapshot_save(coyaml_context_t *ctx, const char *filename);
+int coyaml_snapshot_load(coyaml_context_t *ctx, const char *filename);
+
+// Reentrant counterpart of generated ``_load'', never exits and may be
+// called by many threads at once. Accepts NULL context if creating it
+// failed. Error is copied to ``err'' instead of printing it, if given
+int coyaml_load(coyaml_context_t *ctx, int argc, char **argv,
+    coyaml_error_t *err); // frees the context in any case, config on error
+
+// Parsing on a worker thread, so that program may do something useful
+// meanwhile. Callbacks are called from the worker. Without a callback
+// readfile returns eventfd, which becomes readable when parsing is done,
+// result is in ctx->error.code then. Context must be valid until that
+typedef void (*coyaml_async_fun)(coyaml_context_t *ctx, int result,
+    void *userdata);
+int coyaml_readfile_async(coyaml_context_t *ctx,
+    coyaml_async_fun callback, void *userdata);
+// Same as coyaml_load(), but context must be allocated by
+// coyaml_context_init(NULL), and argv must stay valid until callback.
+// Callback gets either config or the error
+typedef void (*coyaml_load_fun)(void *cfg, coyaml_error_t *err,
+    void *userdata);
+int coyaml_load_async(coyaml_context_t *ctx, int argc, char **argv,
+    coyaml_load_fun callback, void *userdata);
+
+// Hot reload. Acquired config stays valid until released, even if
+// another one is published meanwhile. Publishing NULL drops the current
+int coyaml_reload(coyaml_holder_t *holder, coyaml_context_t *ctx,
+    int argc, char **argv); // frees the context in any case
+void coyaml_publish(coyaml_holder_t *holder, void *cfg);
+void *coyaml_acquire(coyaml_holder_t *holder);
+void coyaml_release(void *cfg);
+
+// Returns first element of a mapping having the key, or NULL
+void *coyaml_mapping_find(coyaml_mapindex_t *index,
+    const char *key, size_t keylen);
 
 void coyaml_cli_prepare_or_exit(coyaml_context_t *ctx, int argc, char **argv);
 void coyaml_readfile_or_exit(coyaml_context_t *ctx);
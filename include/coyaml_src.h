@@ -22,7 +22,15 @@
 
 typedef struct coyaml_anchor_s {
     struct coyaml_anchor_s *next;
+    struct coyaml_anchor_s *hash_next; // next in bucket of `anchor_table`
+    unsigned int hash;
     char *name; // It's allocated in obstack first, we don't need to free it
+    int events_count; // not including terminating YAML_NO_EVENT
+    // Value built from the events, copied when alias is used for the same
+    // usertype instead of parsing events again, it's freed after parsing
+    struct coyaml_usertype_s *shared_type;
+    const char *shared_basedir;
+    void *shared;
     yaml_event_t events[];
 } coyaml_anchor_t;
 
@@ -40,10 +48,21 @@ typedef struct coyaml_parseinfo_s {
     int anchor_level;
     struct coyaml_anchor_s *anchor_first;
     struct coyaml_anchor_s *anchor_last;
+    // hash index of anchors by name, list above is kept for cleanup
+    struct coyaml_anchor_s **anchor_table;
+    int anchor_table_size;
+    int anchor_count;
     // unpacking
     coyaml_anchor_t *anchor_unpacking;
     int anchor_pos;
+    int shared_hits;
     // End anchors
+    // Cache of variable substitution results
+    struct obstack evalpieces;
+    struct coyaml_evalcache_s **eval_table;
+    int eval_table_size;
+    int eval_count;
+    // End cache
     // Merge structures
     struct obstack mappieces;
     struct coyaml_mapmerge_s *top_map;
@@ -54,6 +73,9 @@ typedef struct coyaml_parseinfo_s {
     // End marks
     struct coyaml_stack_s *root_file;
     struct coyaml_stack_s *current_file;
+    // Events of included files, each one is tokenized only once
+    struct coyaml_inclcache_s *include_cache;
+    int include_hits;
 } coyaml_parseinfo_t;
 
 struct coyaml_usertype_s;
@@ -75,8 +97,8 @@ typedef int (*coyaml_option_fun)(char *value,
 typedef int (*coyaml_emit_fun)(struct coyaml_printctx_s *ctx,
     struct coyaml_placeholder_s *prop, void *target);
 typedef int (*coyaml_copy_fun)(coyaml_context_t *ctx,
-    struct coyaml_placeholder_s *sprop, void *source,
-    struct coyaml_placeholder_s *tprop, void *target);
+    struct coyaml_placeholder_s *sprop, struct coyaml_marks_s *source,
+    struct coyaml_placeholder_s *tprop, struct coyaml_marks_s *target);
 typedef void (*coyaml_defaults_fun)(void *target);
 
 typedef enum {
@@ -102,6 +124,11 @@ typedef enum {
     COYAML_INH_REPLACE_DEFAULT
 } coyaml_inherit_enum;
 
+typedef enum {
+    COYAML_LAYOUT_LIST,
+    COYAML_LAYOUT_CONTIGUOUS
+} coyaml_layout_enum;
+
 typedef struct coyaml_valuetype_s {
     coyaml_type_enum ident;
     char *name;
@@ -135,6 +162,9 @@ typedef struct coyaml_tag_s {
 typedef struct coyaml_group_s {
     COYAML_PLACEHOLDER
     coyaml_transition_t *transitions;
+    // Positions in `transitions` sorted by symbol, for binary search
+    int *transition_index;
+    int transition_count;
 } coyaml_group_t;
 extern coyaml_valuetype_t coyaml_group_type;
 
@@ -145,6 +175,9 @@ typedef struct coyaml_usertype_s {
     int size;
     int default_tag;
     coyaml_tag_t *tags;
+    // Positions in `tags` sorted by tagname, for binary search
+    int *tag_index;
+    int tag_count;
     struct coyaml_group_s *group;
     coyaml_convert_fun scalar_fun;
 } coyaml_usertype_t;
@@ -188,6 +221,7 @@ extern coyaml_valuetype_t coyaml_float_type;
 typedef struct coyaml_array_s {
     COYAML_PLACEHOLDER
     int inheritance;
+    int layout;
     size_t element_size;
     coyaml_placeholder_t *element_prop;
     coyaml_defaults_fun element_defaults;
@@ -249,6 +283,9 @@ int coyaml_tagged_scalar(coyaml_parseinfo_t *info, char *value,
     struct coyaml_usertype_s *prop, void *target);
 int coyaml_parse_tag(coyaml_parseinfo_t *info,
     struct coyaml_usertype_s *prop, int *target);
+coyaml_transition_t *coyaml_find_transition(coyaml_group_t *group,
+    char *symbol);
+coyaml_tag_t *coyaml_find_tag(coyaml_usertype_t *prop, char *tagname);
 
 int coyaml_int_o(char *value, coyaml_int_t *prop, void *target);
 int coyaml_int_incr_o(char *value, coyaml_int_t *prop, void *target);
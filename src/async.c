@@ -0,0 +1,121 @@
+#include <pthread.h>
+#include <stdlib.h>
+#include <stdint.h>
+#include <string.h>
+#include <unistd.h>
+#include <errno.h>
+#include <sys/eventfd.h>
+
+#include "coyaml_src.h"
+#include "parser.h"
+
+typedef struct coyaml_job_s {
+    coyaml_context_t *ctx;
+    int argc;
+    char **argv;
+    coyaml_async_fun callback;
+    coyaml_load_fun load_callback;
+    void *userdata;
+    int fd;
+} coyaml_job_t;
+
+static void *readfile_job(void *arg) {
+    coyaml_job_t *job = arg;
+    memset(&job->ctx->error, 0, sizeof(coyaml_error_t));
+    int res = coyaml_readfile(job->ctx);
+    if(res < 0 && !job->ctx->error.code) {
+        coyaml_errno_error(&job->ctx->error, errno);
+    }
+    if(job->callback) {
+        job->callback(job->ctx, res, job->userdata);
+    } else {
+        // Context is not touched after signalling, caller may free it
+        uint64_t one = 1;
+        while(write(job->fd, &one, sizeof(one)) < 0 && errno == EINTR);
+    }
+    free(job);
+    return NULL;
+}
+
+static void *load_job(void *arg) {
+    coyaml_job_t *job = arg;
+    coyaml_error_t err;
+    void *cfg = job->ctx->target;
+    if(coyaml_load(job->ctx, job->argc, job->argv, &err) < 0) {
+        job->load_callback(NULL, &err, job->userdata);
+    } else {
+        job->load_callback(cfg, NULL, job->userdata);
+    }
+    free(job);
+    return NULL;
+}
+
+static int start_job(coyaml_job_t *job, void *(*fun)(void *)) {
+    pthread_attr_t attr;
+    pthread_attr_init(&attr);
+    pthread_attr_setdetachstate(&attr, PTHREAD_CREATE_DETACHED);
+    pthread_t thread;
+    int err = pthread_create(&thread, &attr, fun, job);
+    pthread_attr_destroy(&attr);
+    if(err) {
+        errno = err;
+        return -1;
+    }
+    return 0;
+}
+
+int coyaml_readfile_async(coyaml_context_t *ctx,
+    coyaml_async_fun callback, void *userdata) {
+    coyaml_job_t *job = calloc(1, sizeof(coyaml_job_t));
+    if(!job) {
+        return -1;
+    }
+    job->ctx = ctx;
+    job->callback = callback;
+    job->userdata = userdata;
+    job->fd = -1;
+    if(!callback) {
+        job->fd = eventfd(0, EFD_CLOEXEC);
+        if(job->fd < 0) {
+            free(job);
+            return -1;
+        }
+    }
+    int fd = job->fd;
+    if(start_job(job, readfile_job) < 0) {
+        int err = errno;
+        if(fd >= 0) {
+            close(fd);
+        }
+        free(job);
+        errno = err;
+        return -1;
+    }
+    return callback ? 0 : fd;
+}
+
+int coyaml_load_async(coyaml_context_t *ctx, int argc, char **argv,
+    coyaml_load_fun callback, void *userdata) {
+    coyaml_job_t *job = ctx ? calloc(1, sizeof(coyaml_job_t)) : NULL;
+    if(!job) {
+        if(ctx) {
+            coyaml_config_free(ctx->target);
+            coyaml_context_free(ctx);
+        }
+        return -1;
+    }
+    job->ctx = ctx;
+    job->argc = argc;
+    job->argv = argv;
+    job->load_callback = callback;
+    job->userdata = userdata;
+    if(start_job(job, load_job) < 0) {
+        int err = errno;
+        coyaml_config_free(ctx->target);
+        coyaml_context_free(ctx);
+        free(job);
+        errno = err;
+        return -1;
+    }
+    return 0;
+}
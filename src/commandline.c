@@ -3,13 +3,34 @@
 #include <string.h>
 #include <strings.h>
 #include <stdlib.h>
+#include <sched.h>
+
+#include "parser.h"
+#include "util.h"
 
 #define VALUE_ERROR(cond, message, ...) if(!(cond)) { \
     fprintf(stderr, "Error parsing option: " message "\n", ##__VA_ARGS__); \
     errno = ECOYAML_VALUE_ERROR; \
     return -1; }
 
-int coyaml_cli_prepare(coyaml_context_t *ctx, int argc, char **argv) {
+// getopt keeps its state in globals, so command-line of only one config
+// may be parsed at a time. Lock is held only while options are scanned
+static int getopt_lock;
+
+static void lock_getopt(coyaml_context_t *ctx) {
+    while(__atomic_exchange_n(&getopt_lock, 1, __ATOMIC_ACQUIRE)) {
+        sched_yield();
+    }
+    optind = 0; // reinitialize, previous scan may have been interrupted
+    opterr = !ctx->quiet;
+}
+
+static void unlock_getopt(void) {
+    optind = 0;
+    __atomic_store_n(&getopt_lock, 0, __ATOMIC_RELEASE);
+}
+
+static int prepare_options(coyaml_context_t *ctx, int argc, char **argv) {
     int opt;
     while((opt = getopt_long(argc, argv,
         ctx->cmdline->optstr, ctx->cmdline->options, NULL)) != -1) {
@@ -42,27 +63,33 @@ int coyaml_cli_prepare(coyaml_context_t *ctx, int argc, char **argv) {
                 }
                 char name[nend - optarg + 1];
                 memcpy(name, optarg, nend - optarg);
-                name[nend - optarg + 1] = 0;
+                name[nend - optarg] = 0;
                 if(coyaml_set_string(ctx, name, nend + 1, strlen(nend+1)))
                     return -1;
                 } break;
             case '?':
-                fprintf(stderr, "%s", ctx->cmdline->usage);
+                if(!ctx->quiet) {
+                    fprintf(stderr, "%s", ctx->cmdline->usage);
+                }
                 errno = ECOYAML_CLI_WRONG_OPTION;
                 return -1;
             default:
                 break;
         }
     }
-    optind = 0;
     return 0;
 }
 
-int coyaml_cli_parse(coyaml_context_t *ctx, int argc, char **argv) {
+int coyaml_cli_prepare(coyaml_context_t *ctx, int argc, char **argv) {
+    lock_getopt(ctx);
+    int res = prepare_options(ctx, argc, argv);
+    unlock_getopt();
+    return res;
+}
+
+static int parse_options(coyaml_context_t *ctx, int argc, char **argv,
+    bool *do_print, bool *do_exit, coyaml_print_enum *print_mode) {
     int opt;
-    bool do_print = 0;
-    bool do_exit = 0;
-    coyaml_print_enum print_mode = COYAML_PRINT_FULL;
     while((opt = getopt_long(argc, argv,
         ctx->cmdline->optstr, ctx->cmdline->options, NULL)) != -1) {
         char *pos = strchr(ctx->cmdline->optstr, opt);
@@ -73,36 +100,54 @@ int coyaml_cli_parse(coyaml_context_t *ctx, int argc, char **argv) {
             coyaml_option_t *o = \
                 &ctx->cmdline->coyaml_options[opt-COYAML_CLI_USER];
             if(o->callback(optarg, o->prop, ctx->target) < 0) {
-                fprintf(stderr, "%s", ctx->cmdline->usage);
+                if(!ctx->quiet) {
+                    fprintf(stderr, "%s", ctx->cmdline->usage);
+                }
                 errno = ECOYAML_CLI_WRONG_OPTION;
                 return -1;
             }
         } else if(opt >= COYAML_CLI_RESERVED) {
             switch(opt) {
             case COYAML_CLI_PRINT:
-                if(do_print) {
-                    print_mode |= COYAML_PRINT_COMMENTS;
+                if(*do_print) {
+                    *print_mode |= COYAML_PRINT_COMMENTS;
                 }
-                do_print = TRUE;
-                do_exit = TRUE;
+                *do_print = TRUE;
+                *do_exit = TRUE;
                 break;
             case COYAML_CLI_CHECK:
-                do_exit = TRUE;
+                *do_exit = TRUE;
                 break;
             }
         } else if(opt >= COYAML_CLI_FIRST) {
             // nothing, was used in coyaml_cli_prepare
         } else {
-            fprintf(stderr, "%s", ctx->cmdline->usage);
+            if(!ctx->quiet) {
+                fprintf(stderr, "%s", ctx->cmdline->usage);
+            }
             errno = ECOYAML_CLI_WRONG_OPTION;
             return -1;
         }
     }
     if(optind != argc && !ctx->cmdline->has_arguments) {
-        fprintf(stderr, "%s", ctx->cmdline->usage);
+        if(!ctx->quiet) {
+            fprintf(stderr, "%s", ctx->cmdline->usage);
+        }
         errno = ECOYAML_CLI_WRONG_OPTION;
         return -1;
     }
+    return 0;
+}
+
+int coyaml_cli_parse(coyaml_context_t *ctx, int argc, char **argv) {
+    bool do_print = 0;
+    bool do_exit = 0;
+    coyaml_print_enum print_mode = COYAML_PRINT_FULL;
+    lock_getopt(ctx);
+    int res = parse_options(ctx, argc, argv,
+        &do_print, &do_exit, &print_mode);
+    unlock_getopt();
+    CHECK(res);
     if(do_print) {
         if(ctx->cmdline->print_callback(stdout, ctx->target, print_mode) < 0) {
             return -1;
@@ -120,9 +165,8 @@ int coyaml_env_parse(coyaml_context_t *ctx) {
         char *value = getenv(var->name);
         if(value) {
             if(var->callback(value, var->prop, ctx->target) < 0) {
-                fprintf(stderr, "Wrong value for environment variable '%s'",
-                    var->name);
-                errno = EINVAL;
+                coyaml_error(ctx, ECOYAML_VALUE_ERROR, NULL, 0, 0,
+                    "Wrong value for environment variable ``%s''", var->name);
                 return -1;
             }
         }
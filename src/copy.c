@@ -11,18 +11,16 @@
 static int copy_group(coyaml_context_t *ctx, coyaml_group_t *group,
     coyaml_marks_t *source, coyaml_marks_t *target)
 {
-    void *src = source->object;
-    void *trg = target->object;
     for(coyaml_transition_t *tr = group->transitions;
         tr && tr->symbol; ++tr) {
         if(tr->prop->type->ident == COYAML_GROUP) {
-            copy_group(ctx, (coyaml_group_t *)tr->prop, source, target);
+            CHECK(copy_group(ctx, (coyaml_group_t *)tr->prop, source, target));
         } else if(tr->prop->flagoffset
             &&  target->filled[tr->prop->flagoffset] <= 0
             &&  source->filled[tr->prop->flagoffset]) {
             CHECK(tr->prop->type->copy(ctx,
-                tr->prop, src,
-                tr->prop, trg));
+                tr->prop, source,
+                tr->prop, target));
             target->filled[tr->prop->flagoffset] = 1;
         }
     }
@@ -38,106 +36,142 @@ int coyaml_copier(coyaml_context_t *ctx, coyaml_usertype_t *def,
 }
 
 int coyaml_custom_copy(coyaml_context_t *ctx,
-    struct coyaml_custom_s *sprop, void *source,
-    struct coyaml_custom_s *tprop, void *target)
+    struct coyaml_custom_s *sprop, coyaml_marks_t *source,
+    struct coyaml_custom_s *tprop, coyaml_marks_t *target)
 {
     COYAML_ASSERT(tprop->usertype->size == sprop->usertype->size);
-    memcpy((char *)target + tprop->baseoffset,
-        (char *)source + sprop->baseoffset,
+    memcpy((char *)target->object + tprop->baseoffset,
+        (char *)source->object + sprop->baseoffset,
         tprop->usertype->size);
     return 0;
 }
 
 int coyaml_array_copy(coyaml_context_t *ctx,
-    struct coyaml_array_s *sprop, void *source,
-    struct coyaml_array_s *tprop, void *target)
+    struct coyaml_array_s *sprop, coyaml_marks_t *source,
+    struct coyaml_array_s *tprop, coyaml_marks_t *target)
 {
-    coyaml_arrayel_head_t *m = REF(target, tprop, coyaml_arrayel_head_t *);
-    for(;m && m->next; m = m->next);
+    if(tprop->layout == COYAML_LAYOUT_CONTIGUOUS) {
+        // Target elements go first, the same as when list is appended
+        size_t tlen = *(size_t *)((char *)target->object
+            + tprop->baseoffset + sizeof(void *));
+        size_t slen = *(size_t *)((char *)source->object
+            + sprop->baseoffset + sizeof(void *));
+        if(!slen) return 0;
+        char *items = obstack_alloc(&ctx->target->pieces,
+            (tlen + slen) * tprop->element_size);
+        if(tlen) {
+            memcpy(items, REF(target->object, tprop, char *),
+                tlen * tprop->element_size);
+        }
+        memcpy(items + tlen * tprop->element_size,
+            REF(source->object, sprop, char *), slen * sprop->element_size);
+        REF(target->object, tprop, char *) = items;
+        *(size_t *)((char *)target->object
+            + tprop->baseoffset + sizeof(void *)) = tlen + slen;
+        return 0;
+    }
+    coyaml_arrayel_head_t *m = target->tails[tprop->flagoffset];
+    if(!m) {
+        // Either list is empty or it was filled bypassing the parser
+        m = REF(target->object, tprop, coyaml_arrayel_head_t *);
+        for(;m && m->next; m = m->next);
+    }
     if(m) {
-        m->next = REF(source, sprop, coyaml_arrayel_head_t *);
+        m->next = REF(source->object, sprop, coyaml_arrayel_head_t *);
     } else {
-        REF(target, tprop, coyaml_arrayel_head_t *) \
-            = REF(source, sprop, coyaml_arrayel_head_t *);
+        REF(target->object, tprop, coyaml_arrayel_head_t *) \
+            = REF(source->object, sprop, coyaml_arrayel_head_t *);
+    }
+    if(source->tails[sprop->flagoffset]) {
+        target->tails[tprop->flagoffset] = source->tails[sprop->flagoffset];
     }
-    LEN(target, tprop, coyaml_arrayel_head_t *) \
-        += LEN(source, sprop, coyaml_arrayel_head_t *);
-    
+    LEN(target->object, tprop, coyaml_arrayel_head_t *) \
+        += LEN(source->object, sprop, coyaml_arrayel_head_t *);
+
     return 0;
 }
 
 int coyaml_mapping_copy(coyaml_context_t *ctx,
-    struct coyaml_mapping_s *sprop, void *source,
-    struct coyaml_mapping_s *tprop, void *target)
+    struct coyaml_mapping_s *sprop, coyaml_marks_t *source,
+    struct coyaml_mapping_s *tprop, coyaml_marks_t *target)
 {
-    coyaml_mappingel_head_t *m = REF(target, tprop, coyaml_mappingel_head_t *);
-    for(;m && m->next; m = m->next);
+    coyaml_mappingel_head_t *m = target->tails[tprop->flagoffset];
+    if(!m) {
+        m = REF(target->object, tprop, coyaml_mappingel_head_t *);
+        for(;m && m->next; m = m->next);
+    }
     if(m) {
-        m->next = REF(source, sprop, coyaml_mappingel_head_t *);
+        m->next = REF(source->object, sprop, coyaml_mappingel_head_t *);
     } else {
-        REF(target, tprop, coyaml_mappingel_head_t *) \
-            = REF(source, sprop, coyaml_mappingel_head_t *);
+        REF(target->object, tprop, coyaml_mappingel_head_t *) \
+            = REF(source->object, sprop, coyaml_mappingel_head_t *);
+    }
+    if(source->tails[sprop->flagoffset]) {
+        target->tails[tprop->flagoffset] = source->tails[sprop->flagoffset];
     }
-    LEN(target, tprop, coyaml_mappingel_head_t *) \
-        += LEN(source, sprop, coyaml_mappingel_head_t *);
+    LEN(target->object, tprop, coyaml_mappingel_head_t *) \
+        += LEN(source->object, sprop, coyaml_mappingel_head_t *);
+    CHECK(coyaml_mapping_reindex(&ctx->target->pieces, tprop,
+        target->object));
     return 0;
 }
 
 int coyaml_int_copy(coyaml_context_t *ctx,
-    struct coyaml_int_s *sprop, void *source,
-    struct coyaml_int_s *tprop, void *target)
+    struct coyaml_int_s *sprop, coyaml_marks_t *source,
+    struct coyaml_int_s *tprop, coyaml_marks_t *target)
 {
-    REF(target, tprop, long) = REF(source, sprop, long);
+    REF(target->object, tprop, long) = REF(source->object, sprop, long);
     return 0;
 }
 
 int coyaml_uint_copy(coyaml_context_t *ctx,
-    struct coyaml_uint_s *sprop, void *source,
-    struct coyaml_uint_s *tprop, void *target)
+    struct coyaml_uint_s *sprop, coyaml_marks_t *source,
+    struct coyaml_uint_s *tprop, coyaml_marks_t *target)
 {
-    REF(target, tprop, unsigned long) = REF(source, sprop, unsigned long);
+    REF(target->object, tprop, unsigned long) \
+        = REF(source->object, sprop, unsigned long);
     return 0;
 }
 
 int coyaml_bool_copy(coyaml_context_t *ctx,
-    struct coyaml_bool_s *sprop, void *source,
-    struct coyaml_bool_s *tprop, void *target)
+    struct coyaml_bool_s *sprop, coyaml_marks_t *source,
+    struct coyaml_bool_s *tprop, coyaml_marks_t *target)
 {
-    REF(target, tprop, bool) = REF(source, sprop, bool);
+    REF(target->object, tprop, bool) = REF(source->object, sprop, bool);
     return 0;
 }
 
 int coyaml_float_copy(coyaml_context_t *ctx,
-    struct coyaml_float_s *sprop, void *source,
-    struct coyaml_float_s *tprop, void *target)
+    struct coyaml_float_s *sprop, coyaml_marks_t *source,
+    struct coyaml_float_s *tprop, coyaml_marks_t *target)
 {
-    REF(target, tprop, float) = REF(source, sprop, float);
+    REF(target->object, tprop, float) = REF(source->object, sprop, float);
     return 0;
 }
 
 int coyaml_dir_copy(coyaml_context_t *ctx,
-    struct coyaml_dir_s *sprop, void *source,
-    struct coyaml_dir_s *tprop, void *target)
+    struct coyaml_dir_s *sprop, coyaml_marks_t *source,
+    struct coyaml_dir_s *tprop, coyaml_marks_t *target)
 {
-    REF(target, tprop, char *) = REF(source, sprop, char *);
-    LEN(target, tprop, char *) = LEN(source, sprop, char *);
+    REF(target->object, tprop, char *) = REF(source->object, sprop, char *);
+    LEN(target->object, tprop, char *) = LEN(source->object, sprop, char *);
     return 0;
 }
 
 int coyaml_file_copy(coyaml_context_t *ctx,
-    struct coyaml_file_s *sprop, void *source,
-    struct coyaml_file_s *tprop, void *target)
+    struct coyaml_file_s *sprop, coyaml_marks_t *source,
+    struct coyaml_file_s *tprop, coyaml_marks_t *target)
 {
-    REF(target, tprop, char *) = REF(source, sprop, char *);
-    LEN(target, tprop, char *) = LEN(source, sprop, char *);
+    REF(target->object, tprop, char *) = REF(source->object, sprop, char *);
+    LEN(target->object, tprop, char *) = LEN(source->object, sprop, char *);
     return 0;
 }
 
 int coyaml_string_copy(coyaml_context_t *ctx,
-    struct coyaml_string_s *sprop, void *source,
-    struct coyaml_string_s *tprop, void *target)
+    struct coyaml_string_s *sprop, coyaml_marks_t *source,
+    struct coyaml_string_s *tprop, coyaml_marks_t *target)
 {
-    REF(target, tprop, char *) = REF(source, sprop, char *);
-    LEN(target, tprop, char *) = LEN(source, sprop, char *);
+    REF(target->object, tprop, char *) = REF(source->object, sprop, char *);
+    LEN(target->object, tprop, char *) = LEN(source->object, sprop, char *);
     return 0;
 }
@@ -82,7 +82,7 @@ int group_emit_impl(coyaml_printctx_t *ctx,
 
     for(coyaml_transition_t *tr = prop->transitions; tr && tr->symbol; ++tr) {
         if(tr->prop->description && ctx->comments) {
-            char buf[strlen("_help_") + strlen(tr->symbol)];
+            char buf[strlen("_help_") + strlen(tr->symbol) + 1];
             strcpy(buf, "_help_");
             strcpy(buf + strlen("_help_"), tr->symbol);
             EMIT_STRING(buf);
@@ -139,10 +139,19 @@ int coyaml_array_emit(coyaml_printctx_t *ctx,
         YAML_BLOCK_SEQUENCE_STYLE));
     CHECK(yaml_emitter_emit(&ctx->emitter, &event));
 
-    for(coyaml_arrayel_head_t *el
-        = *(coyaml_arrayel_head_t **)((char *)target+prop->baseoffset);
-        el; el = el->next) {
-        VISIT(prop->element_prop, el);
+    if(prop->layout == COYAML_LAYOUT_CONTIGUOUS) {
+        char *el = *(char **)((char *)target+prop->baseoffset);
+        size_t len = *(size_t *)((char *)target
+            + prop->baseoffset + sizeof(void *));
+        for(size_t i = 0; i < len; ++i, el += prop->element_size) {
+            VISIT(prop->element_prop, el);
+        }
+    } else {
+        for(coyaml_arrayel_head_t *el
+            = *(coyaml_arrayel_head_t **)((char *)target+prop->baseoffset);
+            el; el = el->next) {
+            VISIT(prop->element_prop, el);
+        }
     }
 
     CHECK(yaml_sequence_end_event_initialize(&event));
@@ -6,20 +6,13 @@
 
 #include "parser.h"
 #include "vars.h"
+#include "hash.h"
 
 #define SYNTAX_ERROR(cond) if(!(cond)) { \
-    fprintf(stderr, "COYAML: Syntax error in config file ``%s'' " \
-        "at line %ld column %ld\n", \
-    info->current_file->filename, info->event.start_mark.line+1, \
-    info->event.start_mark.column); \
-    errno = ECOYAML_SYNTAX_ERROR; \
+    PARSE_ERROR(ECOYAML_SYNTAX_ERROR, "Can't evaluate value"); \
     return -1; }
 #define SYNTAX_ERROR2_NULL(message, ...) if(TRUE) { \
-    fprintf(stderr, "COAYML: Syntax error in config file ``%s'' " \
-        "at line %ld column %ld: " message "\n", \
-    info->current_file->filename, info->event.start_mark.line+1, \
-    info->event.start_mark.column, ##__VA_ARGS__); \
-    errno = ECOYAML_SYNTAX_ERROR; \
+    PARSE_ERROR(ECOYAML_SYNTAX_ERROR, message, ##__VA_ARGS__); \
     return NULL; }
 #define COYAML_DEBUG(message, ...) if(info->debug) { \
     fprintf(stderr, "COYAML: " message "\n", ##__VA_ARGS__); }
@@ -101,24 +94,32 @@ static struct unit_s {
     {NULL, 0},
     };
 
+// Result of variable substitution, reused for the same text until
+// variables or anchors change
+typedef struct coyaml_evalcache_s {
+    struct coyaml_evalcache_s *next; // next in the same bucket
+    unsigned int hash;
+    int epoch;
+    int len;
+    char *result;
+    int rlen;
+    char text[];
+} coyaml_evalcache_t;
+
 static char *find_var(coyaml_parseinfo_t *info, char *name, int nlen) {
     char *data;
     int dlen;
-    char cname[nlen+1];
-    memcpy(cname, name, nlen);
-    cname[nlen] = 0;
-    COYAML_DEBUG("Searching for ``$%s''", cname);
-    if(!coyaml_get_string(info->context, cname, &data, &dlen)) {
+    COYAML_DEBUG("Searching for ``$%.*s''", nlen, name);
+    if(!coyaml_get_string(info->context, name, nlen, &data, &dlen)) {
         return data;
     }
-    for(coyaml_anchor_t *a = info->anchor_first; a; a = a->next) {
-        if(!strncmp(name, a->name, nlen) && strlen(a->name) == nlen) {
-            if(a->events[0].type != YAML_SCALAR_EVENT) {
-                SYNTAX_ERROR2_NULL("You can only substitute a scalar variable,"
-                    " use ``*'' to dereference complex anchors");
-            }
-            return (char *)a->events[0].data.scalar.value;
+    coyaml_anchor_t *a = coyaml_find_anchor(info, name, nlen);
+    if(a) {
+        if(a->events[0].type != YAML_SCALAR_EVENT) {
+            SYNTAX_ERROR2_NULL("You can only substitute a scalar variable,"
+                " use ``*'' to dereference complex anchors");
         }
+        return (char *)a->events[0].data.scalar.value;
     }
     return NULL;
 }
@@ -161,16 +162,26 @@ static void next_tok(eval_context_t *ctx) {
     }
 }
 
+// Units are single letter with optional ``i'' for binary ones, so we check
+// the length first and avoid comparing strings with every unit
+static struct unit_s *find_unit(char *end) {
+    if(end[1] && (end[1] != 'i' || end[2])) return NULL;
+    for(struct unit_s *unit = units; unit->unit; ++unit) {
+        if(unit->unit[0] == end[0] && unit->unit[1] == end[1]) {
+            return unit;
+        }
+    }
+    return NULL;
+}
+
 static char *parse_long(char *value, long *result) {
     char *end;
     long val = strtol(value, (char **)&end, 0);
     if(*end) {
-        for(struct unit_s *unit = units; unit->unit; ++unit) {
-            if(!strcmp(end, unit->unit)) {
-                val *= unit->value;
-                end += strlen(unit->unit);
-                break;
-            }
+        struct unit_s *unit = find_unit(end);
+        if(unit) {
+            val *= unit->value;
+            end += unit->unit[1] ? 2 : 1;
         }
     }
     *result = val;
@@ -181,12 +192,10 @@ static char *parse_double(char *value, double *result) {
     char *end;
     double val = strtod(value, (char **)&end);
     if(*end) {
-        for(struct unit_s *unit = units; unit->unit; ++unit) {
-            if(!strcmp(end, unit->unit)) {
-                val *= unit->value;
-                end += strlen(unit->unit);
-                break;
-            }
+        struct unit_s *unit = find_unit(end);
+        if(unit) {
+            val *= unit->value;
+            end += unit->unit[1] ? 2 : 1;
         }
     }
     *result = val;
@@ -358,16 +367,128 @@ static variable_t *evaluate(coyaml_parseinfo_t *info, char *data, int dlen) {
     return res;
 }
 
+static coyaml_evalcache_t *add_cache_entry(coyaml_parseinfo_t *info,
+    char *data, size_t dlen, unsigned int hash) {
+    if(info->eval_count >= info->eval_table_size) {
+        // Old table is left in obstack, total waste is less than new table
+        int size = info->eval_table_size
+            ? info->eval_table_size * 2 : COYAML_HASH_MIN_SIZE;
+        coyaml_evalcache_t **table = obstack_alloc(&info->evalpieces,
+            size * sizeof(coyaml_evalcache_t *));
+        memset(table, 0, size * sizeof(coyaml_evalcache_t *));
+        for(int i = 0; i < info->eval_table_size; ++i) {
+            for(coyaml_evalcache_t *e = info->eval_table[i], *n; e; e = n) {
+                n = e->next;
+                coyaml_evalcache_t **bucket = &table[
+                    COYAML_HASH_BUCKET(e->hash, size)];
+                e->next = *bucket;
+                *bucket = e;
+            }
+        }
+        info->eval_table = table;
+        info->eval_table_size = size;
+    }
+    coyaml_evalcache_t *entry = obstack_alloc(&info->evalpieces,
+        sizeof(coyaml_evalcache_t) + dlen);
+    memcpy(entry->text, data, dlen);
+    entry->len = dlen;
+    entry->hash = hash;
+    coyaml_evalcache_t **bucket = &info->eval_table[
+        COYAML_HASH_BUCKET(hash, info->eval_table_size)];
+    entry->next = *bucket;
+    *bucket = entry;
+    info->eval_count += 1;
+    return entry;
+}
+
+// Substitutes variables in ``data'', result is owned by the parseinfo
+static int substitute(coyaml_parseinfo_t *info,
+    char *data, size_t dlen, char **result, int *rlen) {
+    unsigned int hash = coyaml_hash(data, dlen);
+    int epoch = info->context->variable_epoch + info->anchor_count;
+    coyaml_evalcache_t *entry = NULL;
+    if(info->eval_table_size) {
+        for(entry = info->eval_table[
+            COYAML_HASH_BUCKET(hash, info->eval_table_size)];
+            entry; entry = entry->next) {
+            if(entry->hash == hash && entry->len == dlen
+                && !memcmp(entry->text, data, dlen)) {
+                break;
+            }
+        }
+    }
+    if(entry && entry->epoch == epoch) {
+        *result = entry->result;
+        *rlen = entry->rlen;
+        return 0;
+    }
+    struct obstack *pieces = &info->evalpieces;
+    obstack_blank(pieces, 0);
+    for(char *c = data; *c;) {
+        size_t span = strcspn(c, "$\\");
+        if(span) {
+            obstack_grow(pieces, c, span);
+            c += span;
+            continue;
+        }
+        if(*c == '\\') {
+            obstack_1grow(pieces, *c);
+            SYNTAX_ERROR(*++c);
+            obstack_1grow(pieces, *c);
+            ++c;
+            continue;
+        }
+        ++c;
+        char *name = c;
+        int nlen;
+        if(*c == '{') {
+            ++c;
+            ++name;
+            while(*++c && *c != '}');
+            nlen = c - name;
+            SYNTAX_ERROR(*c++ == '}');
+            variable_t *var = evaluate(info, name, nlen);
+            SYNTAX_ERROR(var);
+            if(var_to_string(&var)) {
+                free(var);
+                SYNTAX_ERROR(0);
+            }
+            obstack_grow(pieces, var->data.str.value, var->data.str.length);
+            free(var);
+        } else {
+            while(*++c && (isalnum(*c) || *c == '_'));
+            nlen = c - name;
+            char *value = find_var(info, name, nlen);
+            if(value) {
+                obstack_grow(pieces, value, strlen(value));
+            } else {
+                COYAML_DEBUG("Not found variable ``%.*s''", nlen, name);
+            }
+        }
+    }
+    obstack_1grow(pieces, 0);
+    int len = obstack_object_size(pieces)-1;
+    char *res = obstack_finish(pieces);
+    if(!entry) {
+        entry = add_cache_entry(info, data, dlen, hash);
+    }
+    entry->epoch = epoch;
+    entry->result = res;
+    entry->rlen = len;
+    *result = res;
+    *rlen = len;
+    return 0;
+}
+
 int coyaml_eval_int(coyaml_parseinfo_t *info,
     char *value, size_t vlen, long *result) {
-    if(info->parse_vars && strchr(value, '$')) {
+    if(info->parse_vars && memchr(value, '$', vlen)) {
         char *data;
         int dlen;
-        if(coyaml_eval_str(info, value, vlen, &data, &dlen)) {
+        if(substitute(info, value, vlen, &data, &dlen)) {
             return -1;
         }
         char *end = parse_long(data, result);
-        obstack_free(&info->head->pieces, data);
         SYNTAX_ERROR(end == data + dlen);
         return 0;
     }
@@ -378,14 +499,13 @@ int coyaml_eval_int(coyaml_parseinfo_t *info,
 
 int coyaml_eval_float(coyaml_parseinfo_t *info,
     char *value, size_t vlen, double *result) {
-    if(info->parse_vars && strchr(value, '$')) {
+    if(info->parse_vars && memchr(value, '$', vlen)) {
         char *data;
         int dlen;
-        if(coyaml_eval_str(info, value, vlen, &data, &dlen)) {
+        if(substitute(info, value, vlen, &data, &dlen)) {
             return -1;
         }
         char *end = parse_double(data, result);
-        obstack_free(&info->head->pieces, data);
         SYNTAX_ERROR(end == data + dlen);
         return 0;
     }
@@ -396,55 +516,17 @@ int coyaml_eval_float(coyaml_parseinfo_t *info,
 
 int coyaml_eval_str(coyaml_parseinfo_t *info,
     char *data, size_t dlen, char **result, int *rlen) {
-    if(info->parse_vars && strchr(data, '$')) {
-        obstack_blank(&info->head->pieces, 0);
-        for(char *c = data; *c;) {
-            if(*c != '$' && *c != '\\') {
-                obstack_1grow(&info->head->pieces, *c);
-                ++c;
-                continue;
-            }
-            if(*c == '\\') {
-                obstack_1grow(&info->head->pieces, *c);
-                SYNTAX_ERROR(*++c);
-                obstack_1grow(&info->head->pieces, *c);
-                continue;
-            }
-            ++c;
-            char *name = c;
-            int nlen;
-            if(*c == '{') {
-                ++c;
-                ++name;
-                while(*++c && *c != '}');
-                nlen = c - name;
-                SYNTAX_ERROR(*c++ == '}');
-                variable_t *var = evaluate(info, name, nlen);
-                SYNTAX_ERROR(var);
-                if(var_to_string(&var)) {
-                    free(var);
-                    SYNTAX_ERROR(0);
-                }
-                obstack_grow(&info->head->pieces,
-                    var->data.str.value, var->data.str.length);
-                free(var);
-            } else {
-                while(*++c && (isalnum(*c) || *c == '_'));
-                nlen = c - name;
-                char *value = find_var(info, name, nlen);
-                if(value) {
-                    obstack_grow(&info->head->pieces, value, strlen(value));
-                } else {
-                    COYAML_DEBUG("Not found variable ``%.*s''", nlen, name);
-                }
-            }
+    if(info->parse_vars && memchr(data, '$', dlen)) {
+        char *value;
+        int vlen;
+        if(substitute(info, data, dlen, &value, &vlen)) {
+            return -1;
         }
-        obstack_1grow(&info->head->pieces, 0);
-        *rlen = obstack_object_size(&info->head->pieces)-1;
-        *result = obstack_finish(&info->head->pieces);
-    } else {
-        *result = obstack_copy0(&info->head->pieces, data, dlen);
-        *rlen = dlen;
+        *result = obstack_copy0(&info->head->pieces, value, vlen);
+        *rlen = vlen;
+        return 0;
     }
+    *result = obstack_copy0(&info->head->pieces, data, dlen);
+    *rlen = dlen;
     return 0;
 }
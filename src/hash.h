@@ -0,0 +1,20 @@
+#ifndef _H_HASH
+#define _H_HASH
+
+#include <stddef.h>
+
+// FNV-1a, it's good enough for short keys like anchor and variable names
+static inline unsigned int coyaml_hash(const char *data, size_t len) {
+    unsigned int hash = 2166136261u;
+    for(size_t i = 0; i < len; ++i) {
+        hash ^= (unsigned char)data[i];
+        hash *= 16777619u;
+    }
+    return hash;
+}
+
+// Tables are always power of two in size, so bucket is just a bit mask
+#define COYAML_HASH_BUCKET(hash, size) ((hash) & ((size) - 1))
+#define COYAML_HASH_MIN_SIZE 64
+
+#endif //_H_HASH
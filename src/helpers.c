@@ -1,6 +1,8 @@
 #include <unistd.h>
 #include <errno.h>
+#include <string.h>
 #include "coyaml_src.h"
+#include "parser.h"
 
 void coyaml_cli_prepare_or_exit(coyaml_context_t *ctx, int argc, char **argv) {
     if(coyaml_cli_prepare(ctx, argc, argv) < 0) {
@@ -43,3 +45,72 @@ void coyaml_env_parse_or_exit(coyaml_context_t *ctx) {
         exit(1);
     }
 }
+
+// Errors which are reported by errno only: system ones, assertions and
+// command-line handling
+void coyaml_errno_error(coyaml_error_t *err, int code) {
+    memset(err, 0, sizeof(coyaml_error_t));
+    err->code = code;
+    switch(code) {
+        case ECOYAML_ASSERTION_ERROR:
+            strcpy(err->message, "Assertion failed");
+            break;
+        case ECOYAML_CLI_WRONG_OPTION:
+            strcpy(err->message, "Wrong command-line option");
+            break;
+        case ECOYAML_CLI_EXIT:
+            strcpy(err->message, "Exit requested by command-line");
+            break;
+        case ECOYAML_CLI_HELP:
+            strcpy(err->message, "Help requested by command-line");
+            break;
+        default:
+            errno = code;
+            snprintf(err->message, sizeof(err->message), "%m");
+            break;
+    }
+}
+
+int coyaml_load(coyaml_context_t *ctx, int argc, char **argv,
+    coyaml_error_t *err) {
+    if(!ctx) {
+        if(err) {
+            coyaml_errno_error(err, errno);
+        }
+        return -1;
+    }
+    if(err) {
+        ctx->quiet = TRUE;
+    }
+    memset(&ctx->error, 0, sizeof(coyaml_error_t));
+    int res = argc ? coyaml_cli_prepare(ctx, argc, argv) : 0;
+    if(!res) {
+        res = coyaml_readfile(ctx);
+    }
+    if(!res) {
+        res = coyaml_env_parse(ctx);
+    }
+    if(!res && argc) {
+        res = coyaml_cli_parse(ctx, argc, argv);
+    }
+    if(res < 0) {
+        if(!ctx->error.code) {
+            int code = errno;
+            coyaml_errno_error(&ctx->error, code);
+            if(!ctx->quiet && (code > ECOYAML_MAX || code < ECOYAML_MIN)) {
+                fprintf(stderr, "%s: %s\n",
+                    ctx->program_name, ctx->error.message);
+            }
+        }
+        if(err) {
+            *err = ctx->error;
+        }
+        int code = ctx->error.code;
+        coyaml_config_free(ctx->target);
+        coyaml_context_free(ctx);
+        errno = code;
+        return -1;
+    }
+    coyaml_context_free(ctx);
+    return 0;
+}
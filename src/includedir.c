@@ -0,0 +1,577 @@
+#define _GNU_SOURCE
+#include <yaml.h>
+#include <alloca.h>
+#include <errno.h>
+#include <glob.h>
+#include <pthread.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/stat.h>
+#include <sys/fcntl.h>
+#include <sys/mman.h>
+
+#include <coyaml_src.h>
+#include "parser.h"
+#include "snapshot.h"
+
+#define COYAML_INCLUDE_THREADS 16
+#define COYAML_DEBUG(message, ...) if(info->debug) { \
+    fprintf(stderr, "COYAML: " message "\n", ##__VA_ARGS__); }
+
+// File tokenized by the worker, only events of the root node are kept
+typedef struct coyaml_tokenized_s {
+    char *filename;
+    struct stat finfo;
+    yaml_event_t *events;
+    size_t count;
+    int error; // errno value or ECOYAML_SYNTAX_ERROR
+    const char *problem; // static string of libyaml
+    yaml_mark_t mark;
+} coyaml_tokenized_t;
+
+typedef struct coyaml_tokpool_s {
+    coyaml_tokenized_t *files;
+    int count;
+    int next;
+} coyaml_tokpool_t;
+
+static void tokenize_events(coyaml_tokenized_t *file, yaml_parser_t *parser) {
+    size_t alloc = 0;
+    int documents = 0;
+    yaml_event_t event;
+    for(;;) {
+        if(!yaml_parser_parse(parser, &event)) {
+            file->error = ECOYAML_SYNTAX_ERROR;
+            file->problem = parser->problem;
+            file->mark = parser->problem_mark;
+            return;
+        }
+        switch(event.type) {
+            case YAML_STREAM_END_EVENT:
+                yaml_event_delete(&event);
+                return;
+            case YAML_DOCUMENT_START_EVENT:
+                if(documents++) {
+                    file->error = ECOYAML_SYNTAX_ERROR;
+                    file->problem = "only one document is allowed";
+                    file->mark = event.start_mark;
+                    yaml_event_delete(&event);
+                    return;
+                }
+            case YAML_STREAM_START_EVENT:
+            case YAML_DOCUMENT_END_EVENT:
+                yaml_event_delete(&event);
+                continue;
+            default:
+                break;
+        }
+        if(file->count == alloc) {
+            alloc = alloc ? alloc * 2 : 64;
+            yaml_event_t *events = realloc(file->events,
+                alloc * sizeof(yaml_event_t));
+            if(!events) {
+                file->error = ENOMEM;
+                yaml_event_delete(&event);
+                return;
+            }
+            file->events = events;
+        }
+        file->events[file->count++] = event;
+    }
+}
+
+static void tokenize_fd(coyaml_tokenized_t *file, int fd);
+
+static void tokenize(coyaml_tokenized_t *file) {
+    int fd = open(file->filename, O_RDONLY);
+    if(fd < 0) {
+        file->error = errno;
+        return;
+    }
+    tokenize_fd(file, fd);
+    close(fd);
+}
+
+static void tokenize_fd(coyaml_tokenized_t *file, int fd) {
+    char *data;
+    size_t size;
+    int input = coyaml_read_whole(fd, &file->finfo, &data, &size);
+    if(input < 0) {
+        file->error = errno;
+        return;
+    }
+    yaml_parser_t parser;
+    yaml_parser_initialize(&parser);
+    yaml_parser_set_input_string(&parser, (const unsigned char *)data, size);
+    tokenize_events(file, &parser);
+    yaml_parser_delete(&parser);
+    // Events have their own copies of the data
+    if(input == COYAML_INPUT_MMAP) {
+        munmap(data, size);
+    } else if(input == COYAML_INPUT_MALLOC) {
+        free(data);
+    }
+}
+
+static void *tokenize_worker(void *arg) {
+    coyaml_tokpool_t *pool = arg;
+    int i;
+    while((i = __atomic_fetch_add(&pool->next, 1, __ATOMIC_RELAXED))
+        < pool->count) {
+        tokenize(&pool->files[i]);
+    }
+    return NULL;
+}
+
+// Files are distributed dynamically, as they may differ much in size
+static void tokenize_all(coyaml_tokpool_t *pool) {
+    long ncpu = sysconf(_SC_NPROCESSORS_ONLN);
+    int nthreads = pool->count < ncpu ? pool->count : ncpu;
+    if(nthreads > COYAML_INCLUDE_THREADS) {
+        nthreads = COYAML_INCLUDE_THREADS;
+    }
+    pthread_t threads[COYAML_INCLUDE_THREADS];
+    int started = 0;
+    // Current thread is one of the workers
+    while(started < nthreads - 1 && !pthread_create(&threads[started], NULL,
+        tokenize_worker, pool)) {
+        ++started;
+    }
+    tokenize_worker(pool);
+    for(int i = 0; i < started; ++i) {
+        pthread_join(threads[i], NULL);
+    }
+}
+
+static void free_tokenized(coyaml_tokpool_t *pool) {
+    for(int i = 0; i < pool->count; ++i) {
+        coyaml_tokenized_t *file = &pool->files[i];
+        for(size_t j = 0; j < file->count; ++j) {
+            yaml_event_delete(&file->events[j]);
+        }
+        free(file->events);
+    }
+    free(pool->files);
+}
+
+static int compare_names(const void *a, const void *b) {
+    return strcmp(*(char **)a, *(char **)b);
+}
+
+// Empty file, or the one containing only null, adds nothing. Null is
+// any spelling allowed by YAML core schema: "", ~, null, Null or NULL
+static bool is_empty(coyaml_tokenized_t *file) {
+    if(!file->count) return TRUE;
+    yaml_event_t *ev = &file->events[0];
+    if(ev->type != YAML_SCALAR_EVENT || ev->data.scalar.tag
+        || !ev->data.scalar.plain_implicit) {
+        return FALSE;
+    }
+    const char *value = (const char *)ev->data.scalar.value;
+    return !ev->data.scalar.length
+        || !strcmp(value, "~")
+        || !strcmp(value, "null")
+        || !strcmp(value, "Null")
+        || !strcmp(value, "NULL");
+}
+
+static int check_files(coyaml_parseinfo_t *info, coyaml_tokpool_t *pool,
+    yaml_event_type_t *kind) {
+    coyaml_context_t *ctx = info->context;
+    char *first = NULL;
+    for(int i = 0; i < pool->count; ++i) {
+        coyaml_tokenized_t *file = &pool->files[i];
+        if(file->error == ECOYAML_SYNTAX_ERROR) {
+            coyaml_error(ctx, ECOYAML_SYNTAX_ERROR, file->filename,
+                file->mark.line+1, file->mark.column, "%s",
+                file->problem ? file->problem : "Can't parse YAML");
+            return -1;
+        } else if(file->error) {
+            errno = file->error;
+            coyaml_error(ctx, ECOYAML_VALUE_ERROR, file->filename, 0, 0,
+                "Can't read file: %m");
+            return -1;
+        }
+        if(is_empty(file)) continue;
+        yaml_event_t *root = &file->events[0];
+        if(root->type != YAML_MAPPING_START_EVENT
+            && root->type != YAML_SEQUENCE_START_EVENT) {
+            coyaml_error(ctx, ECOYAML_SYNTAX_ERROR, file->filename,
+                root->start_mark.line+1, root->start_mark.column,
+                "Included file must contain mapping or sequence");
+            return -1;
+        }
+        if(!first) {
+            first = file->filename;
+            *kind = root->type;
+        } else if(root->type != *kind) {
+            coyaml_error(ctx, ECOYAML_SYNTAX_ERROR, file->filename,
+                root->start_mark.line+1, root->start_mark.column,
+                "Included file must contain %s like ``%s''",
+                *kind == YAML_MAPPING_START_EVENT ? "mapping" : "sequence",
+                first);
+            return -1;
+        }
+    }
+    return 0;
+}
+
+static void set_fragment(coyaml_context_t *ctx, coyaml_fragment_t *frag,
+    const char *filename, size_t first) {
+    frag->first = first;
+    frag->filename = obstack_copy0(&ctx->pieces, filename, strlen(filename));
+    const char *suffix = strrchr(filename, '/');
+    frag->basedir_len = suffix ? suffix - filename + 1 : 0;
+    frag->basedir = obstack_copy0(&ctx->pieces, filename, frag->basedir_len);
+}
+
+static void init_stack(coyaml_stack_t *stack, yaml_event_t *events,
+    size_t count, coyaml_fragment_t *frags, int nfrags) {
+    memset(stack, 0, sizeof(coyaml_stack_t));
+    stack->input = COYAML_INPUT_EVENTS;
+    stack->events = events;
+    stack->events_count = count;
+    stack->fragments = frags;
+    stack->fragments_count = nfrags;
+    stack->filename = frags[0].filename;
+    stack->basedir = frags[0].basedir;
+    stack->basedir_len = frags[0].basedir_len;
+}
+
+// Root nodes of all files are joined into a single node, in the stream
+// looking like a single included file, so the rest of the parser doesn't
+// see a difference with including the files one by one
+static coyaml_stack_t *join_files(coyaml_parseinfo_t *info,
+    coyaml_tokpool_t *pool, const char *pattern, yaml_event_type_t kind) {
+    coyaml_context_t *ctx = info->context;
+    size_t total = 6; // stream, document and root node for no files
+    int nfrags = pool->count + 2; // also for the head and the tail
+    for(int i = 0; i < pool->count; ++i) {
+        total += pool->files[i].count;
+    }
+    coyaml_stack_t *res = malloc(sizeof(coyaml_stack_t));
+    yaml_event_t *events = malloc(total * sizeof(yaml_event_t));
+    if(!res || !events) {
+        free(res);
+        free(events);
+        return NULL;
+    }
+    coyaml_fragment_t *frags = obstack_alloc(&ctx->pieces,
+        nfrags * sizeof(coyaml_fragment_t));
+    size_t n = 0;
+    int f = 0;
+    set_fragment(ctx, &frags[f++], pattern, 0);
+    yaml_stream_start_event_initialize(&events[n++], YAML_UTF8_ENCODING);
+    yaml_document_start_event_initialize(&events[n++], NULL, NULL, NULL, 1);
+    bool started = FALSE;
+    for(int i = 0; i < pool->count; ++i) {
+        coyaml_tokenized_t *file = &pool->files[i];
+        if(is_empty(file)) continue;
+        set_fragment(ctx, &frags[f++], file->filename, n);
+        // Root node of the first file starts joined node, other
+        // files contribute only the contents of their root node
+        if(!started) {
+            events[n++] = file->events[0];
+            started = TRUE;
+        } else {
+            yaml_event_delete(&file->events[0]);
+        }
+        memcpy(&events[n], &file->events[1],
+            (file->count - 2) * sizeof(yaml_event_t));
+        n += file->count - 2;
+        yaml_event_delete(&file->events[file->count-1]);
+        file->count = 0; // ownership of events is moved
+    }
+    if(!started) { // no files or all are empty
+        yaml_mapping_start_event_initialize(&events[n++], NULL, NULL, 1,
+            YAML_BLOCK_MAPPING_STYLE);
+    }
+    set_fragment(ctx, &frags[f++], pattern, n);
+    if(kind == YAML_SEQUENCE_START_EVENT) {
+        yaml_sequence_end_event_initialize(&events[n++]);
+    } else {
+        yaml_mapping_end_event_initialize(&events[n++]);
+    }
+    yaml_document_end_event_initialize(&events[n++], 1);
+    yaml_stream_end_event_initialize(&events[n++]);
+
+    init_stack(res, events, n, frags, f);
+    res->empty = !started;
+    return res;
+}
+
+coyaml_stack_t *coyaml_open_dir(coyaml_parseinfo_t *info,
+    const char *pattern) {
+    coyaml_context_t *ctx = info->context;
+    struct stat finfo;
+    int plen = strlen(pattern);
+    char *globpat = alloca(plen + sizeof("/*.yaml"));
+    strcpy(globpat, pattern);
+    char *dirname = alloca(plen + 1);
+    if(!stat(pattern, &finfo) && S_ISDIR(finfo.st_mode)) {
+        // Directory itself is a source, as adding a file changes its mtime
+        strcpy(dirname, pattern);
+        strcpy(globpat + plen, "/*.yaml");
+    } else {
+        char *suffix = strrchr(pattern, '/');
+        int dlen = suffix ? suffix - pattern : 1;
+        memcpy(dirname, suffix ? pattern : ".", dlen);
+        dirname[dlen] = 0;
+        if(strpbrk(dirname, "*?[")) {
+            dirname = NULL;
+        } else if(stat(dirname, &finfo) < 0) {
+            PARSE_ERROR(ECOYAML_VALUE_ERROR, "Can't open directory ``%s'': %m",
+                dirname);
+            return NULL;
+        }
+    }
+    if(dirname) {
+        coyaml_add_source(ctx, dirname, &finfo);
+    }
+
+    glob_t gl;
+    // Sorted by strcmp below, to not depend on the locale
+    int rc = glob(globpat, GLOB_NOSORT|GLOB_ERR, NULL, &gl);
+    if(rc && rc != GLOB_NOMATCH) {
+        globfree(&gl);
+        PARSE_ERROR(ECOYAML_VALUE_ERROR, "Can't list files ``%s''", globpat);
+        return NULL;
+    }
+    size_t count = rc ? 0 : gl.gl_pathc;
+    if(count) {
+        // gl_pathv is NULL when nothing matched
+        qsort(gl.gl_pathv, count, sizeof(char *), compare_names);
+    }
+    coyaml_tokpool_t pool = {
+        .files = calloc(count ? count : 1, sizeof(coyaml_tokenized_t)),
+        .count = count,
+        .next = 0,
+        };
+    if(!pool.files) {
+        globfree(&gl);
+        return NULL;
+    }
+    for(size_t i = 0; i < count; ++i) {
+        pool.files[i].filename = gl.gl_pathv[i];
+    }
+    tokenize_all(&pool);
+
+    coyaml_stack_t *res = NULL;
+    yaml_event_type_t kind = YAML_MAPPING_START_EVENT;
+    if(!check_files(info, &pool, &kind)) {
+        for(size_t i = 0; i < count; ++i) {
+            coyaml_add_source(ctx, pool.files[i].filename,
+                &pool.files[i].finfo);
+        }
+        res = join_files(info, &pool, pattern, kind);
+        if(!res) {
+            PARSE_ERROR(ECOYAML_VALUE_ERROR, "Can't include ``%s'': %m",
+                pattern);
+        }
+    }
+    free_tokenized(&pool);
+    globfree(&gl);
+    return res;
+}
+
+// Included file is tokenized once per parse. Events of the first include
+// are moved to the stack, and are kept for the following ones only if the
+// file is included again, because parser takes ownership of the events
+typedef struct coyaml_inclcache_s {
+    struct coyaml_inclcache_s *next;
+    dev_t dev;
+    ino_t ino;
+    yaml_event_t *events; // root node only, NULL until second include
+    size_t count;
+} coyaml_inclcache_t;
+
+static yaml_char_t *copy_string(yaml_char_t *src, size_t len) {
+    yaml_char_t *res = malloc(len + 1);
+    if(res) {
+        memcpy(res, src, len + 1);
+    }
+    return res;
+}
+
+#define COPY_STRING(field, len) if(src->field) { \
+    dst->field = copy_string(src->field, (len)); \
+    if(!dst->field) goto error; }
+
+static int copy_event(yaml_event_t *dst, yaml_event_t *src) {
+    *dst = *src;
+    // Only events of nodes are cached, they don't have other pointers
+    switch(src->type) {
+        case YAML_ALIAS_EVENT:
+            dst->data.alias.anchor = NULL;
+            COPY_STRING(data.alias.anchor,
+                strlen((char *)src->data.alias.anchor));
+            break;
+        case YAML_SCALAR_EVENT:
+            dst->data.scalar.anchor = NULL;
+            dst->data.scalar.tag = NULL;
+            dst->data.scalar.value = NULL;
+            COPY_STRING(data.scalar.anchor,
+                strlen((char *)src->data.scalar.anchor));
+            COPY_STRING(data.scalar.tag,
+                strlen((char *)src->data.scalar.tag));
+            COPY_STRING(data.scalar.value, src->data.scalar.length);
+            break;
+        case YAML_SEQUENCE_START_EVENT:
+            dst->data.sequence_start.anchor = NULL;
+            dst->data.sequence_start.tag = NULL;
+            COPY_STRING(data.sequence_start.anchor,
+                strlen((char *)src->data.sequence_start.anchor));
+            COPY_STRING(data.sequence_start.tag,
+                strlen((char *)src->data.sequence_start.tag));
+            break;
+        case YAML_MAPPING_START_EVENT:
+            dst->data.mapping_start.anchor = NULL;
+            dst->data.mapping_start.tag = NULL;
+            COPY_STRING(data.mapping_start.anchor,
+                strlen((char *)src->data.mapping_start.anchor));
+            COPY_STRING(data.mapping_start.tag,
+                strlen((char *)src->data.mapping_start.tag));
+            break;
+        default:
+            break;
+    }
+    return 0;
+error:
+    yaml_event_delete(dst);
+    return -1;
+}
+
+static void free_events(yaml_event_t *events, size_t count) {
+    for(size_t i = 0; i < count; ++i) {
+        yaml_event_delete(&events[i]);
+    }
+    free(events);
+}
+
+static coyaml_inclcache_t *find_cached(coyaml_parseinfo_t *info,
+    struct stat *finfo) {
+    for(coyaml_inclcache_t *c = info->include_cache; c; c = c->next) {
+        if(c->ino == finfo->st_ino && c->dev == finfo->st_dev) {
+            return c;
+        }
+    }
+    return NULL;
+}
+
+static int tokenize_include(coyaml_parseinfo_t *info, const char *filename,
+    int fd, coyaml_tokenized_t *file) {
+    file->filename = (char *)filename;
+    tokenize_fd(file, fd);
+    if(file->error == ECOYAML_SYNTAX_ERROR) {
+        coyaml_error(info->context, ECOYAML_SYNTAX_ERROR, filename,
+            file->mark.line+1, file->mark.column, "%s",
+            file->problem ? file->problem : "Can't parse YAML");
+    } else if(file->error) {
+        errno = file->error;
+        PARSE_ERROR(ECOYAML_VALUE_ERROR, "Can't read file ``%s'': %m",
+            filename);
+    } else if(!file->count) {
+        PARSE_ERROR(ECOYAML_SYNTAX_ERROR, "Included file ``%s'' is empty",
+            filename);
+    } else {
+        return 0;
+    }
+    free_events(file->events, file->count);
+    return -1;
+}
+
+coyaml_stack_t *coyaml_open_include(coyaml_parseinfo_t *info,
+    const char *filename) {
+    coyaml_context_t *ctx = info->context;
+    int fd = open(filename, O_RDONLY);
+    struct stat finfo;
+    if(fd < 0 || fstat(fd, &finfo) < 0) {
+        if(fd >= 0) {
+            close(fd);
+        }
+        PARSE_ERROR(ECOYAML_VALUE_ERROR, "Can't open file ``%s''", filename);
+        return NULL;
+    }
+    coyaml_inclcache_t *cached = find_cached(info, &finfo);
+    coyaml_tokenized_t file = { .events = NULL, .count = 0 };
+    if(cached && cached->events) {
+        info->include_hits += 1;
+        COYAML_DEBUG("Include cache hit ``%s''", filename);
+    } else if(tokenize_include(info, filename, fd, &file) < 0) {
+        close(fd);
+        return NULL;
+    } else if(cached) {
+        // Included second time, events are copied from now on
+        cached->events = file.events;
+        cached->count = file.count;
+        file.events = NULL;
+    } else {
+        // Not in `info->anchors`, include may be found inside an anchor,
+        // while the anchor is still growing there
+        cached = malloc(sizeof(coyaml_inclcache_t));
+        if(!cached) {
+            close(fd);
+            free_events(file.events, file.count);
+            PARSE_ERROR(ECOYAML_VALUE_ERROR, "Can't include ``%s'': %m",
+                filename);
+            return NULL;
+        }
+        cached->dev = finfo.st_dev;
+        cached->ino = finfo.st_ino;
+        cached->events = NULL;
+        cached->count = file.count;
+        cached->next = info->include_cache;
+        info->include_cache = cached;
+        coyaml_add_source(ctx, filename, &finfo);
+    }
+    close(fd);
+
+    coyaml_stack_t *res = malloc(sizeof(coyaml_stack_t));
+    yaml_event_t *events = malloc((cached->count + 4) * sizeof(yaml_event_t));
+    if(!res || !events) {
+        free(res);
+        free(events);
+        free_events(file.events, file.count);
+        PARSE_ERROR(ECOYAML_VALUE_ERROR, "Can't include ``%s'': %m",
+            filename);
+        return NULL;
+    }
+    size_t n = 0;
+    yaml_stream_start_event_initialize(&events[n++], YAML_UTF8_ENCODING);
+    yaml_document_start_event_initialize(&events[n++], NULL, NULL, NULL, 1);
+    if(file.events) {
+        // Ownership of events is moved to the stack
+        memcpy(&events[n], file.events, file.count * sizeof(yaml_event_t));
+        n += file.count;
+        free(file.events);
+    } else {
+        for(size_t i = 0; i < cached->count; ++i, ++n) {
+            if(copy_event(&events[n], &cached->events[i]) < 0) {
+                free_events(events, n);
+                free(res);
+                PARSE_ERROR(ECOYAML_VALUE_ERROR, "Can't include ``%s'': %m",
+                    filename);
+                return NULL;
+            }
+        }
+    }
+    yaml_document_end_event_initialize(&events[n++], 1);
+    yaml_stream_end_event_initialize(&events[n++]);
+    coyaml_fragment_t *frag = obstack_alloc(&ctx->pieces,
+        sizeof(coyaml_fragment_t));
+    set_fragment(ctx, frag, filename, 0);
+    init_stack(res, events, n, frag, 1);
+    return res;
+}
+
+void coyaml_free_include_cache(coyaml_parseinfo_t *info) {
+    for(coyaml_inclcache_t *c = info->include_cache, *next; c; c = next) {
+        next = c->next;
+        if(c->events) {
+            free_events(c->events, c->count);
+        }
+        free(c);
+    }
+    info->include_cache = NULL;
+}
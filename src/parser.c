@@ -6,9 +6,11 @@
 #include <sys/types.h>
 #include <sys/stat.h>
 #include <sys/fcntl.h>
+#include <sys/mman.h>
 #include <unistd.h>
 #include <alloca.h>
 #include <ctype.h>
+#include <stdarg.h>
 
 #include <coyaml_src.h>
 #include "vars.h"
@@ -16,33 +18,21 @@
 #include "util.h"
 #include "copy.h"
 #include "eval.h"
+#include "hash.h"
+#include "snapshot.h"
 
 #define SYNTAX_ERROR(cond) if(!(cond)) { \
-    fprintf(stderr, "COYAML: Syntax error in config file ``%s'' " \
-        "at line %ld column %ld\n", \
-    info->current_file->filename, info->event.start_mark.line+1, \
-    info->event.start_mark.column); \
-    errno = ECOYAML_SYNTAX_ERROR; \
+    PARSE_ERROR(ECOYAML_SYNTAX_ERROR, "Unexpected %s", \
+        yaml_event_names[info->event.type]); \
     return -1; }
 #define SYNTAX_ERROR2(message, ...) if(TRUE) { \
-    fprintf(stderr, "COAYML: Syntax error in config file ``%s'' " \
-        "at line %ld column %ld: " message "\n", \
-    info->current_file->filename, info->event.start_mark.line+1, \
-    info->event.start_mark.column, ##__VA_ARGS__); \
-    errno = ECOYAML_SYNTAX_ERROR; \
+    PARSE_ERROR(ECOYAML_SYNTAX_ERROR, message, ##__VA_ARGS__); \
     return -1; }
 #define SYNTAX_ERROR2_NULL(message, ...) if(TRUE) { \
-    fprintf(stderr, "COAYML: Syntax error in config file ``%s'' " \
-        "at line %d column %d: " message "\n", \
-    info->current_file->filename, info->event.start_mark.line+1, \
-    info->event.start_mark.column, ##__VA_ARGS__); \
-    errno = ECOYAML_SYNTAX_ERROR; \
+    PARSE_ERROR(ECOYAML_SYNTAX_ERROR, message, ##__VA_ARGS__); \
     return NULL; }
 #define VALUE_ERROR(cond, message, ...) if(!(cond)) { \
-    fprintf(stderr, "COYAML: Error at %s:%ld[%ld]: " message "\n", \
-    info->current_file->filename, info->event.start_mark.line+1, \
-    info->event.start_mark.column, ##__VA_ARGS__); \
-    errno = ECOYAML_VALUE_ERROR; \
+    PARSE_ERROR(ECOYAML_VALUE_ERROR, message, ##__VA_ARGS__); \
     return -1; }
 #define COYAML_DEBUG(message, ...) if(info->debug) { \
     fprintf(stderr, "COYAML: " message "\n", ##__VA_ARGS__); }
@@ -54,6 +44,9 @@
     COYAML_ASSERT(!((info)->top_mark->filled[(def)->flagoffset])); \
     (info)->top_mark->filled[(def)->flagoffset] = -1; \
     }
+#define SETTAIL(info, def, tail) if((info)->top_mark && (def)->flagoffset) { \
+    (info)->top_mark->tails[(def)->flagoffset] = (tail); \
+    }
 
 static char *yaml_event_names[] = {
     "YAML_NO_EVENT",
@@ -97,29 +90,71 @@ static int coyaml_skip(coyaml_parseinfo_t *info) {
 }
 
 
-static coyaml_anchor_t *find_anchor(coyaml_parseinfo_t *info, char *name) {
-    for(coyaml_anchor_t *a = info->anchor_first; a; a = a->next) {
-        if(!strcmp(name, a->name)) {
+coyaml_anchor_t *coyaml_find_anchor(coyaml_parseinfo_t *info,
+    const char *name, int len) {
+    if(!info->anchor_table_size) return NULL;
+    unsigned int hash = coyaml_hash(name, len);
+    for(coyaml_anchor_t *a = info->anchor_table[
+        COYAML_HASH_BUCKET(hash, info->anchor_table_size)];
+        a; a = a->hash_next) {
+        if(a->hash == hash && !strncmp(name, a->name, len) && !a->name[len]) {
             return a;
         }
     }
     return NULL;
 }
 
-static coyaml_stack_t *open_file(coyaml_parseinfo_t *info, char *filename) {
+static void index_anchor(coyaml_parseinfo_t *info, coyaml_anchor_t *anchor) {
+    coyaml_anchor_t **bucket = &info->anchor_table[
+        COYAML_HASH_BUCKET(anchor->hash, info->anchor_table_size)];
+    anchor->hash_next = NULL;
+    for(coyaml_anchor_t *a = *bucket; a; a = a->hash_next) {
+        if(a->hash == anchor->hash && !strcmp(a->name, anchor->name)) {
+            return; // first definition wins, as it always did
+        }
+    }
+    anchor->hash_next = *bucket;
+    *bucket = anchor;
+}
+
+static void add_anchor(coyaml_parseinfo_t *info, coyaml_anchor_t *anchor) {
+    anchor->next = NULL;
+    if(info->anchor_last) {
+        info->anchor_last->next = anchor;
+        info->anchor_last = anchor;
+    } else {
+        info->anchor_first = info->anchor_last = anchor;
+    }
+    info->anchor_count += 1;
+    if(info->anchor_count > info->anchor_table_size) {
+        // Old table is left in obstack, total waste is less than new table
+        int size = info->anchor_table_size
+            ? info->anchor_table_size * 2 : COYAML_HASH_MIN_SIZE;
+        info->anchor_table = obstack_alloc(&info->anchors,
+            size * sizeof(coyaml_anchor_t *));
+        memset(info->anchor_table, 0, size * sizeof(coyaml_anchor_t *));
+        info->anchor_table_size = size;
+        for(coyaml_anchor_t *a = info->anchor_first; a; a = a->next) {
+            index_anchor(info, a);
+        }
+    } else {
+        index_anchor(info, anchor);
+    }
+}
+
+static coyaml_stack_t *open_buffer(coyaml_parseinfo_t *info,
+    const char *filename, const char *data, size_t size) {
     coyaml_stack_t *res = malloc(sizeof(coyaml_stack_t)+strlen(filename)+1);
     if(!res) return NULL;
-    COYAML_DEBUG("Opening file ``%s''", filename);
-    res->file = fopen(filename, "r");
-    if(!res->file) {
-        free(res);
-        return NULL;
-    }
+    res->input = COYAML_INPUT_BUFFER;
+    res->data = data;
+    res->size = size;
     yaml_parser_initialize(&res->parser);
-    yaml_parser_set_input_file(&res->parser, res->file);
+    yaml_parser_set_input_string(&res->parser,
+        (const unsigned char *)data, size);
     res->filename = (char *)res + sizeof(coyaml_stack_t);
     strcpy(res->filename, filename);
-    char *suffix = strrchr(filename, '/');
+    const char *suffix = strrchr(filename, '/');
     if(suffix) {
         res->basedir_len = suffix - filename + 1;
         res->basedir = obstack_alloc(&info->context->pieces,res->basedir_len+1);
@@ -134,7 +169,88 @@ static coyaml_stack_t *open_file(coyaml_parseinfo_t *info, char *filename) {
     return res;
 }
 
-static int mapping_next(coyaml_parseinfo_t *info);
+int coyaml_read_whole(int fd, struct stat *finfo, char **data, size_t *size) {
+    if(fstat(fd, finfo) < 0) return -1;
+    if(S_ISREG(finfo->st_mode)) {
+        *size = finfo->st_size;
+        if(!finfo->st_size) {
+            *data = "";
+            return COYAML_INPUT_BUFFER;
+        }
+        *data = mmap(NULL, finfo->st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+        if(*data != MAP_FAILED) return COYAML_INPUT_MMAP;
+    }
+    size_t alloc = 4096;
+    size_t len = 0;
+    char *buf = malloc(alloc);
+    if(!buf) return -1;
+    for(;;) {
+        if(len == alloc) {
+            alloc *= 2;
+            char *nbuf = realloc(buf, alloc);
+            if(!nbuf) {
+                free(buf);
+                return -1;
+            }
+            buf = nbuf;
+        }
+        ssize_t got = read(fd, buf + len, alloc - len);
+        if(got < 0) {
+            if(errno == EINTR) continue;
+            free(buf);
+            return -1;
+        }
+        if(!got) break;
+        len += got;
+    }
+    *data = buf;
+    *size = len;
+    return COYAML_INPUT_MALLOC;
+}
+
+static coyaml_stack_t *open_file(coyaml_parseinfo_t *info,
+    const char *filename) {
+    COYAML_DEBUG("Opening file ``%s''", filename);
+    int fd = open(filename, O_RDONLY);
+    if(fd < 0) return NULL;
+    struct stat finfo;
+    char *data;
+    size_t size;
+    int input = coyaml_read_whole(fd, &finfo, &data, &size);
+    close(fd);
+    if(input < 0) return NULL;
+    coyaml_add_source(info->context, filename, &finfo);
+    coyaml_stack_t *res = open_buffer(info, filename, data, size);
+    if(!res) {
+        if(input == COYAML_INPUT_MMAP) {
+            munmap(data, size);
+        } else if(input == COYAML_INPUT_MALLOC) {
+            free(data);
+        }
+        return NULL;
+    }
+    res->input = input;
+    return res;
+}
+
+static void close_file(coyaml_stack_t *stack) {
+    if(stack->input == COYAML_INPUT_EVENTS) {
+        for(size_t i = stack->events_pos; i < stack->events_count; ++i) {
+            yaml_event_delete(&stack->events[i]);
+        }
+        free(stack->events);
+        free(stack);
+        return;
+    }
+    yaml_parser_delete(&stack->parser);
+    if(stack->input == COYAML_INPUT_MMAP) {
+        munmap((void *)stack->data, stack->size);
+    } else if(stack->input == COYAML_INPUT_MALLOC) {
+        free((void *)stack->data);
+    }
+    free(stack);
+}
+
 static int anchor_next(coyaml_parseinfo_t *info);
 static int alias_next(coyaml_parseinfo_t *info);
 
@@ -144,7 +260,8 @@ static int unpack_anchor(coyaml_parseinfo_t *info) {
     if(info->event.type == YAML_NO_EVENT) {
         info->anchor_pos = -1;
         info->anchor_unpacking = NULL;
-        return mapping_next(info);
+        // Caller handles anchors and merges of the next event as usual
+        return alias_next(info);
     } else {
         info->anchor_pos += 1;
         if(info->event.type == YAML_SCALAR_EVENT) {
@@ -165,7 +282,28 @@ static int plain_next(coyaml_parseinfo_t *info) {
     if(info->event.type && !info->anchor_unpacking && info->anchor_level < 0) {
         yaml_event_delete(&info->event);
     }
-    COYAML_ASSERT(yaml_parser_parse(&info->current_file->parser, &info->event));
+    coyaml_stack_t *cur = info->current_file;
+    if(cur->input == COYAML_INPUT_EVENTS) {
+        COYAML_ASSERT(cur->events_pos < cur->events_count);
+        // Ownership of event is moved, it's deleted as usual
+        info->event = cur->events[cur->events_pos++];
+        while(cur->fragment + 1 < cur->fragments_count
+            && cur->fragments[cur->fragment + 1].first < cur->events_pos) {
+            coyaml_fragment_t *frag = &cur->fragments[++cur->fragment];
+            cur->filename = frag->filename;
+            cur->basedir = frag->basedir;
+            cur->basedir_len = frag->basedir_len;
+        }
+        return 0;
+    }
+    yaml_parser_t *parser = &cur->parser;
+    if(!yaml_parser_parse(parser, &info->event)) {
+        coyaml_error(info->context, ECOYAML_SYNTAX_ERROR,
+            info->current_file->filename, parser->problem_mark.line+1,
+            parser->problem_mark.column, "%s",
+            parser->problem ? parser->problem : "Can't parse YAML");
+        return -1;
+    }
     if(info->event.type == YAML_SCALAR_EVENT) {
         COYAML_DEBUG("Low-level event %s[%u] (%.*s)",
             yaml_event_names[info->event.type], info->event.type,
@@ -182,9 +320,10 @@ static int plain_next(coyaml_parseinfo_t *info) {
 static int include_next(coyaml_parseinfo_t *info) {
     CHECK(plain_next(info));
     switch(info->event.type) {
-        case YAML_SCALAR_EVENT:
-            if(info->event.data.scalar.tag
-                && !strcmp((char *)info->event.data.scalar.tag, "!Include")) {
+        case YAML_SCALAR_EVENT: {
+            char *tag = (char *)info->event.data.scalar.tag;
+            bool dir = tag && !strcmp(tag, "!IncludeDir");
+            if(dir || (tag && !strcmp(tag, "!Include"))) {
                 char *fn = (char *)info->event.data.scalar.value;
                 SYNTAX_ERROR(*fn);
                 if(*fn != '/') {
@@ -194,11 +333,20 @@ static int include_next(coyaml_parseinfo_t *info) {
                     strcpy(fn + info->current_file->basedir_len,
                         (char *)info->event.data.scalar.value);
                 }
-                coyaml_stack_t *cur = open_file(info, fn);
-                VALUE_ERROR(cur, "Can't open file ``%s''", fn);
+                coyaml_stack_t *cur;
+                if(dir) {
+                    cur = coyaml_open_dir(info, fn);
+                } else {
+                    cur = coyaml_open_include(info, fn);
+                }
+                if(!cur) return -1; // already reported
                 cur->prev = info->current_file;
                 info->current_file->next = cur;
                 info->current_file = cur;
+                if(info->anchor_level >= 0) {
+                    // Not packed into anchor and not deleted by plain_next
+                    yaml_event_delete(&info->event);
+                }
 
                 CHECK(plain_next(info));
                 SYNTAX_ERROR(info->event.type == YAML_STREAM_START_EVENT);
@@ -206,17 +354,15 @@ static int include_next(coyaml_parseinfo_t *info) {
                 SYNTAX_ERROR(info->event.type == YAML_DOCUMENT_START_EVENT);
                 return plain_next(info);
             }
-            break;
+            } break;
         case YAML_DOCUMENT_END_EVENT:
             if(info->current_file != info->root_file) {
                 coyaml_stack_t *cur = info->current_file;
                 CHECK(plain_next(info));
                 SYNTAX_ERROR(info->event.type == YAML_STREAM_END_EVENT);
-                yaml_parser_delete(&cur->parser);
-                fclose(cur->file);
                 info->current_file = cur->prev;
                 info->current_file->next = NULL;
-                free(cur);
+                close_file(cur);
                 return plain_next(info);
             }
             break;
@@ -232,8 +378,9 @@ static int alias_next(coyaml_parseinfo_t *info) {
     }
     CHECK(include_next(info));
     if(info->event.type == YAML_ALIAS_EVENT) {
-        coyaml_anchor_t *anch = find_anchor(info,
-            (char *)info->event.data.alias.anchor);
+        coyaml_anchor_t *anch = coyaml_find_anchor(info,
+            (char *)info->event.data.alias.anchor,
+            strlen((char *)info->event.data.alias.anchor));
         if(anch) {
             info->anchor_pos = 0;
             info->anchor_unpacking = anch;
@@ -268,13 +415,16 @@ static int anchor_next(coyaml_parseinfo_t *info) {
         case YAML_SCALAR_EVENT:
             if(info->event.data.scalar.anchor) {
                 info->anchor_level += 1;
+                int len = strlen((char *)info->event.data.scalar.anchor);
                 char *name = obstack_copy0(&info->anchors,
-                    info->event.data.scalar.anchor,
-                    strlen((char *)info->event.data.scalar.anchor));
+                    info->event.data.scalar.anchor, len);
                 COYAML_DEBUG("Found anchor ``%s''", name);
                 obstack_blank(&info->anchors, sizeof(coyaml_anchor_t));
                 coyaml_anchor_t *cur = obstack_base(&info->anchors);
                 cur->name = name;
+                cur->hash = coyaml_hash(name, len);
+                cur->shared_type = NULL;
+                cur->shared = NULL;
             }
             break;
         case YAML_MAPPING_END_EVENT:
@@ -306,58 +456,66 @@ static int anchor_next(coyaml_parseinfo_t *info) {
                 info->event.type);
         }
         if(!info->anchor_level) {
+            int size = obstack_object_size(&info->anchors);
             obstack_grow(&info->anchors, zero, sizeof(zero));
             coyaml_anchor_t *cur = obstack_finish(&info->anchors);
+            cur->events_count = (size - sizeof(coyaml_anchor_t))
+                / sizeof(yaml_event_t);
             COYAML_DEBUG("Done anchor ``%s''", cur->name);
-            if(info->anchor_last) {
-                info->anchor_last->next = cur;
-                info->anchor_last = cur;
-            } else {
-                info->anchor_first = info->anchor_last = cur;
-            }
-            cur->next = NULL;
+            add_anchor(info, cur);
         }
     }
     return 0;
 }
 
-static int find_mapping_key(coyaml_mapkey_t *root, char *name,
-    coyaml_mapkey_t **node) {
-    coyaml_mapkey_t *parent;
-    coyaml_mapkey_t *cur = root;
-    while(TRUE) {
-        int res = strcmp(name, cur->name);
-        if(!res) {
-            *node = cur;
-            return 0;
-        }
-        if(res < 0) {
-            parent = cur;
-            cur = cur->left;
-            if(!cur) {
-                *node = parent;
-                return -1;
-            }
-        } else { // res > 0
-            parent = cur;
-            cur = cur->right;
-            if(!cur) {
-                *node = parent;
-                return 1;
-            }
+static coyaml_mapkey_t *find_mapping_key(coyaml_mapmerge_t *mapping,
+    char *name, int len, unsigned int hash) {
+    if(!mapping->keys_size) return NULL;
+    for(coyaml_mapkey_t *key = mapping->keys[
+        COYAML_HASH_BUCKET(hash, mapping->keys_size)]; key; key = key->next) {
+        if(key->hash == hash && key->len == len
+            && !memcmp(key->name, name, len)) {
+            return key;
         }
     }
-    abort();
+    return NULL;
 }
 
-static coyaml_mapkey_t *make_mapping_key(coyaml_parseinfo_t *info) {
+/*  Keys and tables are allocated from `mappieces` after the mapping itself,
+    so they are freed along with it. Mapping gets new keys only when it's on
+    top of the stack, so old tables are never needed by nested mappings.
+*/
+static void add_mapping_key(coyaml_parseinfo_t *info,
+    coyaml_mapmerge_t *mapping, unsigned int hash) {
+    if(mapping->keys_count >= mapping->keys_size) {
+        int size = mapping->keys_size ? mapping->keys_size * 2 : 8;
+        coyaml_mapkey_t **table = obstack_alloc(&info->mappieces,
+            size * sizeof(coyaml_mapkey_t *));
+        memset(table, 0, size * sizeof(coyaml_mapkey_t *));
+        for(int i = 0; i < mapping->keys_size; ++i) {
+            for(coyaml_mapkey_t *key = mapping->keys[i], *next; key;
+                key = next) {
+                next = key->next;
+                coyaml_mapkey_t **bucket = &table[
+                    COYAML_HASH_BUCKET(key->hash, size)];
+                key->next = *bucket;
+                *bucket = key;
+            }
+        }
+        mapping->keys = table;
+        mapping->keys_size = size;
+    }
+    int len = info->event.data.scalar.length;
     coyaml_mapkey_t *res = obstack_alloc(&info->mappieces,
-        sizeof(coyaml_mapkey_t)+info->event.data.scalar.length+1);
-    res->left = NULL;
-    res->right = NULL;
-    memcpy((char *)res + sizeof(coyaml_mapkey_t),
-        info->event.data.scalar.value, info->event.data.scalar.length + 1);
-    return res;
+        sizeof(coyaml_mapkey_t)+len+1);
+    res->hash = hash;
+    res->len = len;
+    memcpy(res->name, info->event.data.scalar.value, len + 1);
+    coyaml_mapkey_t **bucket = &mapping->keys[
+        COYAML_HASH_BUCKET(hash, mapping->keys_size)];
+    res->next = *bucket;
+    *bucket = res;
+    mapping->keys_count += 1;
 }
 
 static int mapping_next(coyaml_parseinfo_t *info) {
@@ -424,27 +582,16 @@ static int duplicate_next(coyaml_parseinfo_t *info) {
             COYAML_DEBUG("Scalar at [%d] state %d level %d",
                 mapping->height, mapping->state, mapping->level);
             if(!mapping->state && !mapping->level) {
-                coyaml_mapkey_t *key = mapping->keys;
-                if(!key) {
-                    info->top_map->keys = make_mapping_key(info);
-                } else {
-                    int rel = find_mapping_key(key,
-                        (char *)info->event.data.scalar.value, &key);
-                    if(rel == 0) {
-                        COYAML_DEBUG("Skipping duplicate ``%.*s''",
-                            (int)info->event.data.scalar.length,
-                            info->event.data.scalar.value);
-                        CHECK(coyaml_skip(info));
-                        mapping->state = 0;
-                        return duplicate_next(info);
-                    } else {
-                        if(rel == 1) {
-                            key->right = make_mapping_key(info);
-                        } else { // rel == -1
-                            key->left = make_mapping_key(info);
-                        }
-                    }
+                char *name = (char *)info->event.data.scalar.value;
+                int len = info->event.data.scalar.length;
+                unsigned int hash = coyaml_hash(name, len);
+                if(find_mapping_key(mapping, name, len, hash)) {
+                    COYAML_DEBUG("Skipping duplicate ``%.*s''", len, name);
+                    CHECK(coyaml_skip(info));
+                    mapping->state = 0;
+                    return duplicate_next(info);
                 }
+                add_mapping_key(info, mapping, hash);
                 mapping->state = 1;
             } else if(!mapping->level) {
                 mapping->state = 0;
@@ -478,6 +625,8 @@ static int duplicate_next(coyaml_parseinfo_t *info) {
                     mapping->height = mapping->prev->height + 1;
                 }
                 mapping->keys = NULL;
+                mapping->keys_size = 0;
+                mapping->keys_count = 0;
                 mapping->state = 0;
                 mapping->level = 0;
                 mapping->mergelevel = 0;
@@ -549,8 +698,11 @@ void *config;
     return 0;
 }
 
-int coyaml_readfile(coyaml_context_t *ctx) {
+// Reads config from ``data'' if it's not NULL, or from ``filename''
+static int read_config(coyaml_context_t *ctx, const char *filename,
+    const char *data, size_t size) {
     coyaml_parseinfo_t sinfo;
+    ctx->sources = NULL;
     sinfo.context = ctx;
     sinfo.debug = ctx->debug;
     sinfo.parse_vars = ctx->parse_vars;
@@ -559,20 +711,36 @@ int coyaml_readfile(coyaml_context_t *ctx) {
     sinfo.anchor_level = -1;
     sinfo.anchor_pos = -1;
     sinfo.anchor_unpacking = NULL;
+    sinfo.shared_hits = 0;
     sinfo.anchor_first = NULL;
     sinfo.anchor_last = NULL;
+    sinfo.anchor_table = NULL;
+    sinfo.anchor_table_size = 0;
+    sinfo.anchor_count = 0;
+    sinfo.eval_table = NULL;
+    sinfo.eval_table_size = 0;
+    sinfo.eval_count = 0;
     sinfo.top_map = NULL;
     sinfo.last_mark = NULL;
     sinfo.top_mark = NULL;
+    sinfo.include_cache = NULL;
+    sinfo.include_hits = 0;
     sinfo.event.type = YAML_NO_EVENT;
     obstack_init(&sinfo.anchors);
+    obstack_init(&sinfo.evalpieces);
     obstack_init(&sinfo.mappieces);
 
     coyaml_parseinfo_t *info = &sinfo;
 
-    sinfo.root_file = sinfo.current_file = open_file(info, ctx->root_filename);
+    if(data) {
+        sinfo.root_file = open_buffer(info, filename, data, size);
+    } else {
+        sinfo.root_file = open_file(info, filename);
+    }
+    sinfo.current_file = sinfo.root_file;
     if(!sinfo.root_file) {
         obstack_free(&sinfo.anchors, NULL);
+        obstack_free(&sinfo.evalpieces, NULL);
         obstack_free(&sinfo.mappieces, NULL);
         return -1;
     }
@@ -580,7 +748,13 @@ int coyaml_readfile(coyaml_context_t *ctx) {
     ctx->parseinfo = &sinfo;
     int result = coyaml_root(info, ctx->root_group, ctx->target);
     ctx->parseinfo = NULL;
+    if(info->event.type && !info->anchor_unpacking && info->anchor_level < 0) {
+        yaml_event_delete(&info->event); // parsing may stop at any event
+    }
 
+    // Marks are listed in reverse order of completion, and object is
+    // completed after all objects nested in it, so every parent is
+    // resolved before its children and single pass is enough
     for(coyaml_marks_t *m = sinfo.last_mark; m; m = m->prev) {
         if(m->parent && m->parent->type == m->type) {
             COYAML_ASSERT(m->prop);
@@ -592,20 +766,48 @@ int coyaml_readfile(coyaml_context_t *ctx) {
         for(yaml_event_t *ev = a->events; ev->type != YAML_NO_EVENT; ++ev) {
             yaml_event_delete(ev);
         }
+        free(a->shared);
     }
+    COYAML_DEBUG("Include cache hits: %d", sinfo.include_hits);
+    COYAML_DEBUG("Shared alias values: %d", sinfo.shared_hits);
+    coyaml_free_include_cache(info);
     obstack_free(&sinfo.anchors, NULL);
+    obstack_free(&sinfo.evalpieces, NULL);
     obstack_free(&sinfo.mappieces, NULL);
 
     for(coyaml_stack_t *t = info->current_file, *n; t; t = n) {
-        yaml_parser_delete(&t->parser);
-        fclose(t->file);
         n = t->prev;
-        free(t);
+        close_file(t);
     }
     COYAML_DEBUG("Done %s", result ? "ERROR" : "OK");
     return result;
 }
 
+int coyaml_readfile(coyaml_context_t *ctx) {
+    if(!ctx->snapshot_filename) {
+        return read_config(ctx, ctx->root_filename, NULL, 0);
+    }
+    if(!coyaml_snapshot_load(ctx, ctx->snapshot_filename)) {
+        return 0;
+    }
+    if(ctx->debug) {
+        fprintf(stderr, "COYAML: Can't use snapshot ``%s'': %s\n",
+            ctx->snapshot_filename, strerror(errno));
+    }
+    CHECK(read_config(ctx, ctx->root_filename, NULL, 0));
+    // Snapshot is only a cache, so failure to save it isn't an error
+    if(coyaml_snapshot_save(ctx, ctx->snapshot_filename) < 0 && ctx->debug) {
+        fprintf(stderr, "COYAML: Can't save snapshot ``%s'': %s\n",
+            ctx->snapshot_filename, strerror(errno));
+    }
+    return 0;
+}
+
+int coyaml_readbuffer(coyaml_context_t *ctx, const char *data, size_t len,
+    const char *name) {
+    return read_config(ctx, name ? name : "<buffer>", data ? data : "", len);
+}
+
 int coyaml_group(coyaml_parseinfo_t *info, coyaml_group_t *def, void *target) {
     COYAML_DEBUG("Entering Group");
     SYNTAX_ERROR(info->event.type == YAML_MAPPING_START_EVENT);
@@ -617,18 +819,12 @@ int coyaml_group(coyaml_parseinfo_t *info, coyaml_group_t *def, void *target) {
             CHECK(coyaml_next(info));
             continue;
         }
-        coyaml_transition_t *tran;
         char *key = (char *)info->event.data.scalar.value;
         if(!strcmp(key, "=")) {
             key = "value";
         }
-        for(tran = def->transitions;
-            tran && tran->symbol; ++tran) {
-            if(!strcmp(tran->symbol, key)) {
-                break;
-            }
-        }
-        if(tran && tran->symbol) {
+        coyaml_transition_t *tran = coyaml_find_transition(def, key);
+        if(tran) {
             COYAML_DEBUG("Matched key ``%s''", tran->symbol);
             CHECK(coyaml_next(info));
             CHECK(tran->prop->type->yaml_parse(info, tran->prop, target));
@@ -658,7 +854,7 @@ int coyaml_int(coyaml_parseinfo_t *info, coyaml_int_t *def, void *target) {
     long val = 0;
     if(coyaml_eval_int(info, (char *)info->event.data.scalar.value,
         info->event.data.scalar.length, &val)) {
-        SYNTAX_ERROR(0);
+        return -1; // already reported by evaluator
     }
 
     VALUE_ERROR(!(def->bitmask&2) || val <= def->max,
@@ -679,7 +875,7 @@ int coyaml_float(coyaml_parseinfo_t *info, coyaml_float_t *def, void *target) {
     double val;
     if(coyaml_eval_float(info, (char *)info->event.data.scalar.value,
         info->event.data.scalar.length, &val)) {
-        SYNTAX_ERROR(0);
+        return -1; // already reported by evaluator
     }
 
     VALUE_ERROR(!(def->bitmask&2) || val <= def->max,
@@ -726,7 +922,7 @@ int coyaml_uint(coyaml_parseinfo_t *info, coyaml_uint_t *def, void *target) {
     long tval = 0;
     if(coyaml_eval_int(info, (char *)info->event.data.scalar.value,
         info->event.data.scalar.length, &tval)) {
-        SYNTAX_ERROR(0);
+        return -1; // already reported by evaluator
     }
     unsigned long val = (unsigned long) tval;
     VALUE_ERROR(!(def->bitmask&2) || val <= def->max,
@@ -791,14 +987,40 @@ int coyaml_string(coyaml_parseinfo_t *info, coyaml_string_t *def, void *target)
             int file = open(fn, O_RDONLY);
             VALUE_ERROR(file >= 0, "Can't open file ``%s''", fn);
             struct stat finfo;
-            VALUE_ERROR(!fstat(file, &finfo), "Can't stat ``%s''", fn);
-            void *body = *(char **)(((char *)target)+def->baseoffset) \
-                = obstack_alloc(&info->head->pieces, finfo.st_size);
+            if(fstat(file, &finfo)) {
+                close(file);
+                VALUE_ERROR(0, "Can't stat ``%s''", fn);
+            }
+            coyaml_add_source(info->context, fn, &finfo);
+            void *body = NULL;
+            if(info->context->map_blobs && S_ISREG(finfo.st_mode)
+                && finfo.st_size) {
+                // Mapped read-only, so that processes sharing the file
+                // share the pages too, unmapped in coyaml_config_free()
+                body = mmap(NULL, finfo.st_size, PROT_READ, MAP_PRIVATE,
+                    file, 0);
+                if(body == MAP_FAILED) {
+                    body = NULL;
+                } else {
+                    coyaml_blob_t *blob = obstack_alloc(&info->head->pieces,
+                        sizeof(coyaml_blob_t));
+                    blob->data = body;
+                    blob->size = finfo.st_size;
+                    blob->next = info->head->blobs;
+                    info->head->blobs = blob;
+                }
+            }
+            if(!body) {
+                body = obstack_alloc(&info->head->pieces, finfo.st_size);
+                if(read(file, body, finfo.st_size) != finfo.st_size) {
+                    close(file);
+                    VALUE_ERROR(0, "Couldn't read file ``%s''", fn);
+                }
+            }
+            close(file);
+            *(char **)(((char *)target)+def->baseoffset) = body;
             *(int *)(((char *)target)+def->baseoffset+sizeof(char*)) \
                 = finfo.st_size;
-            VALUE_ERROR(read(file, body, finfo.st_size) == finfo.st_size,
-                "Couldn't read file ``%s''", fn);
-            close(file);
         } else if(!strcmp(tag, "!Raw")) {
             *(char **)(((char *)target)+def->baseoffset) = obstack_copy0(
                 &info->head->pieces, info->event.data.scalar.value,
@@ -812,7 +1034,7 @@ int coyaml_string(coyaml_parseinfo_t *info, coyaml_string_t *def, void *target)
         char *data = (char *)info->event.data.scalar.value;
         int dlen = info->event.data.scalar.length;
         if(coyaml_eval_str(info, data, dlen, &data, &dlen)) {
-            SYNTAX_ERROR(0);
+            return -1; // already reported by evaluator
         }
         *(char **)(((char *)target)+def->baseoffset) = data;
         *(int *)(((char *)target)+def->baseoffset+sizeof(char*)) = dlen;
@@ -833,20 +1055,20 @@ int coyaml_usertype(coyaml_parseinfo_t *info, coyaml_usertype_t *def, void *targ
         }
     } else if(info->event.type == YAML_SEQUENCE_START_EVENT) {
         CHECK(coyaml_parse_tag(info, def, target));
-        for(coyaml_transition_t *tr = def->group->transitions; tr->symbol; ++tr) {
-            COYAML_DEBUG("Symbol ``%s''", tr->symbol);
-            if(!strcmp(tr->symbol, "value")) {
-                COYAML_ASSERT((void *)tr->prop->type == &coyaml_array_type);
-                CHECK(coyaml_array(info, (coyaml_array_t *)tr->prop, target));
-                break;
-            }
+        coyaml_transition_t *tr = coyaml_find_transition(def->group, "value");
+        if(tr) {
+            COYAML_ASSERT((void *)tr->prop->type == &coyaml_array_type);
+            CHECK(coyaml_array(info, (coyaml_array_t *)tr->prop, target));
         }
     } else {
         CHECK(coyaml_parse_tag(info, def, target));
         SYNTAX_ERROR(info->event.type == YAML_MAPPING_START_EVENT);
         int fsize = sizeof(coyaml_marks_t) + sizeof(char)*def->flagcount;
-        coyaml_marks_t *marks = obstack_alloc(&info->context->pieces, fsize);
-        bzero(marks, fsize);
+        fsize = (fsize + sizeof(void *) - 1) & ~(sizeof(void *) - 1);
+        int tsize = fsize + sizeof(void *)*def->flagcount;
+        coyaml_marks_t *marks = obstack_alloc(&info->context->pieces, tsize);
+        bzero(marks, tsize);
+        marks->tails = (void **)((char *)marks + fsize);
         marks->type = def->ident;
         marks->object = target;
         marks->prop = def;
@@ -863,18 +1085,129 @@ int coyaml_usertype(coyaml_parseinfo_t *info, coyaml_usertype_t *def, void *targ
     return 0;
 }
 
+// Objects having a parent of the same type get fields filled after parsing,
+// so their values can't be shared
+static bool inherits(coyaml_parseinfo_t *info, coyaml_marks_t *stop) {
+    for(coyaml_marks_t *m = info->last_mark; m != stop; m = m->prev) {
+        if(m->parent && m->parent->type == m->type) {
+            return TRUE;
+        }
+    }
+    return FALSE;
+}
+
+/*  When a whole anchored mapping or sequence is parsed as a usertype, the
+    object is kept in the anchor. Aliases of the same usertype get a copy
+    of it, and their events are skipped up to the closing one, so shared
+    strings and lists are not allocated again. Relative paths are resolved
+    against base directory, so it must match too.
+*/
 int coyaml_custom(coyaml_parseinfo_t *info, coyaml_custom_t *def, void *target) {
     COYAML_DEBUG("Entering Custom");
     SETFLAG(info, def);
     SYNTAX_ERROR(info->event.type == YAML_MAPPING_START_EVENT
         || info->event.type == YAML_SEQUENCE_START_EVENT
         || info->event.type == YAML_SCALAR_EVENT);
-    CHECK(coyaml_usertype(info, def->usertype,
-        ((char *)target)+def->baseoffset));
+    coyaml_usertype_t *utype = def->usertype;
+    void *value = ((char *)target)+def->baseoffset;
+    bool collection = info->event.type != YAML_SCALAR_EVENT;
+    const char *basedir = info->current_file->basedir;
+    coyaml_anchor_t *anch = NULL;
+    if(collection && info->anchor_unpacking && info->anchor_pos == 1) {
+        anch = info->anchor_unpacking;
+        if(anch->shared_type == utype && !strcmp(anch->shared_basedir, basedir)
+            && !(info->top_mark && info->top_mark->type == utype->ident)) {
+            COYAML_DEBUG("Shared value of anchor ``%s''", anch->name);
+            memcpy(value, anch->shared, utype->size);
+            info->shared_hits += 1;
+            // Closing event is replayed, as if collection was empty
+            info->anchor_pos = anch->events_count - 1;
+            CHECK(coyaml_next(info));
+            CHECK(coyaml_next(info));
+            COYAML_DEBUG("Leaving Custom");
+            return 0;
+        }
+    }
+    bool anchored = collection && !info->anchor_unpacking
+        && info->event.data.scalar.anchor;
+    coyaml_anchor_t *last = info->anchor_last;
+    coyaml_marks_t *stop = info->last_mark;
+    CHECK(coyaml_usertype(info, utype, value));
+    if(anchored) {
+        // Anchor is complete at the closing event, one more may follow it
+        anch = last ? last->next : info->anchor_first;
+    }
+    if(anch && !anch->shared_type && !inherits(info, stop)) {
+        anch->shared = malloc(utype->size);
+        if(anch->shared) {
+            memcpy(anch->shared, value, utype->size);
+            anch->shared_type = utype;
+            anch->shared_basedir = basedir;
+        }
+    }
     COYAML_DEBUG("Leaving Custom");
     return 0;
 }
 
+#define MAPPING_INDEX(def, target) (*(coyaml_mapindex_t **)((char *)(target) \
+    + (def)->baseoffset + sizeof(void *) + sizeof(size_t)))
+
+static bool has_string_key(coyaml_mapping_t *def) {
+    coyaml_type_enum ident = def->key_prop->type->ident;
+    return ident == COYAML_STRING || ident == COYAML_FILE
+        || ident == COYAML_DIR;
+}
+
+int coyaml_mapping_reindex(struct obstack *pieces,
+    coyaml_mapping_t *def, void *target) {
+    if(!has_string_key(def)) return 0;
+    size_t len = *(size_t *)((char *)target + def->baseoffset + sizeof(void *));
+    if(!len) {
+        MAPPING_INDEX(def, target) = NULL;
+        return 0;
+    }
+    size_t size = 8;
+    while(size < len * 2) size *= 2;
+    coyaml_mapindex_t *index = obstack_alloc(pieces,
+        sizeof(coyaml_mapindex_t) + size * sizeof(coyaml_mapslot_t));
+    memset(index, 0, sizeof(coyaml_mapindex_t) + size*sizeof(coyaml_mapslot_t));
+    index->size = size;
+    index->key_offset = def->key_prop->baseoffset;
+    for(coyaml_mappingel_head_t *el
+        = *(coyaml_mappingel_head_t **)((char *)target + def->baseoffset);
+        el; el = el->next) {
+        char *key = *(char **)((char *)el + index->key_offset);
+        if(!key) continue;
+        int keylen = *(int *)((char *)el + index->key_offset + sizeof(char *));
+        // first element with the key wins, the same as with linear search
+        if(coyaml_mapping_find(index, key, keylen)) continue;
+        unsigned int hash = coyaml_hash(key, keylen);
+        size_t i = COYAML_HASH_BUCKET(hash, size);
+        while(index->slots[i].element) i = (i + 1) & (size - 1);
+        index->slots[i].hash = hash;
+        index->slots[i].element = el;
+    }
+    MAPPING_INDEX(def, target) = index;
+    return 0;
+}
+
+void *coyaml_mapping_find(coyaml_mapindex_t *index,
+    const char *key, size_t keylen) {
+    if(!index) return NULL;
+    unsigned int hash = coyaml_hash(key, keylen);
+    for(size_t i = COYAML_HASH_BUCKET(hash, index->size);
+        index->slots[i].element; i = (i + 1) & (index->size - 1)) {
+        if(index->slots[i].hash != hash) continue;
+        char *el = index->slots[i].element;
+        char *elkey = *(char **)(el + index->key_offset);
+        if((size_t)*(int *)(el + index->key_offset + sizeof(char *)) == keylen
+            && !memcmp(elkey, key, keylen)) {
+            return el;
+        }
+    }
+    return NULL;
+}
+
 int coyaml_mapping(coyaml_parseinfo_t *info, coyaml_mapping_t *def, void *target) {
     COYAML_DEBUG("Entering Mapping");
     if(def->inheritance == COYAML_INH_REPLACE_DEFAULT) {
@@ -914,12 +1247,73 @@ int coyaml_mapping(coyaml_parseinfo_t *info, coyaml_mapping_t *def, void *target
         lastel = newel;
     }
     *(size_t*)((char *)target+def->baseoffset+sizeof(void *)) = nelements;
+    SETTAIL(info, def, lastel);
     SYNTAX_ERROR(info->event.type == YAML_MAPPING_END_EVENT);
+    CHECK(coyaml_mapping_reindex(&info->head->pieces, def, target));
     CHECK(coyaml_next(info));
     COYAML_DEBUG("Leaving Mapping");
     return 0;
 }
 
+// Marks of usertypes keep pointer to the object for inheritance, so they
+// must follow elements moved to another buffer
+static void relocate_marks(coyaml_parseinfo_t *info, coyaml_marks_t *stop,
+    char *from, size_t size, char *to) {
+    for(coyaml_marks_t *m = info->last_mark; m != stop; m = m->prev) {
+        if((char *)m->object >= from && (char *)m->object < from + size) {
+            m->object = to + ((char *)m->object - from);
+        }
+    }
+}
+
+static int contiguous_array(coyaml_parseinfo_t *info,
+    coyaml_array_t *def, void *target) {
+    // Elements are parsed into temporary buffer, as their strings are
+    // allocated from the same obstack where the array will be placed
+    coyaml_marks_t *stop = info->last_mark;
+    char *buf = NULL;
+    size_t size = 0;
+    size_t nelements = 0;
+    while(info->event.type != YAML_SEQUENCE_END_EVENT) {
+        if(nelements == size) {
+            size = size ? size * 2 : 16;
+            char *nbuf = malloc(size * def->element_size);
+            if(!nbuf) {
+                free(buf);
+                return -1;
+            }
+            if(buf) {
+                memcpy(nbuf, buf, nelements * def->element_size);
+                relocate_marks(info, stop, buf,
+                    nelements * def->element_size, nbuf);
+                free(buf);
+            }
+            buf = nbuf;
+        }
+        char *newel = buf + nelements * def->element_size;
+        bzero(newel, def->element_size);
+        if(def->element_defaults) {
+            def->element_defaults(newel + def->element_prop->baseoffset);
+        }
+        if(def->element_prop->type->yaml_parse(info,
+            def->element_prop, newel) < 0) {
+            free(buf);
+            return -1;
+        }
+        nelements += 1;
+    }
+    if(nelements) {
+        char *items = obstack_copy(&info->head->pieces,
+            buf, nelements * def->element_size);
+        relocate_marks(info, stop, buf, nelements * def->element_size, items);
+        *(void **)((char *)target+def->baseoffset) = items;
+    }
+    free(buf);
+    *(size_t*)((char *)target+def->baseoffset+sizeof(void *)) = nelements;
+    SYNTAX_ERROR(info->event.type == YAML_SEQUENCE_END_EVENT);
+    return coyaml_next(info);
+}
+
 int coyaml_array(coyaml_parseinfo_t *info, coyaml_array_t *def, void *target) {
     COYAML_DEBUG("Entering Array");
     if(def->inheritance == COYAML_INH_REPLACE_DEFAULT) {
@@ -935,8 +1329,24 @@ int coyaml_array(coyaml_parseinfo_t *info, coyaml_array_t *def, void *target) {
             SETFLAG_1(info, def);
         }
     }
+    if(info->event.type == YAML_MAPPING_START_EVENT
+        && info->current_file->empty) {
+        // !IncludeDir matching no files, type of the value isn't known
+        // when files are joined, so it's an empty mapping
+        CHECK(coyaml_next(info));
+        SYNTAX_ERROR(info->event.type == YAML_MAPPING_END_EVENT);
+        *(size_t*)((char *)target+def->baseoffset+sizeof(void *)) = 0;
+        CHECK(coyaml_next(info));
+        COYAML_DEBUG("Leaving Array");
+        return 0;
+    }
     SYNTAX_ERROR(info->event.type == YAML_SEQUENCE_START_EVENT);
     CHECK(coyaml_next(info));
+    if(def->layout == COYAML_LAYOUT_CONTIGUOUS) {
+        CHECK(contiguous_array(info, def, target));
+        COYAML_DEBUG("Leaving Array");
+        return 0;
+    }
     coyaml_arrayel_head_t *lastel = NULL;
     size_t nelements = 0;
     while(info->event.type != YAML_SEQUENCE_END_EVENT) {
@@ -957,12 +1367,69 @@ int coyaml_array(coyaml_parseinfo_t *info, coyaml_array_t *def, void *target) {
         lastel = newel;
     }
     *(size_t*)((char *)target+def->baseoffset+sizeof(void *)) = nelements;
+    SETTAIL(info, def, lastel);
     SYNTAX_ERROR(info->event.type == YAML_SEQUENCE_END_EVENT);
     CHECK(coyaml_next(info));
     COYAML_DEBUG("Leaving Array");
     return 0;
 }
 
+coyaml_transition_t *coyaml_find_transition(coyaml_group_t *group,
+    char *symbol) {
+    coyaml_transition_t *tr = group->transitions;
+    if(!tr) return NULL;
+    if(!group->transition_index) {
+        // Group without generated index, fallback to linear scan
+        for(; tr->symbol; ++tr) {
+            if(!strcmp(tr->symbol, symbol)) {
+                return tr;
+            }
+        }
+        return NULL;
+    }
+    int lo = 0;
+    int hi = group->transition_count;
+    while(lo < hi) {
+        int mid = (lo + hi) >> 1;
+        coyaml_transition_t *cur = &tr[group->transition_index[mid]];
+        int res = strcmp(symbol, cur->symbol);
+        if(!res) return cur;
+        if(res < 0) {
+            hi = mid;
+        } else {
+            lo = mid + 1;
+        }
+    }
+    return NULL;
+}
+
+coyaml_tag_t *coyaml_find_tag(coyaml_usertype_t *prop, char *tagname) {
+    coyaml_tag_t *tags = prop->tags;
+    if(!tags) return NULL;
+    if(!prop->tag_index) {
+        for(; tags->tagname; ++tags) {
+            if(!strcmp(tags->tagname, tagname)) {
+                return tags;
+            }
+        }
+        return NULL;
+    }
+    int lo = 0;
+    int hi = prop->tag_count;
+    while(lo < hi) {
+        int mid = (lo + hi) >> 1;
+        coyaml_tag_t *cur = &tags[prop->tag_index[mid]];
+        int res = strcmp(tagname, cur->tagname);
+        if(!res) return cur;
+        if(res < 0) {
+            hi = mid;
+        } else {
+            lo = mid + 1;
+        }
+    }
+    return NULL;
+}
+
 int coyaml_parse_tag(coyaml_parseinfo_t *info,
     struct coyaml_usertype_s *prop, int *target) {
     COYAML_DEBUG("Entering Parse Tag");
@@ -973,16 +1440,11 @@ int coyaml_parse_tag(coyaml_parseinfo_t *info,
             *target = prop->default_tag;
         }
     } else {
-        bool tagset = FALSE;
-        for(coyaml_tag_t *t = prop->tags;t && t->tagname; ++t) {
-            if(!strcmp(t->tagname, tag)) {
-                *target = t->tagvalue;
-                COYAML_DEBUG("Matched tag ``%s'', value %d",
-                    t->tagname, t->tagvalue);
-                tagset = TRUE;
-            }
-        }
-        SYNTAX_ERROR(tagset);
+        coyaml_tag_t *t = coyaml_find_tag(prop, tag);
+        SYNTAX_ERROR(t);
+        *target = t->tagvalue;
+        COYAML_DEBUG("Matched tag ``%s'', value %d",
+            t->tagname, t->tagvalue);
     }
     COYAML_DEBUG("Leaving Parse Tag");
     return 0;
@@ -1000,15 +1462,9 @@ int coyaml_tagged_scalar(coyaml_parseinfo_t *info, char *value,
     }
     coyaml_group_t *gr = prop->group;
     COYAML_ASSERT(gr);
-    coyaml_transition_t *tr = gr->transitions;
-    COYAML_ASSERT(tr);
-    for(;tr->symbol; ++tr) {
-        if(!strcmp(tr->symbol, "value")) {
-            COYAML_ASSERT(tr->prop->type == &coyaml_string_type || info);
-            break;
-        }
-    }
+    coyaml_transition_t *tr = coyaml_find_transition(gr, "value");
     COYAML_ASSERT(tr);
+    COYAML_ASSERT(tr->prop->type == &coyaml_string_type || info);
     if(info) {
         tr->prop->type->yaml_parse(info, tr->prop, target);
     } else {
@@ -1040,6 +1496,34 @@ coyaml_context_t *coyaml_context_init(coyaml_context_t *inp) {
     return ctx;
 }
 
+void coyaml_error(coyaml_context_t *ctx, int code, const char *filename,
+    long line, long column, const char *message, ...) {
+    coyaml_error_t *err = &ctx->error;
+    err->code = code;
+    err->line = line;
+    err->column = column;
+    snprintf(err->filename, sizeof(err->filename), "%s",
+        filename ? filename : "");
+    va_list args;
+    va_start(args, message);
+    vsnprintf(err->message, sizeof(err->message), message, args);
+    va_end(args);
+    errno = code;
+    if(ctx->quiet) {
+        return;
+    }
+    if(!filename) {
+        fprintf(stderr, "COYAML: %s\n", err->message);
+    } else if(code == ECOYAML_SYNTAX_ERROR) {
+        fprintf(stderr, "COYAML: Syntax error in config file ``%s'' "
+            "at line %ld column %ld: %s\n",
+            filename, line, column, err->message);
+    } else {
+        fprintf(stderr, "COYAML: Error at %s:%ld[%ld]: %s\n",
+            filename, line, column, err->message);
+    }
+}
+
 void coyaml_context_free(coyaml_context_t *ctx) {
     obstack_free(&ctx->pieces, NULL);
     if(ctx->free_object) {
@@ -1048,6 +1532,9 @@ void coyaml_context_free(coyaml_context_t *ctx) {
 }
 
 void coyaml_config_free(void *ptr) {
+    for(coyaml_blob_t *b = ((coyaml_head_t *)ptr)->blobs; b; b = b->next) {
+        munmap(b->data, b->size);
+    }
     obstack_free(&((coyaml_head_t *)ptr)->pieces, NULL);
     if(((coyaml_head_t *)ptr)->free_object) {
         free(ptr);
@@ -4,27 +4,56 @@
 #include <stdio.h>
 
 // Files' stack
+typedef enum {
+    COYAML_INPUT_BUFFER, // owned by the caller
+    COYAML_INPUT_MMAP,
+    COYAML_INPUT_MALLOC, // for files which can't be mapped, e.g. pipes
+    COYAML_INPUT_EVENTS, // tokenized in advance by ``!IncludeDir''
+} coyaml_input_enum;
+
+// Part of events which came from a single file, so that errors and
+// nested includes are relative to that file
+typedef struct coyaml_fragment_s {
+    size_t first; // index of the first event
+    char *filename;
+    char *basedir;
+    int basedir_len;
+} coyaml_fragment_t;
+
 typedef struct coyaml_stack_s {
     struct coyaml_stack_s *prev;
     struct coyaml_stack_s *next;
     char *filename;
     char *basedir;
     int basedir_len;
-    FILE *file;
+    int input;
+    const char *data;
+    size_t size;
     yaml_parser_t parser;
+    // COYAML_INPUT_EVENTS only, events before ``events_pos'' are consumed
+    yaml_event_t *events;
+    size_t events_count;
+    size_t events_pos;
+    coyaml_fragment_t *fragments;
+    int fragments_count;
+    int fragment;
+    bool empty; // joined from no fragments, root is an empty mapping
 } coyaml_stack_t;
 
-// Tree of mapping keys, determining their uniqueness
+// Hash set of mapping keys, determining their uniqueness
 typedef struct coyaml_mapkey_s {
-    struct coyaml_mapkey_s *left;
-    struct coyaml_mapkey_s *right;
+    struct coyaml_mapkey_s *next; // next in the same bucket
+    unsigned int hash;
+    int len;
     char name[];
 } coyaml_mapkey_t;
 
 // Stack of map merging, for `<<` operator
 typedef struct coyaml_mapmerge_s {
     struct coyaml_mapmerge_s *prev;
-    coyaml_mapkey_t *keys;
+    coyaml_mapkey_t **keys;
+    int keys_size;
+    int keys_count;
     int height;
     int state;
     int level;
@@ -38,10 +67,40 @@ typedef struct coyaml_marks_s {
     struct coyaml_marks_s *prev;
     coyaml_usertype_t *prop;
     void *object;
+    // Last elements of list fields, indexed by flagoffset, so that
+    // inherited elements are appended without walking the list
+    void **tails;
     int type;
     char filled[];
 } coyaml_marks_t;
 
+coyaml_anchor_t *coyaml_find_anchor(coyaml_parseinfo_t *info,
+    const char *name, int len);
+int coyaml_mapping_reindex(struct obstack *pieces,
+    coyaml_mapping_t *def, void *target);
+struct stat;
+// Reads whole file into memory, mapping it when possible. Returns
+// COYAML_INPUT_* constant or -1 on error
+int coyaml_read_whole(int fd, struct stat *finfo, char **data, size_t *size);
+// Reads files matching the pattern in parallel, and joins their root
+// nodes into a single node, in the sorted order of file names
+coyaml_stack_t *coyaml_open_dir(coyaml_parseinfo_t *info,
+    const char *pattern);
+// Included file is tokenized once per parse, repeated includes of the
+// same file (by device and inode) replay its events
+coyaml_stack_t *coyaml_open_include(coyaml_parseinfo_t *info,
+    const char *filename);
+void coyaml_free_include_cache(coyaml_parseinfo_t *info);
+// Fills ctx->error and errno, and prints error unless context is quiet
+void coyaml_error(coyaml_context_t *ctx, int code, const char *filename,
+    long line, long column, const char *message, ...)
+    __attribute__((format(printf, 6, 7)));
+// Fills error which was reported only by errno, e.g. system one
+void coyaml_errno_error(coyaml_error_t *err, int code);
+#define PARSE_ERROR(code, message, ...) coyaml_error(info->context, (code), \
+    info->current_file->filename, info->event.start_mark.line+1, \
+    info->event.start_mark.column, message, ##__VA_ARGS__)
+
 int coyaml_group(coyaml_parseinfo_t *info,
     coyaml_group_t *prop, void *target);
 int coyaml_int(coyaml_parseinfo_t *info,
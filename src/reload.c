@@ -0,0 +1,63 @@
+#include <sched.h>
+
+#include "coyaml_src.h"
+
+// Readers register in one of two counters, selected by the epoch. Writer
+// swaps the config, flips the epoch and waits only for readers of the
+// old epoch, which could have seen the old config. Readers never wait.
+
+void *coyaml_acquire(coyaml_holder_t *holder) {
+    for(;;) {
+        unsigned long epoch = __atomic_load_n(&holder->epoch,
+            __ATOMIC_SEQ_CST);
+        int *readers = &holder->readers[epoch & 1];
+        __atomic_add_fetch(readers, 1, __ATOMIC_SEQ_CST);
+        if(__atomic_load_n(&holder->epoch, __ATOMIC_SEQ_CST) != epoch) {
+            // Epoch was flipped meanwhile, writer may not wait for us
+            __atomic_sub_fetch(readers, 1, __ATOMIC_SEQ_CST);
+            continue;
+        }
+        coyaml_head_t *cfg = __atomic_load_n(&holder->current,
+            __ATOMIC_SEQ_CST);
+        if(cfg) {
+            __atomic_add_fetch(&cfg->refcount, 1, __ATOMIC_SEQ_CST);
+        }
+        __atomic_sub_fetch(readers, 1, __ATOMIC_SEQ_CST);
+        return cfg;
+    }
+}
+
+void coyaml_release(void *cfg) {
+    if(cfg && !__atomic_sub_fetch(&((coyaml_head_t *)cfg)->refcount, 1,
+        __ATOMIC_ACQ_REL)) {
+        coyaml_config_free(cfg);
+    }
+}
+
+void coyaml_publish(coyaml_holder_t *holder, void *cfg) {
+    if(cfg) {
+        ((coyaml_head_t *)cfg)->refcount = 1; // reference of the holder
+    }
+    while(__atomic_exchange_n(&holder->writer, 1, __ATOMIC_ACQUIRE)) {
+        sched_yield();
+    }
+    coyaml_head_t *old = __atomic_exchange_n(&holder->current,
+        (coyaml_head_t *)cfg, __ATOMIC_SEQ_CST);
+    unsigned long epoch = __atomic_fetch_add(&holder->epoch, 1,
+        __ATOMIC_SEQ_CST);
+    while(__atomic_load_n(&holder->readers[epoch & 1], __ATOMIC_SEQ_CST)) {
+        sched_yield();
+    }
+    __atomic_store_n(&holder->writer, 0, __ATOMIC_RELEASE);
+    coyaml_release(old);
+}
+
+int coyaml_reload(coyaml_holder_t *holder, coyaml_context_t *ctx,
+    int argc, char **argv) {
+    void *cfg = ctx->target;
+    if(coyaml_load(ctx, argc, argv, NULL) < 0) {
+        return -1;
+    }
+    coyaml_publish(holder, cfg);
+    return 0;
+}
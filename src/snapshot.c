@@ -0,0 +1,510 @@
+#define _GNU_SOURCE
+#include <errno.h>
+#include <stddef.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <fcntl.h>
+#include <alloca.h>
+#include <sys/mman.h>
+
+#include "snapshot.h"
+#include "vars.h"
+#include "hash.h"
+#include "util.h"
+
+// Snapshot file consists of header, list of source files, relocations
+// and an image. Image starts with a copy of the main config structure,
+// followed by all the data it references. Pointers in the image are
+// stored as offsets from its start, and relocations are offsets of such
+// pointers, so loading the snapshot is a single pass over relocations.
+
+#define SNAPSHOT_MAGIC "COYAMLS2"
+#define SNAPSHOT_ALIGN 16
+#define ALIGN(size, align) (((size) + (align) - 1) & ~(size_t)((align) - 1))
+
+typedef struct coyaml_snapheader_s {
+    char magic[8];
+    uint32_t version_hash; // version string may be long, e.g. from git
+    uint32_t schema_hash;
+    uint32_t vars_hash;
+    uint64_t target_size;
+    uint64_t sources_size;
+    uint64_t reloc_count;
+    uint64_t image_size;
+} coyaml_snapheader_t;
+
+typedef struct coyaml_snapsource_s {
+    int64_t mtime;
+    int64_t mtime_nsec;
+    int64_t size;
+    uint64_t name_len;
+    char name[];
+} coyaml_snapsource_t;
+
+// Open addressing map of addresses of list elements to their offsets in
+// the image, elements are shared by inherited lists and mapping indexes
+typedef struct coyaml_snapaddr_s {
+    void *address;
+    size_t offset;
+} coyaml_snapaddr_t;
+
+typedef struct coyaml_snapwriter_s {
+    char *image;
+    size_t size;
+    size_t alloc;
+    uint64_t *relocs;
+    size_t reloc_count;
+    size_t reloc_alloc;
+    coyaml_snapaddr_t *map;
+    size_t map_size;
+    size_t map_count;
+} coyaml_snapwriter_t;
+
+void coyaml_add_source(coyaml_context_t *ctx, const char *name,
+    struct stat *finfo) {
+    int nlen = strlen(name);
+    coyaml_source_t *src = obstack_alloc(&ctx->pieces,
+        sizeof(coyaml_source_t) + nlen + 1);
+    src->mtime = finfo->st_mtim.tv_sec;
+    src->mtime_nsec = finfo->st_mtim.tv_nsec;
+    src->size = finfo->st_size;
+    memcpy(src->name, name, nlen + 1);
+    src->next = ctx->sources;
+    ctx->sources = src;
+}
+
+// Variables change the result of parsing, so they are part of the key
+static unsigned int vars_hash(coyaml_context_t *ctx) {
+    unsigned int result = ctx->parse_vars;
+    for(coyaml_variable_t *var = ctx->variables; var; var = var->next) {
+        unsigned int hash = var->hash;
+        switch(var->type) {
+            case COYAML_VAR_STRING:
+                hash ^= 31 * coyaml_hash(var->data.string.value,
+                    var->data.string.value_len);
+                break;
+            case COYAML_VAR_INTEGER:
+                hash ^= 31 * coyaml_hash((char *)&var->data.integer.value,
+                    sizeof(var->data.integer.value));
+                break;
+            default:
+                break;
+        }
+        // Order of variables doesn't matter
+        result ^= hash * 16777619u;
+    }
+    return result;
+}
+
+static int reserve(coyaml_snapwriter_t *w, size_t len, size_t *offset) {
+    size_t off = ALIGN(w->size, SNAPSHOT_ALIGN);
+    if(off + len > w->alloc) {
+        size_t alloc = w->alloc ? w->alloc : 4096;
+        while(alloc < off + len) alloc *= 2;
+        char *nimage = realloc(w->image, alloc);
+        if(!nimage) return -1;
+        w->image = nimage;
+        w->alloc = alloc;
+    }
+    memset(w->image + w->size, 0, off + len - w->size);
+    w->size = off + len;
+    *offset = off;
+    return 0;
+}
+
+static int set_pointer(coyaml_snapwriter_t *w, size_t slot, size_t value) {
+    if(w->reloc_count == w->reloc_alloc) {
+        size_t alloc = w->reloc_alloc ? w->reloc_alloc * 2 : 256;
+        uint64_t *nrelocs = realloc(w->relocs, alloc * sizeof(uint64_t));
+        if(!nrelocs) return -1;
+        w->relocs = nrelocs;
+        w->reloc_alloc = alloc;
+    }
+    w->relocs[w->reloc_count++] = slot;
+    *(uintptr_t *)(w->image + slot) = value;
+    return 0;
+}
+
+static size_t address_bucket(void *address, size_t size) {
+    return (((uintptr_t)address >> 3) * 2654435761u) & (size - 1);
+}
+
+// Returns zero if address is not in the image yet, as nothing but the
+// main structure can be at zero offset
+static size_t find_address(coyaml_snapwriter_t *w, void *address) {
+    if(!w->map_size) return 0;
+    for(size_t i = address_bucket(address, w->map_size);
+        w->map[i].address; i = (i + 1) & (w->map_size - 1)) {
+        if(w->map[i].address == address) {
+            return w->map[i].offset;
+        }
+    }
+    return 0;
+}
+
+static void insert_address(coyaml_snapaddr_t *map, size_t size,
+    void *address, size_t offset) {
+    size_t i = address_bucket(address, size);
+    while(map[i].address) {
+        i = (i + 1) & (size - 1);
+    }
+    map[i].address = address;
+    map[i].offset = offset;
+}
+
+static int add_address(coyaml_snapwriter_t *w, void *address, size_t offset) {
+    if((w->map_count + 1) * 2 > w->map_size) {
+        size_t size = w->map_size ? w->map_size * 2 : 1024;
+        coyaml_snapaddr_t *map = calloc(size, sizeof(coyaml_snapaddr_t));
+        if(!map) return -1;
+        for(size_t i = 0; i < w->map_size; ++i) {
+            if(w->map[i].address) {
+                insert_address(map, size, w->map[i].address, w->map[i].offset);
+            }
+        }
+        free(w->map);
+        w->map = map;
+        w->map_size = size;
+    }
+    insert_address(w->map, w->map_size, address, offset);
+    w->map_count += 1;
+    return 0;
+}
+
+static int snap_prop(coyaml_snapwriter_t *w, coyaml_placeholder_t *prop,
+    size_t obj);
+
+static int snap_group(coyaml_snapwriter_t *w, coyaml_group_t *group,
+    size_t obj) {
+    if(!group) return 0;
+    for(coyaml_transition_t *tr = group->transitions;
+        tr && tr->symbol; ++tr) {
+        CHECK(snap_prop(w, tr->prop, obj));
+    }
+    return 0;
+}
+
+static int snap_string(coyaml_snapwriter_t *w, size_t slot) {
+    char *value = *(char **)(w->image + slot);
+    if(!value) return 0;
+    int len = *(int *)(w->image + slot + sizeof(char *));
+    size_t off;
+    CHECK(reserve(w, len + 1, &off));
+    memcpy(w->image + off, value, len);
+    return set_pointer(w, slot, off);
+}
+
+// Elements of lists are shared only by tails, so when already copied
+// element is found, the rest of the list is already in the image too
+static int snap_list(coyaml_snapwriter_t *w, size_t slot, size_t element_size,
+    coyaml_placeholder_t *prop1, coyaml_placeholder_t *prop2) {
+    coyaml_arrayel_head_t *el = *(coyaml_arrayel_head_t **)(w->image + slot);
+    while(el) {
+        size_t off = find_address(w, el);
+        if(off) {
+            return set_pointer(w, slot, off);
+        }
+        CHECK(reserve(w, element_size, &off));
+        memcpy(w->image + off, el, element_size);
+        CHECK(add_address(w, el, off));
+        CHECK(set_pointer(w, slot, off));
+        CHECK(snap_prop(w, prop1, off));
+        if(prop2) {
+            CHECK(snap_prop(w, prop2, off));
+        }
+        slot = off + offsetof(coyaml_arrayel_head_t, next);
+        el = el->next;
+    }
+    return 0;
+}
+
+static int snap_block(coyaml_snapwriter_t *w, size_t slot, size_t element_size,
+    coyaml_placeholder_t *prop) {
+    char *items = *(char **)(w->image + slot);
+    size_t len = *(size_t *)(w->image + slot + sizeof(void *));
+    if(!items) return 0;
+    size_t off;
+    CHECK(reserve(w, len * element_size, &off));
+    memcpy(w->image + off, items, len * element_size);
+    CHECK(set_pointer(w, slot, off));
+    for(size_t i = 0; i < len; ++i) {
+        CHECK(snap_prop(w, prop, off + i * element_size));
+    }
+    return 0;
+}
+
+static int snap_index(coyaml_snapwriter_t *w, size_t slot) {
+    coyaml_mapindex_t *index = *(coyaml_mapindex_t **)(w->image + slot);
+    if(!index) return 0;
+    size_t off;
+    CHECK(reserve(w, sizeof(coyaml_mapindex_t)
+        + index->size * sizeof(coyaml_mapslot_t), &off));
+    memcpy(w->image + off, index, sizeof(coyaml_mapindex_t)
+        + index->size * sizeof(coyaml_mapslot_t));
+    CHECK(set_pointer(w, slot, off));
+    for(size_t i = 0; i < index->size; ++i) {
+        if(!index->slots[i].element) continue;
+        size_t el = find_address(w, index->slots[i].element);
+        COYAML_ASSERT(el);
+        CHECK(set_pointer(w, off + offsetof(coyaml_mapindex_t, slots)
+            + i * sizeof(coyaml_mapslot_t)
+            + offsetof(coyaml_mapslot_t, element), el));
+    }
+    return 0;
+}
+
+static int snap_prop(coyaml_snapwriter_t *w, coyaml_placeholder_t *prop,
+    size_t obj) {
+    size_t slot = obj + prop->baseoffset;
+    switch(prop->type->ident) {
+        case COYAML_GROUP:
+            return snap_group(w, (coyaml_group_t *)prop, obj);
+        case COYAML_CUSTOM:
+            return snap_group(w, ((coyaml_custom_t *)prop)->usertype->group,
+                slot);
+        case COYAML_STRING:
+        case COYAML_FILE:
+        case COYAML_DIR:
+            return snap_string(w, slot);
+        case COYAML_ARRAY: {
+            coyaml_array_t *def = (coyaml_array_t *)prop;
+            if(def->layout == COYAML_LAYOUT_CONTIGUOUS) {
+                return snap_block(w, slot, def->element_size,
+                    def->element_prop);
+            }
+            return snap_list(w, slot, def->element_size,
+                def->element_prop, NULL);
+            }
+        case COYAML_MAPPING: {
+            coyaml_mapping_t *def = (coyaml_mapping_t *)prop;
+            CHECK(snap_list(w, slot, def->element_size,
+                def->key_prop, def->value_prop));
+            return snap_index(w, slot + sizeof(void *) + sizeof(size_t));
+            }
+        default:
+            // Numbers are copied together with the structure
+            return 0;
+    }
+}
+
+static int write_sources(coyaml_context_t *ctx, FILE *file,
+    uint64_t *size) {
+    // Written in the order files were read, so root file is the first
+    size_t count = 0;
+    for(coyaml_source_t *src = ctx->sources; src; src = src->next) {
+        count += 1;
+    }
+    coyaml_source_t **sources = malloc((count+1) * sizeof(coyaml_source_t *));
+    if(!sources) return -1;
+    size_t i = count;
+    for(coyaml_source_t *src = ctx->sources; src; src = src->next) {
+        sources[--i] = src;
+    }
+    static char zeros[8];
+    *size = 0;
+    for(i = 0; i < count; ++i) {
+        coyaml_snapsource_t rec;
+        rec.mtime = sources[i]->mtime;
+        rec.mtime_nsec = sources[i]->mtime_nsec;
+        rec.size = sources[i]->size;
+        rec.name_len = strlen(sources[i]->name);
+        size_t nsize = ALIGN(rec.name_len + 1, 8);
+        if(fwrite(&rec, sizeof(rec), 1, file) != 1
+            || fwrite(sources[i]->name, rec.name_len, 1, file) != 1
+            || fwrite(zeros, nsize - rec.name_len, 1, file) != 1) {
+            free(sources);
+            return -1;
+        }
+        *size += sizeof(rec) + nsize;
+    }
+    free(sources);
+    return 0;
+}
+
+static int write_snapshot(coyaml_context_t *ctx, coyaml_snapwriter_t *w,
+    const char *filename) {
+    // Written into a temporary file and renamed, so that processes
+    // starting concurrently never see a partially written snapshot
+    char *tmpname = alloca(strlen(filename) + 8);
+    strcpy(tmpname, filename);
+    strcat(tmpname, ".XXXXXX");
+    int fd = mkstemp(tmpname);
+    if(fd < 0) return -1;
+    FILE *file = fdopen(fd, "wb");
+    if(!file) {
+        close(fd);
+        unlink(tmpname);
+        return -1;
+    }
+    coyaml_snapheader_t header;
+    memset(&header, 0, sizeof(header));
+    memcpy(header.magic, SNAPSHOT_MAGIC, sizeof(header.magic));
+    header.version_hash = coyaml_hash(COYAML_VERSION, strlen(COYAML_VERSION));
+    header.schema_hash = ctx->schema_hash;
+    header.vars_hash = vars_hash(ctx);
+    header.target_size = ctx->target_size;
+    header.reloc_count = w->reloc_count;
+    header.image_size = w->size;
+    static char zeros[SNAPSHOT_ALIGN];
+    int ok = fwrite(&header, sizeof(header), 1, file) == 1
+        && !write_sources(ctx, file, &header.sources_size)
+        && (!w->reloc_count || fwrite(w->relocs, sizeof(uint64_t),
+            w->reloc_count, file) == w->reloc_count);
+    if(ok) {
+        long pos = ftell(file);
+        size_t pad = ALIGN(pos, SNAPSHOT_ALIGN) - pos;
+        ok = pos >= 0
+            && (!pad || fwrite(zeros, pad, 1, file) == 1)
+            && fwrite(w->image, w->size, 1, file) == 1
+            && !fseek(file, 0, SEEK_SET)
+            && fwrite(&header, sizeof(header), 1, file) == 1;
+    }
+    if(fclose(file) || !ok || rename(tmpname, filename)) {
+        int err = errno;
+        unlink(tmpname);
+        errno = err;
+        return -1;
+    }
+    return 0;
+}
+
+int coyaml_snapshot_save(coyaml_context_t *ctx, const char *filename) {
+    if(!ctx->target_size) {
+        errno = ENOTSUP;
+        return -1;
+    }
+    if(!ctx->target) {
+        errno = EINVAL;
+        return -1;
+    }
+    coyaml_snapwriter_t w;
+    memset(&w, 0, sizeof(w));
+    size_t root;
+    int res = reserve(&w, ctx->target_size, &root);
+    if(!res) {
+        memcpy(w.image + root, ctx->target, ctx->target_size);
+        // Head is owned by the target snapshot is loaded into
+        memset(w.image + root, 0, sizeof(coyaml_head_t));
+        res = snap_group(&w, ctx->root_group, root);
+    }
+    if(!res) {
+        res = write_snapshot(ctx, &w, filename);
+    }
+    free(w.image);
+    free(w.relocs);
+    free(w.map);
+    return res;
+}
+
+// Checks that snapshot is for this schema, variables and version of
+// every source file, and remembers sources for the next save
+static int check_snapshot(coyaml_context_t *ctx, char *data, size_t size) {
+    coyaml_snapheader_t *header = (coyaml_snapheader_t *)data;
+    if(size < sizeof(coyaml_snapheader_t)
+        || memcmp(header->magic, SNAPSHOT_MAGIC, sizeof(header->magic))
+        || header->version_hash != coyaml_hash(COYAML_VERSION,
+            strlen(COYAML_VERSION))
+        || header->schema_hash != ctx->schema_hash
+        || header->target_size != ctx->target_size
+        || header->vars_hash != vars_hash(ctx)
+        || header->image_size < header->target_size
+        || header->sources_size > size
+        || header->reloc_count > size / sizeof(uint64_t)
+        || ALIGN(sizeof(coyaml_snapheader_t) + header->sources_size
+            + header->reloc_count * sizeof(uint64_t), SNAPSHOT_ALIGN)
+            + header->image_size > size) {
+        return -1;
+    }
+    char *cur = data + sizeof(coyaml_snapheader_t);
+    char *end = cur + header->sources_size;
+    if(cur == end || !ctx->root_filename) return -1;
+    ctx->sources = NULL;
+    while(cur < end) {
+        coyaml_snapsource_t *rec = (coyaml_snapsource_t *)cur;
+        if((size_t)(end - cur) < sizeof(coyaml_snapsource_t)
+            || rec->name_len >= (size_t)(end - cur)
+                - sizeof(coyaml_snapsource_t)
+            || rec->name[rec->name_len]) {
+            return -1;
+        }
+        if(cur == data + sizeof(coyaml_snapheader_t)
+            && strcmp(rec->name, ctx->root_filename)) {
+            return -1;
+        }
+        struct stat finfo;
+        if(stat(rec->name, &finfo) < 0
+            || finfo.st_mtim.tv_sec != rec->mtime
+            || finfo.st_mtim.tv_nsec != rec->mtime_nsec
+            || finfo.st_size != rec->size) {
+            return -1;
+        }
+        coyaml_add_source(ctx, rec->name, &finfo);
+        cur += sizeof(coyaml_snapsource_t) + ALIGN(rec->name_len + 1, 8);
+    }
+    return 0;
+}
+
+int coyaml_snapshot_load(coyaml_context_t *ctx, const char *filename) {
+    if(!ctx->target_size) {
+        errno = ENOTSUP;
+        return -1;
+    }
+    int fd = open(filename, O_RDONLY);
+    if(fd < 0) return -1;
+    struct stat finfo;
+    if(fstat(fd, &finfo) < 0) {
+        close(fd);
+        return -1;
+    }
+    if(finfo.st_size < sizeof(coyaml_snapheader_t)) {
+        close(fd);
+        errno = ESTALE;
+        return -1;
+    }
+    // Private writable mapping, only pages with pointers are copied
+    char *data = mmap(NULL, finfo.st_size, PROT_READ|PROT_WRITE,
+        MAP_PRIVATE, fd, 0);
+    close(fd);
+    if(data == MAP_FAILED) return -1;
+    if(check_snapshot(ctx, data, finfo.st_size) < 0) {
+        munmap(data, finfo.st_size);
+        ctx->sources = NULL;
+        errno = ESTALE;
+        return -1;
+    }
+    coyaml_snapheader_t *header = (coyaml_snapheader_t *)data;
+    uint64_t *relocs = (uint64_t *)(data + sizeof(coyaml_snapheader_t)
+        + header->sources_size);
+    char *image = data + ALIGN((char *)(relocs + header->reloc_count) - data,
+        SNAPSHOT_ALIGN);
+    for(size_t i = 0; i < header->reloc_count; ++i) {
+        uintptr_t *slot = (uintptr_t *)(image + relocs[i]);
+        if(relocs[i] > header->image_size - sizeof(void *)
+            || relocs[i] % sizeof(void *)
+            || *slot >= header->image_size) {
+            munmap(data, finfo.st_size);
+            ctx->sources = NULL;
+            errno = ESTALE;
+            return -1;
+        }
+        if(*slot < header->target_size) {
+            // Pointers to the main structure are to the target
+            *slot += (uintptr_t)ctx->target;
+        } else {
+            *slot += (uintptr_t)image;
+        }
+    }
+    memcpy((char *)ctx->target + sizeof(coyaml_head_t),
+        image + sizeof(coyaml_head_t),
+        header->target_size - sizeof(coyaml_head_t));
+    coyaml_blob_t *blob = obstack_alloc(&ctx->target->pieces,
+        sizeof(coyaml_blob_t));
+    blob->data = data;
+    blob->size = finfo.st_size;
+    blob->next = ctx->target->blobs;
+    ctx->target->blobs = blob;
+    return 0;
+}
@@ -0,0 +1,20 @@
+#ifndef _H_SNAPSHOT
+#define _H_SNAPSHOT
+
+#include <sys/stat.h>
+#include <coyaml_src.h>
+
+// File read while parsing config, snapshot is valid until any of them
+// is changed. List is in reverse order, so root file is the last one
+typedef struct coyaml_source_s {
+    struct coyaml_source_s *next;
+    long mtime;
+    long mtime_nsec;
+    long size;
+    char name[];
+} coyaml_source_t;
+
+void coyaml_add_source(coyaml_context_t *ctx, const char *name,
+    struct stat *finfo);
+
+#endif //_H_SNAPSHOT
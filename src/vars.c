@@ -1,63 +1,62 @@
+#include <errno.h>
+#include <string.h>
 #include <coyaml_src.h>
 #include "vars.h"
-#include <assert.h>
+#include "hash.h"
 
-static int find_value(coyaml_variable_t *var, char *name,
-    coyaml_variable_t **node) {
-    coyaml_variable_t *parent;
-    coyaml_variable_t *cur = var;
-    while(TRUE) {
-        int res = strcmp(name, cur->name);
-        if(!res) {
-            *node = cur;
-            return 0;
-        }
-        if(res < 0) {
-            parent = cur;
-            cur = cur->left;
-            if(!cur) {
-                *node = parent;
-                return -1;
-            }
-        } else { // res > 0
-            parent = cur;
-            cur = cur->right;
-            if(!cur) {
-                *node = parent;
-                return 1;
-            }
+static coyaml_variable_t *find_value(coyaml_context_t *ctx,
+    const char *name, int nlen, unsigned int hash) {
+    if(!ctx->variable_table_size) return NULL;
+    for(coyaml_variable_t *var = ctx->variable_table[
+        COYAML_HASH_BUCKET(hash, ctx->variable_table_size)];
+        var; var = var->hash_next) {
+        if(var->hash == hash && var->name_len == nlen
+            && !memcmp(var->name, name, nlen)) {
+            return var;
         }
     }
-    abort();
+    return NULL;
 }
 
-static coyaml_variable_t *new_variable(coyaml_context_t *ctx, char *name) {
-    coyaml_variable_t *var = obstack_alloc(&ctx->pieces,
-        sizeof(coyaml_variable_t) + strlen(name) + 1);
-    var->left = NULL;
-    var->right = NULL;
-    var->name = ((char *)var) + sizeof(coyaml_variable_t);
-    var->name_len = strlen(name);
-    memcpy(var->name, name, var->name_len);
-    var->name[var->name_len] = 0;
-    return var;
+static void reserve_variables(coyaml_context_t *ctx, int count) {
+    if(count <= ctx->variable_table_size) return;
+    int size = ctx->variable_table_size
+        ? ctx->variable_table_size : COYAML_HASH_MIN_SIZE;
+    while(size < count) size *= 2;
+    // Old table is left in obstack, total waste is less than new table
+    coyaml_variable_t **table = obstack_alloc(&ctx->pieces,
+        size * sizeof(coyaml_variable_t *));
+    memset(table, 0, size * sizeof(coyaml_variable_t *));
+    for(coyaml_variable_t *var = ctx->variables; var; var = var->next) {
+        coyaml_variable_t **bucket = &table[
+            COYAML_HASH_BUCKET(var->hash, size)];
+        var->hash_next = *bucket;
+        *bucket = var;
+    }
+    ctx->variable_table = table;
+    ctx->variable_table_size = size;
 }
 
 static coyaml_variable_t *find_and_set(coyaml_context_t *ctx, char *name) {
-    coyaml_variable_t *var;
-    if(!ctx->variables) {
-        ctx->variables = var = new_variable(ctx, name);
-    } else {
-        coyaml_variable_t *node;
-        int rel = find_value(ctx->variables, name, &node);
-        if(rel == 1) {
-            var = node->right = new_variable(ctx, name);
-        } else if(rel == -1) {
-            var = node->left = new_variable(ctx, name);
-        } else {
-            assert(0);
-        }
-    }
+    int nlen = strlen(name);
+    unsigned int hash = coyaml_hash(name, nlen);
+    coyaml_variable_t *var = find_value(ctx, name, nlen, hash);
+    ctx->variable_epoch += 1;
+    if(var) return var; // redefinition replaces the value
+    reserve_variables(ctx, ctx->variable_count + 1);
+    var = obstack_alloc(&ctx->pieces, sizeof(coyaml_variable_t) + nlen + 1);
+    var->name = ((char *)var) + sizeof(coyaml_variable_t);
+    var->name_len = nlen;
+    memcpy(var->name, name, nlen);
+    var->name[nlen] = 0;
+    var->hash = hash;
+    var->next = ctx->variables;
+    ctx->variables = var;
+    coyaml_variable_t **bucket = &ctx->variable_table[
+        COYAML_HASH_BUCKET(hash, ctx->variable_table_size)];
+    var->hash_next = *bucket;
+    *bucket = var;
+    ctx->variable_count += 1;
     return var;
 }
 
@@ -79,12 +78,28 @@ int coyaml_set_integer(coyaml_context_t *ctx, char *name, long value) {
     return 0;
 }
 
-int coyaml_get_string(coyaml_context_t *ctx, char *name,
+int coyaml_set_vars(coyaml_context_t *ctx, char **name_value_pairs) {
+    int count = 0;
+    for(char **pair = name_value_pairs; *pair; pair += 2) {
+        if(!pair[1]) {
+            errno = EINVAL;
+            return -1;
+        }
+        ++count;
+    }
+    reserve_variables(ctx, ctx->variable_count + count);
+    for(char **pair = name_value_pairs; *pair; pair += 2) {
+        if(coyaml_set_string(ctx, pair[0], pair[1], strlen(pair[1])) < 0)
+            return -1;
+    }
+    return 0;
+}
+
+int coyaml_get_string(coyaml_context_t *ctx, char *name, int nlen,
     char **data, int *dlen) {
-    coyaml_variable_t *var;
-    if(!ctx->variables) return -1;
-    int val = find_value(ctx->variables, name, &var);
-    if(!val) {
+    coyaml_variable_t *var = find_value(ctx, name, nlen,
+        coyaml_hash(name, nlen));
+    if(var) {
         switch(var->type) {
             case COYAML_VAR_STRING:
                 *data = var->data.string.value;
@@ -9,8 +9,9 @@ typedef enum coyaml_vartype_enum {
 } coyaml_vartype_t;
 
 typedef struct coyaml_variable_s {
-    struct coyaml_variable_s *left;
-    struct coyaml_variable_s *right;
+    struct coyaml_variable_s *next; // list of all variables in context
+    struct coyaml_variable_s *hash_next; // next in the same bucket
+    unsigned int hash;
     char *name;
     int name_len;
     coyaml_vartype_t type;
@@ -28,5 +29,6 @@ typedef struct coyaml_variable_s {
     } data;
 } coyaml_variable_t;
 
-int coyaml_get_string(coyaml_context_t *ctx, char*name, char **data, int *dlen);
+int coyaml_get_string(coyaml_context_t *ctx, char *name, int nlen,
+    char **data, int *dlen);
 #endif //_H_VARS
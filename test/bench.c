@@ -0,0 +1,46 @@
+#define _GNU_SOURCE
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+
+#include <coyaml_src.h>
+#include BENCH_HEADER
+
+cfg_main_t config;
+
+static double now() {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+int main(int argc, char **argv) {
+    if(argc < 2) {
+        fprintf(stderr, "Usage: %s config.yaml [iterations]\n", argv[0]);
+        return 1;
+    }
+    int iterations = argc > 2 ? atoi(argv[2]) : 10;
+    double total = 0;
+    for(int i = 0; i < iterations; ++i) {
+        coyaml_context_t ctx;
+        if(!cfg_context(&ctx, &config)) {
+            perror(argv[0]);
+            return 1;
+        }
+        ctx.root_filename = argv[1];
+        // Only the first iteration parses the config when it's set
+        ctx.snapshot_filename = getenv("BENCH_SNAPSHOT");
+        double start = now();
+        int res = coyaml_readfile(&ctx);
+        total += now() - start;
+        coyaml_context_free(&ctx);
+        cfg_free(&config);
+        if(res < 0) {
+            fprintf(stderr, "Error parsing ``%s''\n", argv[1]);
+            return 1;
+        }
+    }
+    printf("%s: %d iterations, %.3f ms per parse\n",
+        argv[1], iterations, total * 1000 / iterations);
+    return 0;
+}
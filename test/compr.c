@@ -1,4 +1,9 @@
 #include <stdio.h>
+#include <stdlib.h>
+#include <errno.h>
+#include <stdint.h>
+#include <unistd.h>
+#include <poll.h>
 
 #include <coyaml_src.h> // needed for convert function
 #include "comprehensive.h"
@@ -85,7 +90,93 @@ int convert_listenaddr(coyaml_parseinfo_t *info, char *value,
     return 0;
 }
 
+static void print_config(cfg_main_t *cfg) {
+    printf("TAG: %d\n", cfg->SimpleHTTPServer.intvalue.tag);
+    CFG_STRING_LOOP(item, cfg->SimpleHTTPServer.directory_indexes) {
+        printf("INDEX: \"%s\"\n", item->value);
+    }
+    CFG_STRING_STRING_LOOP(item, cfg->SimpleHTTPServer.extra_headers) {
+        printf("HEADER: \"%s\": \"%s\"\n", item->key, item->value);
+    }
+    const char *lookup[] = {"X-Var", "X-Cli", "X-Missing", NULL};
+    for(const char **key = lookup; *key; ++key) {
+        cfg_m_string_string_t *item = cfg_m_string_string_find(
+            cfg->SimpleHTTPServer.extra_headers_index, *key, strlen(*key));
+        printf("FIND: \"%s\": \"%s\"\n", *key, item ? item->value : "");
+    }
+    for(size_t i = 0; i < cfg->SimpleHTTPServer.upstreams_len; ++i) {
+        cfg_connectaddr_t *addr = &cfg->SimpleHTTPServer.upstreams[i];
+        printf("UPSTREAM: \"%s\" %ld \"%s\"\n",
+            addr->host, addr->port, addr->unix_socket);
+    }
+    for(size_t i = 0; i < cfg->SimpleHTTPServer.weights_len; ++i) {
+        printf("WEIGHT: %.1f\n", cfg->SimpleHTTPServer.weights[i]);
+    }
+    for(size_t i = 0; i < cfg->SimpleHTTPServer.aliases_len; ++i) {
+        printf("ALIAS: \"%s\"\n", cfg->SimpleHTTPServer.aliases[i].value);
+    }
+}
+
+static int reload(int argc, char **argv) {
+    coyaml_holder_t holder = {0};
+    // Second reload replaces the first config, which is freed then
+    for(int i = 0; i < 2; ++i) {
+        coyaml_context_t *ctx = cfg_context(NULL, NULL);
+        if(!ctx) {
+            perror(argv[0]);
+            return 1;
+        }
+        coyaml_set_string(ctx, "hello", "example", strlen("example"));
+        coyaml_set_integer(ctx, "intvar", 123);
+        if(coyaml_reload(&holder, ctx, argc, argv) < 0) {
+            return 1;
+        }
+    }
+    cfg_main_t *cfg = cfg_acquire(&holder);
+    coyaml_publish(&holder, NULL);
+    print_config(cfg); // still valid, as it's not released yet
+    cfg_release(cfg);
+    return 0;
+}
+
+static int read_buffer(coyaml_context_t *ctx) {
+    FILE *file = fopen(ctx->root_filename, "r");
+    if(!file) return -1;
+    char *data = NULL;
+    size_t len = 0;
+    size_t alloc = 0;
+    while(!feof(file)) {
+        if(len == alloc) {
+            alloc = alloc ? alloc * 2 : 4096;
+            data = realloc(data, alloc);
+        }
+        len += fread(data + len, 1, alloc - len, file);
+        if(ferror(file)) break;
+    }
+    fclose(file);
+    int res = coyaml_readbuffer(ctx, data, len, ctx->root_filename);
+    free(data);
+    return res;
+}
+
+static int read_async(coyaml_context_t *ctx) {
+    int fd = coyaml_readfile_async(ctx, NULL, NULL);
+    if(fd < 0) return -1;
+    // Something useful could be done here, while config is being parsed
+    struct pollfd pfd = { .fd = fd, .events = POLLIN };
+    while(poll(&pfd, 1, -1) < 0 && errno == EINTR);
+    uint64_t done;
+    int res = read(fd, &done, sizeof(done));
+    close(fd);
+    if(res < 0) return -1;
+    errno = ctx->error.code;
+    return ctx->error.code ? -1 : 0;
+}
+
 int main(int argc, char **argv) {
+    if(getenv("COMPR_RELOAD")) {
+        return reload(argc, argv);
+    }
     coyaml_context_t *ctx = cfg_context(NULL, &config);
     if(!ctx) {
         perror(argv[0]);
@@ -94,16 +185,33 @@ int main(int argc, char **argv) {
     coyaml_cli_prepare_or_exit(ctx, argc, argv);
     coyaml_set_string(ctx, "hello", "example", strlen("example"));
     coyaml_set_integer(ctx, "intvar", 123);
-    coyaml_readfile_or_exit(ctx);
+    if(getenv("COMPR_SNAPSHOT")) {
+        ctx->snapshot_filename = getenv("COMPR_SNAPSHOT");
+    }
+    if(getenv("COMPR_MAP_BLOBS")) {
+        ctx->map_blobs = TRUE;
+    }
+    if(getenv("COMPR_BUFFER")) {
+        // Same as coyaml_readfile but config is read by application
+        if(read_buffer(ctx) < 0) {
+            if(errno > ECOYAML_MAX || errno < ECOYAML_MIN) {
+                perror(argv[0]);
+            }
+            return 1;
+        }
+    } else if(getenv("COMPR_ASYNC")) {
+        if(read_async(ctx) < 0) {
+            if(errno > ECOYAML_MAX || errno < ECOYAML_MIN) {
+                perror(argv[0]);
+            }
+            return 1;
+        }
+    } else {
+        coyaml_readfile_or_exit(ctx);
+    }
     coyaml_env_parse_or_exit(ctx);
     coyaml_cli_parse_or_exit(ctx, argc, argv);
     coyaml_context_free(ctx);
-    printf("TAG: %d\n", config.SimpleHTTPServer.intvalue.tag);
-    CFG_STRING_LOOP(item, config.SimpleHTTPServer.directory_indexes) {
-        printf("INDEX: \"%s\"\n", item->value);
-    }
-    CFG_STRING_STRING_LOOP(item, config.SimpleHTTPServer.extra_headers) {
-        printf("HEADER: \"%s\": \"%s\"\n", item->key, item->value);
-    }
+    print_config(&config);
     cfg_free(&config);
 }
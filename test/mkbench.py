@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Generates synthetic schemas and configs for the `./waf bench` suite"""
+
+import sys
+from optparse import OptionParser
+
+META = """\
+__meta__:
+  program-name: bench
+  default-config: /dev/null
+  description: Synthetic benchmark configuration
+
+"""
+
+def wide_schema(out, width):
+    out.write(META)
+    out.write("Wide:\n")
+    for i in range(width):
+        out.write("  key{0:05d}: !Int 0\n".format(i))
+
+def wide_config(out, width):
+    out.write("Wide:\n")
+    # reverse order so that every key is looked up from the scratch
+    for i in reversed(range(width)):
+        out.write("  key{0:05d}: {0}\n".format(i))
+
+def anchors_schema(out, count):
+    out.write(META)
+    out.write("Anchors:\n")
+    out.write("  values: !Array\n")
+    out.write("    element: !Int 0\n")
+
+def anchors_config(out, count):
+    out.write("_anchors:\n")
+    for i in range(count):
+        out.write("  - &a{0:05d} {0}\n".format(i))
+    out.write("Anchors:\n")
+    out.write("  values:\n")
+    # latest anchors are the slowest ones to find in a list
+    for i in reversed(range(count)):
+        out.write("  - *a{0:05d}\n".format(i))
+
+def sorted_schema(out, count):
+    out.write(META)
+    out.write("Sorted:\n")
+    out.write("  entries: !Mapping\n")
+    out.write("    key-element: !String \"\"\n")
+    out.write("    value-element: !Int 0\n")
+
+def sorted_config(out, count):
+    out.write("Sorted:\n")
+    out.write("  entries:\n")
+    # sorted keys make unbalanced search trees degrade into lists
+    for i in range(count):
+        out.write("    key{0:06d}: {0}\n".format(i))
+
+def scalars_schema(out, count):
+    out.write(META)
+    out.write("Scalars:\n")
+    out.write("  ints: !Array\n")
+    out.write("    element: !Int 0\n")
+    out.write("  floats: !Array\n")
+    out.write("    element: !Float 0\n")
+    out.write("  strings: !Array\n")
+    out.write("    element: !String\n")
+
+def scalars_config(out, count):
+    out.write("_vars:\n")
+    out.write("  - &base /var/lib/bench\n")
+    out.write("  - &size 16\n")
+    out.write("Scalars:\n")
+    # mostly plain literals, with repeated expressions in between
+    out.write("  ints:\n")
+    for i in range(0, count, 3):
+        if i % 10 == 0:
+            out.write("  - ${size*4}ki\n")
+        else:
+            out.write("  - {0}M\n".format(i))
+    out.write("  floats:\n")
+    for i in range(1, count, 3):
+        out.write("  - {0}.5\n".format(i))
+    out.write("  strings:\n")
+    for i in range(2, count, 3):
+        if i % 10 == 2:
+            out.write("  - $base/data/files\n")
+        else:
+            out.write("  - \"value {0}\"\n".format(i))
+
+def chain_schema(out, depth):
+    out.write(META)
+    out.write("__types__:\n")
+    out.write("  node:\n")
+    out.write("    weight: !Int\n")
+    out.write("      =: 0\n")
+    out.write("      inheritance: yes\n")
+    out.write("    items: !Array\n")
+    out.write("      element: !Int 0\n")
+    out.write("      inheritance: append-default\n")
+    out.write("    children: !Mapping\n")
+    out.write("      key-element: !String ~\n")
+    out.write("      value-element: !Struct node\n")
+    out.write("      inheritance: no\n")
+    out.write("    __inheritance__:\n")
+    out.write("      key: chain\n")
+    out.write("Chain: !Struct node\n")
+
+def chain_config(out, depth):
+    # every node inherits items of all its ancestors, the root has a long
+    # array and every descendant appends a couple of its own
+    out.write("Chain:\n")
+    out.write("  weight: 1\n")
+    out.write("  items:\n")
+    for i in range(10000):
+        out.write("  - {0}\n".format(i))
+    for i in range(depth - 1):
+        indent = " " * (2 * i + 2)
+        out.write("{0}children:\n{0} n{1}:\n".format(indent, i))
+        out.write("{0}  items: [{1}, {1}]\n".format(indent, i))
+
+generators = {
+    'wide': (wide_schema, wide_config),
+    'anchors': (anchors_schema, anchors_config),
+    'sorted': (sorted_schema, sorted_config),
+    'scalars': (scalars_schema, scalars_config),
+    'chain': (chain_schema, chain_config),
+    }
+
+def main():
+    op = OptionParser(usage="\n    %prog {schema|config} KIND SIZE")
+    options, args = op.parse_args()
+    if len(args) != 3 or args[0] not in ('schema', 'config') \
+        or args[1] not in generators:
+        op.error("Wrong arguments")
+    schema, config = generators[args[1]]
+    fun = schema if args[0] == 'schema' else config
+    fun(sys.stdout, int(args[2]))
+
+if __name__ == '__main__':
+    main()
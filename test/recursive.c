@@ -1,10 +1,191 @@
+#include <pthread.h>
+#include <sched.h>
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <errno.h>
 
 #include "recconfig.h"
 
+#define ITERATIONS 50
+#define READERS 2
+#define ASYNC_LOADS 8
+
 cfg_main_t config;
 
+static char *filename;
+static unsigned long expected;
+static coyaml_holder_t holder;
+static int reloading = 1;
+static int pending;
+static long async_failures;
+static char *async_argv[ASYNC_LOADS][4];
+
+static const char broken[] =
+    "Logging:\n"
+    "  level: 1\n"
+    "  unknown: 2\n";
+
+static unsigned long fingerprint(cfg_Logger_t *log) {
+    unsigned long res = log->level;
+    res = res*31 + log->propagate;
+    res = res*31 + log->handlers_len;
+    res = res*31 + log->inheritedlist_len;
+    res = res*31 + log->noninheritedlist_len;
+    res = res*31 + log->levels_len;
+    for(cfg_m_string_Logger_t *child = log->children; child;
+        child = child->head.next) {
+        res = res*31 + child->key_len;
+        res = res*31 + fingerprint(&child->value);
+    }
+    return res;
+}
+
+static int load_good(char *program) {
+    char *argv[] = { program, "-c", filename, NULL };
+    coyaml_error_t err;
+    cfg_main_t *cfg = cfg_load_r(NULL, 3, argv, &err);
+    if(!cfg) {
+        fprintf(stderr, "Error %d at %s:%ld: %s\n",
+            err.code, err.filename, err.line, err.message);
+        return -1;
+    }
+    int res = fingerprint(&cfg->Logging) == expected ? 0 : -1;
+    cfg_free(cfg);
+    return res;
+}
+
+static int load_missing(char *program) {
+    char *argv[] = { program, "-c", "/nonexistent/recconfig.yaml", NULL };
+    coyaml_error_t err;
+    cfg_main_t *cfg = cfg_load_r(NULL, 3, argv, &err);
+    if(cfg) {
+        cfg_free(cfg);
+        return -1;
+    }
+    return err.code == ENOENT ? 0 : -1;
+}
+
+static int load_broken() {
+    coyaml_context_t ctx;
+    if(!cfg_context(&ctx, NULL)) {
+        return -1;
+    }
+    ctx.quiet = TRUE;
+    int res = -1;
+    if(coyaml_readbuffer(&ctx, broken, strlen(broken), "broken.yaml") < 0
+        && ctx.error.code == ECOYAML_SYNTAX_ERROR && ctx.error.line == 3
+        && !strcmp(ctx.error.filename, "broken.yaml")) {
+        res = 0;
+    }
+    cfg_free((cfg_main_t *)ctx.target);
+    coyaml_context_free(&ctx);
+    return res;
+}
+
+static void *parser(void *program) {
+    long failures = 0;
+    for(int i = 0; i < ITERATIONS; ++i) {
+        failures += load_good(program) < 0;
+        failures += load_missing(program) < 0;
+        failures += load_broken() < 0;
+    }
+    return (void *)failures;
+}
+
+static void *reader(void *arg) {
+    long failures = 0;
+    while(__atomic_load_n(&reloading, __ATOMIC_ACQUIRE)) {
+        cfg_main_t *cfg = cfg_acquire(&holder);
+        failures += fingerprint(&cfg->Logging) != expected;
+        cfg_release(cfg);
+    }
+    return (void *)failures;
+}
+
+static void loaded(void *cfg, coyaml_error_t *err, void *userdata) {
+    if(!cfg || fingerprint(&((cfg_main_t *)cfg)->Logging) != expected) {
+        __atomic_add_fetch(&async_failures, 1, __ATOMIC_SEQ_CST);
+    }
+    if(cfg) {
+        cfg_free(cfg);
+    }
+    __atomic_sub_fetch(&pending, 1, __ATOMIC_RELEASE);
+}
+
+// Parses configs in many threads and asynchronously, while main thread
+// reloads the config published for readers. Config file must be the last
+// argument
+static int threadtest(int argc, char **argv, int nthreads) {
+    expected = fingerprint(&config.Logging);
+    filename = argv[argc-1];
+    if(cfg_reload(&holder, argc, argv) < 0) {
+        return 1;
+    }
+    pthread_t threads[nthreads + READERS];
+    for(int i = 0; i < nthreads; ++i) {
+        pthread_create(&threads[i], NULL, parser, argv[0]);
+    }
+    for(int i = nthreads; i < nthreads + READERS; ++i) {
+        pthread_create(&threads[i], NULL, reader, NULL);
+    }
+    long failures = 0;
+    for(int i = 0; i < ASYNC_LOADS; ++i) {
+        char **aargv = async_argv[i];
+        aargv[0] = argv[0];
+        aargv[1] = "-c";
+        aargv[2] = filename;
+        __atomic_add_fetch(&pending, 1, __ATOMIC_SEQ_CST);
+        if(cfg_load_async(NULL, 3, aargv, loaded, NULL) < 0) {
+            __atomic_sub_fetch(&pending, 1, __ATOMIC_SEQ_CST);
+            failures += 1;
+        }
+    }
+    for(int i = 0; i < ITERATIONS; ++i) {
+        failures += cfg_reload(&holder, argc, argv) < 0;
+    }
+    for(int i = 0; i < nthreads + READERS; ++i) {
+        if(i == nthreads) {
+            __atomic_store_n(&reloading, 0, __ATOMIC_RELEASE);
+        }
+        void *res;
+        pthread_join(threads[i], &res);
+        failures += (long)res;
+    }
+    while(__atomic_load_n(&pending, __ATOMIC_ACQUIRE)) {
+        sched_yield();
+    }
+    failures += async_failures;
+    coyaml_publish(&holder, NULL);
+    printf("%d threads parsed %d configs each, %d loaded asynchronously, "
+        "%ld failures\n", nthreads, ITERATIONS*3, ASYNC_LOADS, failures);
+    return failures != 0;
+}
+
+// Elements appended by inheritance must be found by index too
+static int check_inherited(cfg_main_t *cfg) {
+    static const char *keys[] = { "service", "host", "env" };
+    cfg_m_string_Logger_t *game = cfg_m_string_Logger_find(
+        cfg->Logging.children_index, "game", 4);
+    if(!game) {
+        return -1;
+    }
+    for(int i = 0; i < 3; ++i) {
+        if(!cfg_m_string_string_find(game->value.tags_index,
+            keys[i], strlen(keys[i]))) {
+            fprintf(stderr, "Inherited tag ``%s'' not found\n", keys[i]);
+            return -1;
+        }
+    }
+    return 0;
+}
+
 int main(int argc, char **argv) {
     cfg_load(&config, argc, argv);
+    int res = check_inherited(&config) < 0;
+    if(getenv("RECURSIVE_THREADS")) {
+        res |= threadtest(argc, argv, atoi(getenv("RECURSIVE_THREADS")));
+    }
     cfg_free(&config);
+    return res;
 }